@@ -0,0 +1,81 @@
+import argparse
+import random as rand
+import time
+
+from oram.client.path_oram import TREE_ENGINES, PathORAM
+from oram.client.rng import RandomSource
+from oram.simulation.histogram import StashHistogram
+
+
+class CountingBucketTree:
+    # forwards to a tree engine, counting the buckets read and written
+
+    def __init__(self, bucket_tree):
+        self.bucket_tree = bucket_tree
+        self.height = bucket_tree.height
+        self.buckets_read = 0
+        self.buckets_written = 0
+        self.blocks_written = 0
+
+    def read_path(self, leaf_id, top_level=0):
+        self.buckets_read += self.height - top_level + 1
+        return self.bucket_tree.read_path(leaf_id, top_level)
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        self.buckets_written += len(buckets)
+        self.blocks_written += sum(len(blocks) for blocks in buckets)
+        return self.bucket_tree.write_path(leaf_id, buckets, top_level)
+
+
+def run_batches(n_block_number, z_bucket_size, batch_size, access_number, tree_engine="flat", seed=0):
+    rand.seed(seed)
+    bucket_tree = CountingBucketTree(TREE_ENGINES[tree_engine](n_block_number, z_bucket_size))
+    path_oram = PathORAM(n_block_number, z_bucket_size, tree_engine=bucket_tree, rng=RandomSource(seed))
+    # warm-up with single accesses, every block written once
+    for block_id in range(n_block_number):
+        path_oram.access(block_id, isWrite=True, new_data=block_id)
+    bucket_tree.buckets_read = bucket_tree.buckets_written = 0
+
+    path_oram.collector = StashHistogram()
+    block_ids = [rand.randrange(n_block_number) for _ in range(access_number)]
+    # the stash holds every block of the batch until the eviction: its largest size is the stash
+    # after the batch plus the blocks the eviction wrote back
+    peak_stash_size = 0
+    start = time.perf_counter()
+    for first in range(0, access_number, batch_size):
+        batch = block_ids[first:first + batch_size]
+        bucket_tree.blocks_written = 0
+        if batch_size == 1:
+            path_oram.access(batch[0])
+        else:
+            path_oram.access_many(batch)
+        peak_stash_size = max(peak_stash_size, len(path_oram.stash) + bucket_tree.blocks_written)
+    elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "buckets_per_access": (bucket_tree.buckets_read + bucket_tree.buckets_written) / access_number,
+        "ops_per_sec": access_number / elapsed,
+        "mean_stash_size": path_oram.collector.mean(),
+        "max_stash_size": path_oram.collector.max_stash_size,
+        "peak_stash_size": peak_stash_size,
+        "height": path_oram.l_tree_height,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Buckets transferred by access_many against sequential accesses")
+    parser.add_argument("--blocks", type=int, default=pow(2, 14))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[pow(2, i) for i in range(11)])
+    parser.add_argument("--accesses", type=int, default=20_480)
+    parser.add_argument("--engine", default="flat")
+    args = parser.parse_args()
+
+    # stash sizes are measured after each batch, the peak is the largest stash during a batch
+    print(f"{'batch':>5} {'buckets/access':>14} {'saving':>7} {'ops/s':>9} {'mean stash':>10} {'max stash':>9} {'peak stash':>10}")
+    for batch_size in args.batch_sizes:
+        row = run_batches(args.blocks, args.bucket_size, batch_size, args.accesses, args.engine)
+        # a single access reads and writes the L buckets below the root
+        sequential = 2 * row["height"]
+        print(f"{batch_size:>5} {row['buckets_per_access']:>14.2f} {1 - row['buckets_per_access'] / sequential:>6.1%} "
+              f"{row['ops_per_sec']:>9.1f} {row['mean_stash_size']:>10.2f} {row['max_stash_size']:>9} {row['peak_stash_size']:>10}")
@@ -0,0 +1,66 @@
+import argparse
+import time
+import tracemalloc
+from typing import Set
+
+from oram.server.block import Block, PayloadBuffer
+from oram.server.bucket_tree import BucketTree
+
+
+class DictBlock:
+    # the block layout before __slots__, kept to measure against: a __dict__ per instance, a fresh
+    # data list per dummy and every id recorded in a class-wide set
+    used_ids : Set[int] = set()
+
+    def __init__(self, is_dummy=True, data=None, block_id=None, leaf_id=None):
+        self.is_dummy = is_dummy
+        self.data = [] if is_dummy else data
+        self.block_id = -1 if is_dummy else block_id
+        self.leaf_id = -1 if is_dummy else leaf_id
+        if not is_dummy:
+            DictBlock.used_ids.add(block_id)
+
+
+def measure(build):
+    # seconds and bytes allocated by build(), and its result kept alive until measured
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return elapsed, memory
+
+
+def block_report(count, payload_size):
+    payload = bytes(payload_size)
+    rows = {
+        "dict block": measure(lambda: [DictBlock(is_dummy=False, block_id=i, leaf_id=i) for i in range(count)]),
+        "slotted block": measure(lambda: [Block(is_dummy=False, block_id=i, leaf_id=i) for i in range(count)]),
+        # a payload per block: separate bytes objects against slices of one buffer
+        "bytes payloads": measure(lambda: [payload[:-1] + b"\1" for _ in range(count)]),
+        "payload buffer": measure(lambda: PayloadBuffer(count, payload_size)),
+    }
+    DictBlock.used_ids.clear()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes per block and tree construction time of the object engine")
+    parser.add_argument("--blocks", type=int, default=pow(2, 17))
+    parser.add_argument("--payload-size", type=int, default=64)
+    parser.add_argument("--exponents", type=int, nargs="+", default=[12, 14, 16, 18])
+    parser.add_argument("--bucket-size", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{args.blocks} blocks, payloads of {args.payload_size} bytes")
+    for name, (elapsed, memory) in block_report(args.blocks, args.payload_size).items():
+        print(f"{name:>15}: {memory / args.blocks:7.1f} bytes per block, {elapsed / args.blocks * 1e9:7.1f} ns per block")
+
+    print(f"{'N':>6} {'payloads':>8} {'build s':>8} {'MiB':>8} {'bytes/slot':>10}")
+    for exponent in args.exponents:
+        slots = (pow(2, exponent + 1) - 1) * args.bucket_size
+        for payload_size in (None, args.payload_size):
+            elapsed, memory = measure(lambda: BucketTree(pow(2, exponent), args.bucket_size, payload_size=payload_size))
+            print(f"2^{exponent:<4} {payload_size or '-':>8} {elapsed:>8.3f} {memory / pow(2, 20):>8.1f} {memory / slots:>10.1f}")
@@ -0,0 +1,46 @@
+import argparse
+import json
+import sys
+
+from oram.benchmarks.suite import BenchmarkCase
+
+
+def load_results(filename):
+    with open(filename) as f:
+        report = json.load(f)
+    return report["environment"], {BenchmarkCase(*(result[field] for field in BenchmarkCase._fields)): result
+                                   for result in report["results"]}
+
+
+def compare(baseline, candidate, threshold):
+    # one row per case present in both runs, ratio > 1 means the candidate is faster
+    rows = []
+    for case, result in candidate.items():
+        if case not in baseline:
+            continue
+        ratio = result["ops_per_sec"] / baseline[case]["ops_per_sec"]
+        rows.append((case, baseline[case], result, ratio, ratio < 1 - threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    baseline_environment, baseline = load_results(args.baseline)
+    candidate_environment, candidate = load_results(args.candidate)
+    print(f"Baseline:  {baseline_environment['commit']} ({baseline_environment['timestamp']})")
+    print(f"Candidate: {candidate_environment['commit']} ({candidate_environment['timestamp']})")
+
+    rows = compare(baseline, candidate, args.threshold)
+    for case, old, new, ratio, regression in rows:
+        print(f"{case.benchmark:>20} N={case.n_block_number:<8} Z={case.z_bucket_size or '-'} {case.variant:>7}: "
+              f"{old['ops_per_sec']:>12.1f} -> {new['ops_per_sec']:>12.1f} ops/s ({ratio:5.2f}x)  "
+              f"p99 {old['p99_us']:>9.1f} -> {new['p99_us']:>9.1f} us"
+              f"{'  REGRESSION' if regression else ''}")
+    regressions = sum(regression for *_, regression in rows)
+    print(f"{len(rows)} cases compared, {regressions} regressions")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,85 @@
+import argparse
+import random as rand
+import time
+from typing import List
+
+import numpy as np
+
+from oram.client.path_oram import PathORAM
+from oram.client.remote_bucket_tree import RemoteBucketTree
+from oram.client.rng import RandomSource
+from oram.server.remote_server import start_server_process
+
+TRANSPORTS = ("local", "remote", "pipelined", "batched")
+
+
+def run_transport(transport, n_block_number, z_bucket_size, accesses, batch_size, address, seed=0):
+    if transport == "local":
+        path_oram = PathORAM(n_block_number, z_bucket_size, tree_engine="flat", rng=RandomSource(seed))
+    else:
+        remote_tree = RemoteBucketTree(address, pipelined=transport != "remote")
+        path_oram = PathORAM(n_block_number, z_bucket_size, tree_engine=remote_tree, rng=RandomSource(seed))
+
+    block_ids = [rand.randrange(n_block_number) for _ in range(accesses)]
+    latencies : List[float] = []
+    step = batch_size if transport == "batched" else 1
+    start = time.perf_counter()
+    for first in range(0, accesses, step):
+        access_start = time.perf_counter_ns()
+        if transport == "batched":
+            # access_many reads and writes the paths of a batch in one request each way
+            batch = block_ids[first:first + step]
+            path_oram.access_many(batch, [True] * len(batch),
+                                  [i.to_bytes(8, "little") for i in range(first, first + len(batch))])
+        else:
+            path_oram.access(block_ids[first], isWrite=True, new_data=first.to_bytes(8, "little"))
+        # the latency of each logical access of a batch is the latency of the batch
+        latencies.extend([time.perf_counter_ns() - access_start] * len(block_ids[first:first + step]))
+    if transport != "local":
+        remote_tree.flush()
+    elapsed = time.perf_counter() - start
+
+    latencies_us = np.asarray(latencies) / 1e3
+    row = {
+        "transport": transport,
+        "ops_per_sec": accesses / elapsed,
+        "mean_us": float(latencies_us.mean()),
+        "p50_us": float(np.percentile(latencies_us, 50)),
+        "p99_us": float(np.percentile(latencies_us, 99)),
+        "round_trips": 0.0,
+        "bytes": 0.0,
+    }
+    if transport != "local":
+        stats = remote_tree.network_stats()
+        row["round_trips"] = stats["round_trips"] / accesses
+        row["bytes"] = (stats["bytes_sent"] + stats["bytes_received"]) / accesses
+        remote_tree.close()
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round trips, bytes on the wire and latency per access over localhost")
+    parser.add_argument("--blocks", type=int, default=pow(2, 12))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--accesses", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--transports", nargs="+", default=list(TRANSPORTS), choices=TRANSPORTS)
+    parser.add_argument("--unix-socket", default=None, help="use this Unix socket instead of TCP on localhost")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"N={args.blocks}, Z={args.bucket_size}, {args.accesses} accesses, batches of {args.batch_size}")
+    print(f"{'transport':>10} {'ops/s':>10} {'mean us':>10} {'p50 us':>10} {'p99 us':>10} "
+          f"{'round trips':>11} {'bytes':>10}")
+    for transport in args.transports:
+        rand.seed(args.seed)
+        # a fresh server per transport, so every run starts from an empty tree
+        process, address = start_server_process(args.blocks, args.bucket_size, address=args.unix_socket or ("127.0.0.1", 0))
+        try:
+            row = run_transport(transport, args.blocks, args.bucket_size, args.accesses, args.batch_size, address,
+                                args.seed)
+        finally:
+            process.terminate()
+            process.join()
+        print(f"{row['transport']:>10} {row['ops_per_sec']:>10.1f} {row['mean_us']:>10.1f} {row['p50_us']:>10.1f} "
+              f"{row['p99_us']:>10.1f} {row['round_trips']:>11.2f} {row['bytes']:>10.0f}")
@@ -0,0 +1,196 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import random as rand
+import resource
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple
+
+import numpy as np
+
+from oram.client.path_oram import EVICTIONS, POSITION_MAPS, TREE_ENGINES, PathORAM
+from oram.client.rng import RandomSource
+
+
+class BenchmarkCase(NamedTuple):
+    benchmark: str
+    n_block_number: int
+    # None for the benchmarks that do not depend on the bucket size
+    z_bucket_size: int | None
+    variant: str
+
+
+def seeded_source():
+    # a RandomSource seeded from the global generator, which run_case seeds for every case
+    return RandomSource(rand.getrandbits(64))
+
+
+def warmed_up_oram(n_block_number, z_bucket_size, warmup_access_number, **kwargs):
+    path_oram = PathORAM(n_block_number, z_bucket_size, rng=seeded_source(), **kwargs)
+    for i in range(warmup_access_number):
+        path_oram.access(i % n_block_number, isWrite=True, new_data=i)
+    return path_oram
+
+
+def bench_access(case, operations, warmup_access_number, isWrite):
+    path_oram = warmed_up_oram(case.n_block_number, case.z_bucket_size, warmup_access_number, tree_engine=case.variant)
+    latencies : List[int] = []
+    for i in range(operations):
+        block_id = rand.randrange(case.n_block_number)
+        start = time.perf_counter_ns()
+        path_oram.access(block_id, isWrite=isWrite, new_data=i)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def bench_access_read(case, operations, warmup_access_number):
+    return bench_access(case, operations, warmup_access_number, isWrite=False)
+
+
+def bench_access_write(case, operations, warmup_access_number):
+    return bench_access(case, operations, warmup_access_number, isWrite=True)
+
+
+def bench_tree_construction(case, operations, warmup_access_number):
+    latencies : List[int] = []
+    for _ in range(operations):
+        start = time.perf_counter_ns()
+        TREE_ENGINES[case.variant](case.n_block_number, case.z_bucket_size)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def bench_position_map_init(case, operations, warmup_access_number):
+    latencies : List[int] = []
+    for _ in range(operations):
+        start = time.perf_counter_ns()
+        POSITION_MAPS[case.variant](case.n_block_number, rng=seeded_source())
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def bench_position_map_remap(case, operations, warmup_access_number):
+    position_map = POSITION_MAPS[case.variant](case.n_block_number, rng=seeded_source())
+    block_ids = [rand.randrange(case.n_block_number) for _ in range(operations)]
+    latencies : List[int] = []
+    for block_id in block_ids:
+        start = time.perf_counter_ns()
+        position_map.remap(block_id)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def bench_eviction(case, operations, warmup_access_number):
+    # the steps of PathORAM.access, timing only the choice of the blocks written back
+    path_oram = warmed_up_oram(case.n_block_number, case.z_bucket_size, warmup_access_number, eviction=case.variant)
+    evict = EVICTIONS[case.variant]
+    latencies : List[int] = []
+    for _ in range(operations):
+        block_id = rand.randrange(case.n_block_number)
+        block_leaf_id, new_block_leaf_id = path_oram.position_map.remap(block_id)
+        for block in path_oram.bucket_tree.read_path(block_leaf_id, top_level=1):
+            path_oram.stash.add_block(block)
+        if block_id in path_oram.stash:
+            path_oram.stash.get(block_id).leaf_id = new_block_leaf_id
+        start = time.perf_counter_ns()
+        buckets = evict(path_oram.stash, block_leaf_id, path_oram.z_bucket_size, top_level=1)
+        latencies.append(time.perf_counter_ns() - start)
+        path_oram.bucket_tree.write_path(block_leaf_id, buckets, top_level=1)
+    return latencies
+
+
+# name -> (function, variants, depends on the bucket size)
+BENCHMARKS = {
+    "access_read": (bench_access_read, ("object", "flat"), True),
+    "access_write": (bench_access_write, ("object", "flat"), True),
+    "tree_construction": (bench_tree_construction, ("object", "flat"), True),
+    "position_map_init": (bench_position_map_init, tuple(POSITION_MAPS), False),
+    "position_map_remap": (bench_position_map_remap, tuple(POSITION_MAPS), False),
+    "eviction": (bench_eviction, tuple(EVICTIONS), True),
+}
+
+
+def build_cases(benchmarks, n_block_numbers, z_bucket_sizes, variants=None):
+    cases : List[BenchmarkCase] = []
+    for benchmark in benchmarks:
+        if benchmark not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark {benchmark}, expected one of {list(BENCHMARKS)}")
+        _, benchmark_variants, uses_bucket_size = BENCHMARKS[benchmark]
+        for n_block_number in n_block_numbers:
+            for z_bucket_size in (z_bucket_sizes if uses_bucket_size else [None]):
+                for variant in benchmark_variants:
+                    if variants is None or variant in variants:
+                        cases.append(BenchmarkCase(benchmark, n_block_number, z_bucket_size, variant))
+    return cases
+
+
+def run_case(case, operations, warmup_access_number, seed):
+    rand.seed(seed)
+    function = BENCHMARKS[case.benchmark][0]
+    # tree and map construction are too slow at large N to repeat as often as an access
+    if case.benchmark in ("tree_construction", "position_map_init"):
+        operations = max(1, min(operations, 5))
+    if warmup_access_number is None:
+        warmup_access_number = case.n_block_number
+    latencies = np.asarray(function(case, operations, warmup_access_number), dtype=np.float64)
+    return {
+        **case._asdict(),
+        "operations": len(latencies),
+        "ops_per_sec": len(latencies) / (latencies.sum() / 1e9),
+        "p50_us": float(np.percentile(latencies, 50)) / 1e3,
+        "p99_us": float(np.percentile(latencies, 99)) / 1e3,
+        # ru_maxrss is in KiB on Linux; each case runs in a fresh process, so this is its own peak
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_suite(cases, operations, warmup_access_number=None, seed=0):
+    results = []
+    # a fresh interpreter per case keeps the peak RSS and the allocator state of one case out of the next
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        for case in cases:
+            result = executor.submit(run_case, case, operations, warmup_access_number, seed).result()
+            print(f"{case.benchmark:>20} N=2^{case.n_block_number.bit_length() - 1:<2} Z={case.z_bucket_size or '-'} "
+                  f"{case.variant:>7}: {result['ops_per_sec']:>12.1f} ops/s  p50 {result['p50_us']:>10.1f} us  "
+                  f"p99 {result['p99_us']:>10.1f} us  RSS {result['peak_rss_kib'] / 1024:>8.1f} MiB")
+            results.append(result)
+    return {"environment": environment(), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Path ORAM benchmark suite")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--exponents", type=int, nargs="+", default=[10, 12, 14, 16, 18, 20],
+                        help="N = 2^exponent blocks")
+    parser.add_argument("--bucket-sizes", type=int, nargs="+", default=[2, 3, 4, 5])
+    parser.add_argument("--variants", nargs="+", default=None, help="only run these engines, maps or evictions")
+    parser.add_argument("--operations", type=int, default=2_000)
+    parser.add_argument("--warmup", type=int, default=None, help="warm-up writes, N when not given")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    cases = build_cases(args.benchmarks, [pow(2, exponent) for exponent in args.exponents],
+                        args.bucket_sizes, args.variants)
+    report = run_suite(cases, args.operations, args.warmup, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{len(report['results'])} results written to {args.output}")
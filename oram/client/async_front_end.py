@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import random as rand
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from oram.client.instrumentation import RingBuffer
+from oram.client.path_oram import PathORAM
+
+
+class Request:
+
+    def __init__(self, block_id, is_write, data, future):
+        self.block_id = block_id
+        self.is_write = is_write
+        self.data = data
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+
+
+class AsyncPathORAM:
+    # asyncio front end of a PathORAM. Requests wait in a bounded queue and are served in rounds:
+    # the requests of a round for the same block are merged into one physical access, and every
+    # round makes exactly round_size physical accesses, padded with dummy accesses, so the server
+    # only learns how many rounds ran. A round is a single PathORAM.access_many, run in a worker
+    # thread so the event loop keeps accepting and merging requests while its paths are read and written.
+
+    def __init__(self, path_oram : PathORAM, queue_size=1024, round_size=8, delay_history=65_536):
+        if round_size < 1:
+            raise ValueError("Round size must be at least 1")
+        self.path_oram = path_oram
+        self.round_size = round_size
+        self.queue : asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # the first request of the next round, taken from the queue when the current round was full
+        self.__carried : Request | None = None
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__scheduler = None
+        # set by close(), the scheduler stops when it takes the None put in the queue after the last request
+        self.__closed = False
+        self.__stopping = False
+
+        self.requests = 0
+        self.merged_requests = 0
+        self.rounds = 0
+        self.physical_accesses = 0
+        self.dummy_accesses = 0
+        # the queueing delays of the last delay_history requests, in seconds
+        self.queueing_delays = RingBuffer(delay_history, np.dtype([("delay", "<f8")]))
+
+    async def read(self, block_id):
+        return await self.__submit(block_id, False, None)
+
+    async def write(self, block_id, data):
+        await self.__submit(block_id, True, data)
+
+    async def __submit(self, block_id, is_write, data):
+        if self.__closed:
+            raise RuntimeError("Front end is closed")
+        if self.__scheduler is None:
+            self.__scheduler = asyncio.get_running_loop().create_task(self.__schedule())
+        future = asyncio.get_running_loop().create_future()
+        # waits while the queue is full
+        await self.queue.put(Request(block_id, is_write, data, future))
+        return await future
+
+    async def __next_round(self):
+        # requests grouped by block, at most round_size blocks, up to the None queued by close()
+        groups : Dict[int, List[Request]] = {}
+        request = self.__carried or await self.queue.get()
+        self.__carried = None
+        while True:
+            if request is None:
+                self.__stopping = True
+                break
+            if request.block_id not in groups and len(groups) == self.round_size:
+                self.__carried = request
+                break
+            groups.setdefault(request.block_id, []).append(request)
+            if self.queue.empty():
+                break
+            request = self.queue.get_nowait()
+        return groups
+
+    async def __schedule(self):
+        loop = asyncio.get_running_loop()
+        while not self.__stopping:
+            groups = await self.__next_round()
+            if not groups:
+                continue
+            started_at = time.perf_counter()
+            for requests in groups.values():
+                for request in requests:
+                    request.started_at = started_at
+                    self.queueing_delays.append(started_at - request.enqueued_at)
+            try:
+                results = await loop.run_in_executor(self.__executor, self.__run_round, groups)
+            except Exception as error:
+                for requests in groups.values():
+                    for request in requests:
+                        if not request.future.done():
+                            request.future.set_exception(error)
+                continue
+            for requests in groups.values():
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_result(results[request])
+
+    def __run_round(self, groups):
+        # one access per block, writing the last data written to it in the round; a group of reads is a
+        # plain read, which the server cannot tell from a write, and leaves a block never written absent.
+        # The round is padded to round_size accesses with repeats of its first block, which access_many
+        # turns into reads of random paths
+        block_ids = list(groups)
+        ops = [any(request.is_write for request in requests) for requests in groups.values()]
+        new_data = [next((request.data for request in reversed(requests) if request.is_write), None)
+                    for requests in groups.values()]
+        padding = self.round_size - len(groups)
+        read_blocks = self.path_oram.access_many(block_ids + [block_ids[0]] * padding, ops + [False] * padding,
+                                                 new_data + [None] * padding)
+        results = {}
+        for requests, block in zip(groups.values(), read_blocks):
+            self.requests += len(requests)
+            self.merged_requests += len(requests) - 1
+            # the requests for the block in arrival order: a read sees the writes queued before it
+            data = block.data if block is not None else None
+            for request in requests:
+                if request.is_write:
+                    data = request.data
+                    results[request] = None
+                else:
+                    results[request] = data
+        self.rounds += 1
+        self.physical_accesses += self.round_size
+        self.dummy_accesses += self.round_size - len(groups)
+        return results
+
+    async def close(self):
+        # serves every request queued so far, the round in flight included, then stops the scheduler.
+        # Requests that could not be served, e.g. submitted while closing, fail with a RuntimeError
+        self.__closed = True
+        if self.__scheduler is not None:
+            await self.queue.put(None)
+            await self.__scheduler
+        while not self.queue.empty():
+            request = self.queue.get_nowait()
+            if request is not None and not request.future.done():
+                request.future.set_exception(RuntimeError("Front end is closed"))
+        self.__executor.shutdown()
+
+    def stats(self):
+        delays_us = (self.queueing_delays.ordered()["delay"] if len(self.queueing_delays) else np.zeros(1)) * 1e6
+        return {
+            "requests": self.requests,
+            "merged_requests": self.merged_requests,
+            "rounds": self.rounds,
+            "physical_accesses": self.physical_accesses,
+            "dummy_accesses": self.dummy_accesses,
+            "mean_queueing_delay_us": float(delays_us.mean()),
+            "p99_queueing_delay_us": float(np.percentile(delays_us, 99)),
+        }
+
+
+async def generate_load(front_end, clients, requests_per_client, n_block_number, write_ratio=0.5, hot_blocks=None,
+                        seed=0):
+    # clients issuing requests back to back; with hot_blocks, every request goes to the first hot_blocks blocks
+    latencies : List[float] = []
+
+    async def client(client_id):
+        rng = rand.Random(seed * 1_000_003 + client_id)
+        for i in range(requests_per_client):
+            block_id = rng.randrange(hot_blocks or n_block_number)
+            start = time.perf_counter()
+            if rng.random() < write_ratio:
+                await front_end.write(block_id, (client_id, i))
+            else:
+                await front_end.read(block_id)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(client_id) for client_id in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies_us = np.asarray(latencies) * 1e6
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_latency_us": float(np.percentile(latencies_us, 50)),
+        "p99_latency_us": float(np.percentile(latencies_us, 99)),
+    }
+
+
+async def main(args):
+    for clients in args.clients:
+        path_oram = PathORAM(args.blocks, args.bucket_size, tree_engine=args.engine)
+        front_end = AsyncPathORAM(path_oram, queue_size=args.queue_size, round_size=args.round_size)
+        load = await generate_load(front_end, clients, args.requests, args.blocks, args.write_ratio, args.hot_blocks)
+        await front_end.close()
+        stats = front_end.stats()
+        print(f"{clients:>4} clients: {load['throughput']:>9.1f} requests/s, latency p50 {load['p50_latency_us']:>9.1f} us "
+              f"p99 {load['p99_latency_us']:>9.1f} us, queueing delay mean {stats['mean_queueing_delay_us']:>9.1f} us "
+              f"p99 {stats['p99_queueing_delay_us']:>9.1f} us, {stats['merged_requests']} merged, "
+              f"{stats['dummy_accesses']} of {stats['physical_accesses']} physical accesses dummy")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load on the asyncio Path ORAM front end")
+    parser.add_argument("--blocks", type=int, default=pow(2, 12))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--engine", default="flat")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--write-ratio", type=float, default=0.5)
+    parser.add_argument("--hot-blocks", type=int, default=None, help="send every request to this many blocks")
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--round-size", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,255 @@
+import argparse
+import os
+import pickle
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+
+from oram.server.block import Block
+from oram.server.flat_bucket_tree import heap_path_indices
+
+# plaintext of a slot: block id plus one (0 for a dummy), leaf id, payload length, then the pickled
+# payload padded to payload_size. Every slot, real or dummy, encrypts to the same number of bytes
+SLOT_HEADER = struct.Struct("<qqI")
+BUCKET_INDEX = struct.Struct("<q")
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+def ciphertext_size(payload_size):
+    # bytes stored for every slot: nonce, encrypted header and padded payload, and tag
+    return NONCE_SIZE + SLOT_HEADER.size + payload_size + TAG_SIZE
+
+
+def load_aesgcm():
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError as error:
+        raise ImportError("EncryptedBucketTree needs the cryptography package: pip install cryptography") from error
+    return AESGCM
+
+
+class EncryptedBucketTree():
+    # Tree engine encrypting every slot of the buckets it writes to an inner engine with AES-GCM.
+    # The inner engine only stores z_max_size ciphertexts per bucket: the slot number as block id,
+    # leaf 0, and a payload of ciphertext_size bytes. The heap index of the bucket is authenticated
+    # with each slot, so the server cannot move ciphertexts between buckets. A path is encrypted or
+    # decrypted as one batch, split across a thread pool when workers > 1.
+
+    def __init__(self, bucket_tree, z_max_size, key=None, payload_size=64, workers=1):
+        aesgcm = load_aesgcm()
+        self.bucket_tree = bucket_tree
+        self.height = bucket_tree.height
+        self.z_max_size = z_max_size
+        self.payload_size = payload_size
+        self.key = key if key is not None else aesgcm.generate_key(bit_length=128)
+        self.__aead = aesgcm(self.key)
+        self.plaintext_size = SLOT_HEADER.size + payload_size
+        self.ciphertext_size = ciphertext_size(payload_size)
+        self.workers = workers
+        self.__executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        self.crypto_seconds = 0.0
+        self.slots_encrypted = 0
+        self.slots_decrypted = 0
+        self.bytes_encrypted = 0
+        self.bytes_decrypted = 0
+        self.path_reads = 0
+        self.path_writes = 0
+
+        # the server starts with every bucket holding encrypted dummies
+        num_leaves = pow(2, self.height)
+        for position in range(num_leaves):
+            # the path of the leaf at this position from the left reaches the first bucket not yet written
+            new_levels = (position & -position).bit_length() - 1 if position else self.height
+            top_level = self.height - new_levels
+            self.write_path(num_leaves - 1 - position, [[] for _ in range(new_levels + 1)], top_level)
+        self.reset_stats()
+
+    def encode_slot(self, block):
+        if block is None:
+            return SLOT_HEADER.pack(0, 0, 0).ljust(self.plaintext_size, b"\0")
+        payload = pickle.dumps(block.data, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.payload_size:
+            raise ValueError(f"Payload of block {block.block_id} takes {len(payload)} bytes, "
+                             f"more than the slot size of {self.payload_size}")
+        return (SLOT_HEADER.pack(block.block_id + 1, block.leaf_id, len(payload)) + payload).ljust(self.plaintext_size, b"\0")
+
+    def decode_slot(self, plaintext):
+        # the real block of a slot, None for a dummy
+        stored_block_id, leaf_id, length = SLOT_HEADER.unpack_from(plaintext)
+        if stored_block_id == 0:
+            return None
+        data = pickle.loads(plaintext[SLOT_HEADER.size:SLOT_HEADER.size + length])
+        return Block(is_dummy=False, data=data, block_id=stored_block_id - 1, leaf_id=leaf_id)
+
+    def __encrypt(self, plaintexts, bucket_indexes):
+        # fresh random nonces for the whole batch in one call
+        nonces = os.urandom(NONCE_SIZE * len(plaintexts))
+        encrypt = self.__aead.encrypt
+
+        def encrypt_range(first, last):
+            return [nonces[i * NONCE_SIZE:(i + 1) * NONCE_SIZE]
+                    + encrypt(nonces[i * NONCE_SIZE:(i + 1) * NONCE_SIZE], plaintexts[i], BUCKET_INDEX.pack(bucket_indexes[i]))
+                    for i in range(first, last)]
+
+        return self.__run_batch(encrypt_range, len(plaintexts))
+
+    def __decrypt(self, ciphertexts, bucket_indexes):
+        decrypt = self.__aead.decrypt
+
+        def decrypt_range(first, last):
+            return [decrypt(ciphertexts[i][:NONCE_SIZE], ciphertexts[i][NONCE_SIZE:], BUCKET_INDEX.pack(bucket_indexes[i]))
+                    for i in range(first, last)]
+
+        return self.__run_batch(decrypt_range, len(ciphertexts))
+
+    def __run_batch(self, function, count):
+        if self.__executor is None or count < 2 * self.workers:
+            return function(0, count)
+        bounds = np.linspace(0, count, self.workers + 1).astype(int).tolist()
+        results = []
+        for part in self.__executor.map(function, bounds[:-1], bounds[1:]):
+            results.extend(part)
+        return results
+
+    def read_path(self, leaf_id, top_level=0):
+        path = heap_path_indices(leaf_id, self.height, top_level).tolist()
+        # the inner engines return the slots of the path bucket by bucket from the leaf up
+        slots = self.bucket_tree.read_path(leaf_id, top_level)
+        if len(slots) != len(path) * self.z_max_size:
+            raise ValueError(f"Expected {len(path) * self.z_max_size} encrypted slots on the path, got {len(slots)}")
+        start = time.perf_counter()
+        bucket_indexes = [bucket_index for bucket_index in path for _ in range(self.z_max_size)]
+        plaintexts = self.__decrypt([slot.data for slot in slots], bucket_indexes)
+        blocks : List[Block] = [block for block in map(self.decode_slot, plaintexts) if block is not None]
+        self.crypto_seconds += time.perf_counter() - start
+        self.path_reads += 1
+        self.slots_decrypted += len(slots)
+        self.bytes_decrypted += len(slots) * self.ciphertext_size
+        return blocks
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        path = heap_path_indices(leaf_id, self.height, top_level).tolist()
+        if len(buckets) != len(path):
+            raise ValueError(f"Expected {len(path)} buckets, got {len(buckets)}")
+        start = time.perf_counter()
+        plaintexts = []
+        bucket_indexes = []
+        for bucket_index, blocks in zip(path, buckets):
+            if len(blocks) > self.z_max_size:
+                raise ValueError("Bucket is full")
+            # dummies pad every bucket to z_max_size slots
+            plaintexts.extend(self.encode_slot(block) for block in blocks)
+            plaintexts.extend(self.encode_slot(None) for _ in range(self.z_max_size - len(blocks)))
+            bucket_indexes.extend([bucket_index] * self.z_max_size)
+        ciphertexts = self.__encrypt(plaintexts, bucket_indexes)
+        self.crypto_seconds += time.perf_counter() - start
+        self.path_writes += 1
+        self.slots_encrypted += len(ciphertexts)
+        self.bytes_encrypted += len(ciphertexts) * self.ciphertext_size
+
+        encrypted_buckets = [
+            [Block(is_dummy=False, data=ciphertexts[row * self.z_max_size + slot], block_id=slot, leaf_id=0)
+             for slot in range(self.z_max_size)]
+            for row in range(len(path))
+        ]
+        self.bucket_tree.write_path(leaf_id, encrypted_buckets, top_level)
+
+    def is_on_path(self, block_leaf_id, path_leaf_id, level):
+        shift_amount = self.height - level
+        return (block_leaf_id >> shift_amount) == (path_leaf_id >> shift_amount)
+
+    def export_arrays(self):
+        # the decrypted tree, in the layout of the other engines
+        slot_ids, _, ciphertexts = self.bucket_tree.export_arrays()
+        block_ids = np.full(slot_ids.shape, -1, dtype=np.int64)
+        leaf_ids = np.full(slot_ids.shape, -1, dtype=np.int64)
+        payloads = np.empty(slot_ids.shape, dtype=object)
+        for row in range(len(slot_ids)):
+            stored = [ciphertexts[row, slot] for slot in range(slot_ids.shape[1]) if slot_ids[row, slot] != -1]
+            blocks = [block for block in map(self.decode_slot, self.__decrypt(stored, [row] * len(stored)))
+                      if block is not None]
+            for slot, block in enumerate(blocks):
+                block_ids[row, slot] = block.block_id
+                leaf_ids[row, slot] = block.leaf_id
+                payloads[row, slot] = block.data
+        return block_ids, leaf_ids, payloads
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        slot_ids = np.tile(np.arange(self.z_max_size, dtype=np.int64), (len(block_ids), 1))
+        stored_leaf_ids = np.zeros(slot_ids.shape, dtype=np.int64)
+        ciphertexts = np.empty(block_ids.shape, dtype=object)
+        for row in range(len(block_ids)):
+            blocks = [Block(is_dummy=False, data=payloads[row, slot], block_id=int(block_ids[row, slot]),
+                            leaf_id=int(leaf_ids[row, slot]))
+                      for slot in np.flatnonzero(block_ids[row] != -1).tolist()]
+            plaintexts = [self.encode_slot(block) for block in blocks]
+            plaintexts.extend(self.encode_slot(None) for _ in range(self.z_max_size - len(blocks)))
+            for slot, ciphertext in enumerate(self.__encrypt(plaintexts, [row] * self.z_max_size)):
+                ciphertexts[row, slot] = ciphertext
+        self.bucket_tree.import_arrays(slot_ids, stored_leaf_ids, ciphertexts)
+
+    def reset_stats(self):
+        self.crypto_seconds = 0.0
+        self.slots_encrypted = 0
+        self.slots_decrypted = 0
+        self.bytes_encrypted = 0
+        self.bytes_decrypted = 0
+        self.path_reads = 0
+        self.path_writes = 0
+
+    def crypto_stats(self):
+        # an access reads one path and writes it back
+        accesses = max(self.path_reads, 1)
+        return {
+            "crypto_us_per_access": self.crypto_seconds / accesses * 1e6,
+            "slots_decrypted_per_access": self.slots_decrypted / accesses,
+            "slots_encrypted_per_access": self.slots_encrypted / max(self.path_writes, 1),
+            "bytes_decrypted_per_access": self.bytes_decrypted / accesses,
+            "bytes_encrypted_per_access": self.bytes_encrypted / max(self.path_writes, 1),
+        }
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+
+    def __str__(self):
+        return (f"EncryptedBucketTree({self.bucket_tree}, slot plaintext={self.plaintext_size} bytes, "
+                f"ciphertext={self.ciphertext_size} bytes, workers={self.workers})")
+
+
+if __name__ == "__main__":
+    from oram.client.path_oram import TREE_ENGINES, PathORAM
+
+    parser = argparse.ArgumentParser(description="Crypto cost per access of an encrypted Path ORAM")
+    parser.add_argument("--blocks", type=int, default=pow(2, 12))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--engine", default="flat", choices=list(TREE_ENGINES))
+    parser.add_argument("--payload-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--accesses", type=int, default=5_000)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        if args.engine == "mapped":
+            # the mapped slots store the ciphertexts, which are larger than its default payload size
+            inner = TREE_ENGINES[args.engine](args.blocks, args.bucket_size,
+                                              payload_size=ciphertext_size(args.payload_size))
+        else:
+            inner = TREE_ENGINES[args.engine](args.blocks, args.bucket_size)
+        tree = EncryptedBucketTree(inner, args.bucket_size, payload_size=args.payload_size, workers=workers)
+        path_oram = PathORAM(args.blocks, args.bucket_size, tree_engine=tree)
+        start = time.perf_counter()
+        for i in range(args.accesses):
+            path_oram.access(i % args.blocks, isWrite=True, new_data=i)
+        elapsed_us = (time.perf_counter() - start) / args.accesses * 1e6
+        stats = tree.crypto_stats()
+        print(f"{workers} worker(s): {elapsed_us:.1f} us per access, of which {stats['crypto_us_per_access']:.1f} us "
+              f"crypto and {elapsed_us - stats['crypto_us_per_access']:.1f} us ORAM logic; "
+              f"{stats['bytes_decrypted_per_access']:.0f} bytes decrypted and "
+              f"{stats['bytes_encrypted_per_access']:.0f} bytes encrypted per access")
+        tree.close()
@@ -0,0 +1,149 @@
+import argparse
+import itertools
+import os
+import time
+
+from oram.simulation.histogram import StashHistogram, write_stash_histogram
+
+
+def reverse_bits(value, width):
+    return int(format(value, f"0{width}b")[::-1], 2) if width else 0
+
+
+class PathEviction:
+    # the eviction of plain Path ORAM: only the path read by the access is evicted
+
+    def __init__(self):
+        self.extra_paths = 0
+
+    def after_access(self, path_oram):
+        pass
+
+    def __str__(self):
+        return "path"
+
+
+class ReverseLexicographicEviction:
+    # Ring ORAM style schedule: every `every` accesses, one extra path is read and evicted. The paths
+    # follow the reverse lexicographic order of the leaves, which spreads consecutive evictions over
+    # the tree; the schedule is fixed in advance, so it reveals nothing about the accesses
+
+    def __init__(self, every=4):
+        if every < 1:
+            raise ValueError("Eviction period must be at least 1")
+        self.every = every
+        self.accesses = 0
+        self.evictions = 0
+        self.extra_paths = 0
+
+    def after_access(self, path_oram):
+        self.accesses += 1
+        if self.accesses % self.every == 0:
+            height = path_oram.l_tree_height
+            path_oram.evict_path(reverse_bits(self.evictions % pow(2, height), height))
+            self.evictions += 1
+            self.extra_paths += 1
+
+    def __str__(self):
+        return f"reverse_lexicographic(every={self.every})"
+
+
+class BackgroundEviction:
+    # dummy accesses on random paths while the stash holds more than threshold blocks, at most
+    # max_dummy_accesses after an access. The number of dummy accesses depends on the stash size,
+    # so a server counting paths learns when the stash runs high, though nothing about which blocks
+
+    def __init__(self, threshold=16, max_dummy_accesses=8):
+        self.threshold = threshold
+        self.max_dummy_accesses = max_dummy_accesses
+        self.extra_paths = 0
+
+    def after_access(self, path_oram):
+        for _ in range(self.max_dummy_accesses):
+            if len(path_oram.stash) <= self.threshold:
+                break
+            path_oram.dummy_access()
+            self.extra_paths += 1
+
+    def __str__(self):
+        return f"background(threshold={self.threshold})"
+
+
+EVICTION_POLICIES = {
+    "path": PathEviction,
+    "reverse_lexicographic": ReverseLexicographicEviction,
+    "background": BackgroundEviction,
+}
+
+
+def evaluate_policy(n_block_number, z_bucket_size, eviction, policy, warmup_access_number, simulation_access_number,
+                    tree_engine="flat", seed=0):
+    # stash histogram, extra bandwidth and throughput of one eviction and policy pair on the sequential scan
+    from oram.client.path_oram import PathORAM
+
+    from oram.client.rng import RandomSource
+
+    path_oram = PathORAM(n_block_number, z_bucket_size, tree_engine=tree_engine, eviction=eviction,
+                         eviction_policy=policy, rng=RandomSource(seed))
+    for i in range(warmup_access_number):
+        path_oram.access(i % n_block_number, isWrite=True, new_data=i)
+
+    extra_paths_before = policy.extra_paths
+    path_oram.collector = StashHistogram()
+    start = time.perf_counter()
+    for i in range(simulation_access_number):
+        path_oram.access(i % n_block_number)
+    elapsed = time.perf_counter() - start
+    extra_paths = policy.extra_paths - extra_paths_before
+    # every access, and every extra eviction, reads and writes L buckets of Z blocks
+    blocks_per_path = 2 * path_oram.l_tree_height * z_bucket_size
+    return {
+        "z_bucket_size": z_bucket_size,
+        "eviction": eviction,
+        "policy": str(policy),
+        "max_stash_size": path_oram.collector.max_stash_size,
+        "mean_stash_size": path_oram.collector.mean(),
+        "extra_bandwidth": extra_paths / simulation_access_number,
+        "blocks_moved_per_access": blocks_per_path * (1 + extra_paths / simulation_access_number),
+        "ops_per_sec": simulation_access_number / elapsed,
+        "stash_size_map": path_oram.collector.stash_size_map,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stash size, bandwidth and throughput of the eviction policies")
+    parser.add_argument("--blocks", type=int, default=pow(2, 12))
+    parser.add_argument("--bucket-sizes", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--evictions", nargs="+", default=["greedy", "random"])
+    parser.add_argument("--periods", type=int, nargs="+", default=[2, 4], help="A of the reverse lexicographic policy")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[8, 16], help="stash thresholds of background eviction")
+    parser.add_argument("--warmup", type=int, default=20_000)
+    parser.add_argument("--accesses", type=int, default=20_000)
+    parser.add_argument("--stash-bound", type=int, default=20, help="largest stash size allowed")
+    parser.add_argument("--output-dir", default=None, help="write one stash histogram per configuration here")
+    args = parser.parse_args()
+
+    policies = ([lambda: PathEviction()]
+                + [lambda every=every: ReverseLexicographicEviction(every) for every in args.periods]
+                + [lambda threshold=threshold: BackgroundEviction(threshold) for threshold in args.thresholds])
+    rows = []
+    print(f"{'Z':>2} {'eviction':>8} {'policy':>36} {'max stash':>9} {'mean stash':>10} {'extra bw':>8} "
+          f"{'blocks/access':>13} {'ops/s':>9}")
+    for z_bucket_size, eviction, make in itertools.product(args.bucket_sizes, args.evictions, policies):
+        row = evaluate_policy(args.blocks, z_bucket_size, eviction, make(), args.warmup, args.accesses)
+        rows.append(row)
+        print(f"{z_bucket_size:>2} {eviction:>8} {row['policy']:>36} {row['max_stash_size']:>9} "
+              f"{row['mean_stash_size']:>10.2f} {row['extra_bandwidth'] * 100:>7.1f}% "
+              f"{row['blocks_moved_per_access']:>13.1f} {row['ops_per_sec']:>9.1f}")
+        if args.output_dir is not None:
+            os.makedirs(args.output_dir, exist_ok=True)
+            write_stash_histogram(os.path.join(args.output_dir, f"stash_Z{z_bucket_size}_{eviction}_{row['policy']}.txt"),
+                                  row["stash_size_map"])
+
+    within_bound = [row for row in rows if row["max_stash_size"] <= args.stash_bound]
+    if within_bound:
+        best = min(within_bound, key=lambda row: (row["blocks_moved_per_access"], -row["ops_per_sec"]))
+        print(f"Cheapest configuration with a stash of at most {args.stash_bound} blocks: Z={best['z_bucket_size']}, "
+              f"{best['eviction']} eviction, {best['policy']}, {best['blocks_moved_per_access']:.1f} blocks per access")
+    else:
+        print(f"No configuration kept the stash within {args.stash_bound} blocks")
@@ -0,0 +1,310 @@
+import argparse
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+PHASES = ("remap", "read_path", "stash_merge", "eviction", "write_path")
+
+
+def access_record_dtype(height):
+    # one record per access or per batch of accesses; per-level arrays are indexed by level, the root at 0
+    return np.dtype([
+        ("access", "<i8"),
+        ("batch_size", "<i4"),
+        ("start_ns", "<i8"),
+        *((f"{phase}_ns", "<i8") for phase in PHASES),
+        ("leaf_id", "<i8"),
+        ("blocks_read", "<i4"),
+        ("stash_before_eviction", "<i4"),
+        ("stash_after_access", "<i4"),
+        ("dummy_slots_written", "<i4"),
+        # levels between the deepest bucket a block could go to and the bucket it was evicted to,
+        # the largest and the number of evicted blocks with each slack
+        ("max_eviction_slack", "<i4"),
+        ("blocks_per_slack", "<i4", (height + 1,)),
+        ("blocks_per_level", "<i4", (height + 1,)),
+        ("stash_after_level", "<i4", (height + 1,)),
+    ])
+
+
+class RingBuffer:
+    # the last capacity records of a NumPy structured dtype, overwritten oldest first
+
+    def __init__(self, capacity, dtype):
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=dtype)
+        self.count = 0
+
+    def append(self, *values):
+        self.records[self.count % self.capacity] = values
+        self.count += 1
+
+    def ordered(self):
+        # the records kept, oldest first
+        if self.count <= self.capacity:
+            return self.records[:self.count]
+        start = self.count % self.capacity
+        return np.concatenate([self.records[start:], self.records[:start]])
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+class SamplingProfiler:
+    # samples the stack of one thread every interval seconds from a background thread
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+
+    def top_functions(self, count=20):
+        # (function, share of the samples) by samples in which the function is running
+        leaves = Counter()
+        for stack, samples in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += samples
+        total = max(sum(leaves.values()), 1)
+        return [(function, samples / total) for function, samples in leaves.most_common(count)]
+
+
+class AccessInstrumentation:
+    # Per-access timings and counters of a PathORAM, enabled by setting path_oram.instrumentation.
+    # Records go to a ring buffer that can be exported to CSV or to Chrome trace JSON
+    # (chrome://tracing, Perfetto). A profiling window runs cProfile or a sampling profiler
+    # over the accesses first_access .. first_access + access_count - 1.
+
+    def __init__(self, height, capacity=65_536):
+        self.height = height
+        self.buffer = RingBuffer(capacity, access_record_dtype(height))
+        self.accesses = 0
+        self.__profile_window = None
+        self.profiler = None
+        self.__timestamps = []
+
+    def profile(self, first_access, access_count, mode="cprofile", interval=0.001):
+        if mode not in ("cprofile", "sampling"):
+            raise ValueError(f"Unknown profiling mode {mode}, expected cprofile or sampling")
+        self.__profile_window = (first_access, first_access + access_count, mode, interval)
+        self.profiler = None
+
+    def begin_access(self, batch_size=1):
+        # called by PathORAM.access before the first phase, mark at the end of every phase and
+        # end_access with the counters once the access is done. PathORAM.access_many calls them
+        # once per batch, ending with end_batch; a batch overlapping the profiling window is profiled whole
+        window = self.__profile_window
+        if window is not None and self.profiler is None and window[0] < self.accesses + batch_size \
+                and self.accesses < window[1]:
+            _, _, mode, interval = window
+            if mode == "cprofile":
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            else:
+                self.profiler = SamplingProfiler(threading.get_ident(), interval)
+                self.profiler.start()
+        self.__timestamps = [time.perf_counter_ns()]
+
+    def mark(self):
+        self.__timestamps.append(time.perf_counter_ns())
+
+    def end_access(self, stash, leaf_id, blocks_read, stash_before_eviction, buckets, z_bucket_size):
+        self.record_access(stash, leaf_id, self.__timestamps, blocks_read, stash_before_eviction, buckets,
+                           z_bucket_size)
+        self.__count_accesses(1)
+
+    def end_batch(self, stash, leaf_ids, blocks_read, stash_before_eviction, buckets, buckets_written, z_bucket_size):
+        self.record_batch(stash, leaf_ids, self.__timestamps, blocks_read, stash_before_eviction, buckets,
+                          buckets_written, z_bucket_size)
+        self.__count_accesses(len(leaf_ids))
+
+    def __count_accesses(self, count):
+        self.accesses += count
+        if self.__profile_window is not None and self.accesses >= self.__profile_window[1]:
+            if isinstance(self.profiler, cProfile.Profile):
+                self.profiler.disable()
+            elif self.profiler is not None:
+                self.profiler.stop()
+            self.__profile_window = None
+
+    def record_access(self, stash, leaf_id, timestamps, blocks_read, stash_before_eviction, buckets, z_bucket_size):
+        blocks_per_level = np.zeros(self.height + 1, dtype=np.int32)
+        stash_after_level = np.zeros(self.height + 1, dtype=np.int32)
+        blocks_per_slack = np.zeros(self.height + 1, dtype=np.int32)
+        remaining = stash_before_eviction
+        # buckets[i] is the bucket i levels above the leaf
+        for i, bucket in enumerate(buckets):
+            level = self.height - i
+            blocks_per_level[level] = len(bucket)
+            remaining -= len(bucket)
+            stash_after_level[level] = remaining
+            for block in bucket:
+                blocks_per_slack[stash.common_depth(block.leaf_id, leaf_id) - level] += 1
+        self.__append(1, leaf_id, timestamps, blocks_read, stash_before_eviction, len(stash),
+                      z_bucket_size * len(buckets), blocks_per_slack, blocks_per_level, stash_after_level)
+
+    def record_batch(self, stash, leaf_ids, timestamps, blocks_read, stash_before_eviction, buckets,
+                     buckets_written, z_bucket_size):
+        # buckets maps (level, leaf id bits above the level) to the blocks evicted to it over all the
+        # paths of the batch, the slack of a block is measured from the deepest bucket of any of them
+        blocks_per_level = np.zeros(self.height + 1, dtype=np.int32)
+        stash_after_level = np.zeros(self.height + 1, dtype=np.int32)
+        blocks_per_slack = np.zeros(self.height + 1, dtype=np.int32)
+        for (level, _), bucket in buckets.items():
+            blocks_per_level[level] += len(bucket)
+            for block in bucket:
+                deepest = max(stash.common_depth(block.leaf_id, leaf_id) for leaf_id in leaf_ids)
+                blocks_per_slack[deepest - level] += 1
+        remaining = stash_before_eviction
+        for level in range(self.height, 0, -1):
+            remaining -= blocks_per_level[level]
+            stash_after_level[level] = remaining
+        # a batch reads several paths, its leaf id is -1
+        self.__append(len(leaf_ids), -1, timestamps, blocks_read, stash_before_eviction, len(stash),
+                      z_bucket_size * buckets_written, blocks_per_slack, blocks_per_level, stash_after_level)
+
+    def __append(self, batch_size, leaf_id, timestamps, blocks_read, stash_before_eviction, stash_after_access,
+                 slots_written, blocks_per_slack, blocks_per_level, stash_after_level):
+        slacks = np.flatnonzero(blocks_per_slack)
+        self.buffer.append(
+            self.accesses,
+            batch_size,
+            timestamps[0],
+            *(end - start for start, end in zip(timestamps, timestamps[1:])),
+            leaf_id,
+            blocks_read,
+            stash_before_eviction,
+            stash_after_access,
+            slots_written - int(blocks_per_level.sum()),
+            slacks[-1] if len(slacks) else 0,
+            blocks_per_slack,
+            blocks_per_level,
+            stash_after_level,
+        )
+
+    def phase_summary(self):
+        # mean and p99 microseconds per phase over the records kept
+        records = self.buffer.ordered()
+        return {phase: (float(records[f"{phase}_ns"].mean()) / 1e3, float(np.percentile(records[f"{phase}_ns"], 99)) / 1e3)
+                for phase in PHASES} if len(records) else {}
+
+    def slack_summary(self):
+        # share of the evicted blocks with each eviction slack over the records kept, 0 for a block
+        # evicted to the deepest bucket it could go to
+        counts = self.buffer.ordered()["blocks_per_slack"].sum(axis=0)
+        return counts / max(int(counts.sum()), 1)
+
+    def to_csv(self, filename):
+        records = self.buffer.ordered()
+        scalar_fields = [name for name in records.dtype.names if records.dtype[name].shape == ()]
+        levels = range(1, self.height + 1)
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(scalar_fields + [f"blocks_level_{level}" for level in levels]
+                            + [f"stash_after_level_{level}" for level in levels]
+                            + [f"blocks_slack_{slack}" for slack in range(self.height + 1)])
+            for record in records:
+                writer.writerow([record[name].item() for name in scalar_fields]
+                                + record["blocks_per_level"][1:].tolist() + record["stash_after_level"][1:].tolist()
+                                + record["blocks_per_slack"].tolist())
+
+    def to_chrome_trace(self, filename):
+        # one complete event per phase nested in one event per access, and a stash size counter
+        events = []
+        for record in self.buffer.ordered():
+            timestamp = record["start_ns"].item() / 1e3
+            durations = [record[f"{phase}_ns"].item() / 1e3 for phase in PHASES]
+            events.append({"name": "access", "ph": "X", "pid": 1, "tid": 1, "ts": timestamp, "dur": sum(durations),
+                           "args": {"access": record["access"].item(), "batch_size": record["batch_size"].item(),
+                                    "leaf_id": record["leaf_id"].item(),
+                                    "blocks_read": record["blocks_read"].item(),
+                                    "dummy_slots_written": record["dummy_slots_written"].item(),
+                                    "max_eviction_slack": record["max_eviction_slack"].item(),
+                                    "blocks_per_slack": record["blocks_per_slack"].tolist(),
+                                    "blocks_per_level": record["blocks_per_level"][1:].tolist()}})
+            for phase, duration in zip(PHASES, durations):
+                events.append({"name": phase, "ph": "X", "pid": 1, "tid": 1, "ts": timestamp, "dur": duration})
+                timestamp += duration
+            events.append({"name": "stash", "ph": "C", "pid": 1, "ts": record["start_ns"].item() / 1e3,
+                           "args": {"before_eviction": record["stash_before_eviction"].item(),
+                                    "after_access": record["stash_after_access"].item()}})
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ns"}, f)
+
+    def profile_report(self, count=20):
+        if self.profiler is None:
+            return ""
+        if isinstance(self.profiler, cProfile.Profile):
+            stream = io.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(count)
+            return stream.getvalue()
+        return "\n".join(f"{share * 100:6.2f}%  {function}" for function, share in self.profiler.top_functions(count))
+
+
+if __name__ == "__main__":
+    from oram.client.path_oram import PathORAM
+
+    parser = argparse.ArgumentParser(description="Per-phase timings and counters of Path ORAM accesses")
+    parser.add_argument("--blocks", type=int, default=pow(2, 12))
+    parser.add_argument("--bucket-size", type=int, default=2)
+    parser.add_argument("--engine", default="object")
+    parser.add_argument("--eviction", default="greedy")
+    parser.add_argument("--accesses", type=int, default=20_000)
+    parser.add_argument("--profile", choices=["cprofile", "sampling"], default=None)
+    parser.add_argument("--profile-window", type=int, nargs=2, default=[10_000, 1_000], metavar=("FIRST", "COUNT"))
+    parser.add_argument("--csv", default="access_trace.csv")
+    parser.add_argument("--chrome-trace", default="access_trace.json")
+    args = parser.parse_args()
+
+    path_oram = PathORAM(args.blocks, args.bucket_size, tree_engine=args.engine, eviction=args.eviction)
+    start = time.perf_counter()
+    for i in range(args.accesses):
+        path_oram.access(i % args.blocks, isWrite=True, new_data=i)
+    disabled = time.perf_counter() - start
+
+    path_oram.instrumentation = AccessInstrumentation(path_oram.l_tree_height)
+    if args.profile is not None:
+        path_oram.instrumentation.profile(*args.profile_window, mode=args.profile)
+    start = time.perf_counter()
+    for i in range(args.accesses):
+        path_oram.access(i % args.blocks, isWrite=True, new_data=i)
+    enabled = time.perf_counter() - start
+
+    print(f"{disabled / args.accesses * 1e6:.1f} us per access without instrumentation, "
+          f"{enabled / args.accesses * 1e6:.1f} us with")
+    for phase, (mean, p99) in path_oram.instrumentation.phase_summary().items():
+        print(f"{phase:>12}: mean {mean:8.2f} us, p99 {p99:8.2f} us")
+    shares = path_oram.instrumentation.slack_summary()
+    print("Evicted blocks by eviction slack: " + ", ".join(
+        f"{slack}: {share:.1%}" for slack, share in enumerate(shares) if share))
+    path_oram.instrumentation.to_csv(args.csv)
+    path_oram.instrumentation.to_chrome_trace(args.chrome_trace)
+    print(f"Records written to {args.csv} and {args.chrome_trace}")
+    if args.profile is not None:
+        print(path_oram.instrumentation.profile_report())
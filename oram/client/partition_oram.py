@@ -0,0 +1,267 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from math import ceil, exp, lgamma, log
+from typing import Deque, Dict, List, Tuple
+
+import numpy as np
+
+from oram.client.path_oram import PathORAM
+from oram.client.rng import RandomSource
+from oram.simulation.histogram import StashHistogram, add_stash_sizes
+
+# ops of the requests sent to a shard
+OP_DUMMY, OP_READ, OP_WRITE = 0, 1, 2
+
+
+def shard_worker(connection, n_block_number, z_bucket_size, tree_engine, eviction, rng):
+    # one shard: runs every round of (op, local block id, data) requests it receives, in order, and
+    # answers with the data read and its stash size. None ends the worker after sending its histogram
+    path_oram = PathORAM(n_block_number, z_bucket_size, tree_engine=tree_engine, eviction=eviction, rng=rng,
+                         collector=StashHistogram())
+    while True:
+        requests = connection.recv()
+        if requests is None:
+            connection.send(path_oram.collector.stash_size_map)
+            connection.close()
+            return
+        results = []
+        for op, block_id, data in requests:
+            if op == OP_DUMMY:
+                path_oram.dummy_access()
+                path_oram.collector.record(len(path_oram.stash))
+                results.append(None)
+            else:
+                block = path_oram.access(block_id, isWrite=op == OP_WRITE, new_data=data)
+                results.append(block.data if block is not None else None)
+        connection.send((results, len(path_oram.stash)))
+
+
+@lru_cache(maxsize=None)
+def load_bound(count, partitions, overflow_bits):
+    # the smallest L such that, with count requests each sent to a uniformly random one of partitions
+    # shards, some shard gets more than L requests with probability at most 2^-overflow_bits
+    threshold = pow(2.0, -overflow_bits) / partitions
+    if partitions == 1:
+        return count
+    log_p, log_q = log(1 / partitions), log(1 - 1 / partitions)
+    tail = 0.0
+    for load in range(count, -1, -1):
+        probability = exp(lgamma(count + 1) - lgamma(load + 1) - lgamma(count - load + 1)
+                          + load * log_p + (count - load) * log_q)
+        if tail + probability > threshold:
+            return load
+        tail += probability
+    return 0
+
+
+class PartitionORAM:
+    # Blocks are spread over `partitions` independent PathORAM shards, each in its own worker process,
+    # and the client keeps the shard of every block. A batch of accesses runs in a read phase then a
+    # write phase. In the read phase every access reads one shard: the first access to a block takes
+    # it out of the shard it was moved to at its previous access, any other access, or an access to a
+    # block never stored, makes a dummy access on a random shard. In the write phase every access
+    # writes one fresh random shard, where its block moves, or makes a dummy access there when it has
+    # nothing to store. Each phase is thus a batch-size number of requests on uniformly random,
+    # independent shards, whatever blocks are accessed. The server cannot tell reads, writes and
+    # dummy accesses apart, and sees every shard make exactly accesses_per_round accesses per round,
+    # padded with dummy accesses on random paths, for rounds_for(batch size) rounds per phase: enough
+    # for the busiest shard except with probability below 2^-overflow_bits. Only then, when a phase
+    # overflows, does it run extra rounds. A shard holds shard_capacity blocks, which random moves
+    # exceed with the same probability; a block finding its shard full waits in the client overflow
+    # cache, and is read like a block accessed again. The shards run their rounds in parallel.
+
+    def __init__(self, n_block_number, z_bucket_size, partitions, accesses_per_round=16, tree_engine="flat",
+                 eviction="greedy", rng=None, overflow_bits=40):
+        if partitions < 1:
+            raise ValueError("Number of partitions must be at least 1")
+        if accesses_per_round < 1:
+            raise ValueError("Accesses per round must be at least 1")
+        self.n_block_number = n_block_number
+        self.partitions = partitions
+        self.accesses_per_round = accesses_per_round
+        self.overflow_bits = overflow_bits
+        self.rng = rng if rng is not None else RandomSource()
+        self.shard_capacity = max(load_bound(n_block_number, partitions, overflow_bits), 2)
+
+        # the shard map: the shard of every block, and the local id of the blocks stored in their shard.
+        # A block without local id was never stored, or is in the overflow cache
+        self.shard_of = [self.rng.randbelow(partitions) for _ in range(n_block_number)]
+        self.local_id : Dict[int, int] = {}
+        self.free_local_ids = [list(range(self.shard_capacity - 1, -1, -1)) for _ in range(partitions)]
+        self.overflow : Dict[int, object] = {}
+
+        self.connections = []
+        self.processes = []
+        for shard_rng in self.rng.spawn(partitions):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=shard_worker, daemon=True, args=(
+                worker_connection, self.shard_capacity, z_bucket_size, tree_engine, eviction, shard_rng))
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        self.rounds = 0
+        self.real_accesses = 0
+        self.dummy_accesses = 0
+        # sum of the shard stash sizes after every round, and the overflow cache size after every batch
+        self.combined_stash = StashHistogram()
+        self.overflow_sizes = StashHistogram()
+
+    def rounds_for(self, count):
+        # rounds of a phase of count requests
+        return ceil(load_bound(count, self.partitions, self.overflow_bits) / self.accesses_per_round)
+
+    def __run_phase(self, queues, count):
+        # runs the (key, op, local block id, data) requests queued for every shard in rounds_for(count)
+        # rounds, more only on overflow; returns the data read by each key
+        results = {}
+        rounds = self.rounds_for(count)
+        while rounds > 0 or any(queues):
+            sent = []
+            for connection, queue in zip(self.connections, queues):
+                real = [queue.popleft() for _ in range(min(len(queue), self.accesses_per_round))]
+                requests = [(op, block_id, data) for _, op, block_id, data in real]
+                requests += [(OP_DUMMY, -1, None)] * (self.accesses_per_round - len(real))
+                connection.send(requests)
+                sent.append(real)
+                real_accesses = sum(op != OP_DUMMY for _, op, _, _ in real)
+                self.real_accesses += real_accesses
+                self.dummy_accesses += self.accesses_per_round - real_accesses
+            stash_size = 0
+            for connection, real in zip(self.connections, sent):
+                shard_results, shard_stash_size = connection.recv()
+                for (key, op, _, _), data in zip(real, shard_results):
+                    if op == OP_READ:
+                        results[key] = data
+                stash_size += shard_stash_size
+            self.rounds += 1
+            self.combined_stash.record(stash_size)
+            rounds -= 1
+        return results
+
+    def access_many(self, block_ids, ops=None, new_data=None):
+        # ops[i] True to write new_data[i] to block_ids[i]; returns the data read by every access
+        ops = ops if ops is not None else [False] * len(block_ids)
+        new_data = new_data if new_data is not None else [None] * len(block_ids)
+        reads : List[Deque[Tuple[int, int, int, object]]] = [deque() for _ in range(self.partitions)]
+        current = {}
+        for block_id in block_ids:
+            if block_id in current or block_id in self.overflow:
+                reads[self.rng.randbelow(self.partitions)].append((-1, OP_DUMMY, -1, None))
+                if block_id not in current:
+                    current[block_id] = self.overflow.pop(block_id)
+                continue
+            shard = self.shard_of[block_id]
+            local_id = self.local_id.pop(block_id, None)
+            current[block_id] = None
+            if local_id is None:
+                reads[shard].append((-1, OP_DUMMY, -1, None))
+            else:
+                reads[shard].append((block_id, OP_READ, local_id, None))
+                self.free_local_ids[shard].append(local_id)
+        current.update(self.__run_phase(reads, len(block_ids)))
+
+        # the accesses in order on the client
+        results = []
+        for block_id, isWrite, data in zip(block_ids, ops, new_data):
+            results.append(current[block_id])
+            if isWrite:
+                current[block_id] = data
+
+        writes : List[Deque[Tuple[int, int, int, object]]] = [deque() for _ in range(self.partitions)]
+        for block_id in block_ids:
+            shard = self.rng.randbelow(self.partitions)
+            if block_id not in current:
+                writes[shard].append((-1, OP_DUMMY, -1, None))
+                continue
+            self.shard_of[block_id] = shard
+            data = current.pop(block_id)
+            if data is not None and self.free_local_ids[shard]:
+                self.local_id[block_id] = self.free_local_ids[shard].pop()
+                writes[shard].append((block_id, OP_WRITE, self.local_id[block_id], data))
+            else:
+                if data is not None:
+                    self.overflow[block_id] = data
+                writes[shard].append((-1, OP_DUMMY, -1, None))
+        self.__run_phase(writes, len(block_ids))
+        self.overflow_sizes.record(len(self.overflow))
+        return results
+
+    def access(self, block_id, isWrite=False, new_data=None):
+        return self.access_many([block_id], [isWrite], [new_data])[0]
+
+    def close(self):
+        # the stash size histogram of every shard, after stopping the workers
+        stash_size_maps = []
+        for connection, process in zip(self.connections, self.processes):
+            connection.send(None)
+            stash_size_maps.append(np.asarray(connection.recv(), dtype=np.int64))
+            connection.close()
+            process.join()
+        self.connections, self.processes = [], []
+        return stash_size_maps
+
+    def __str__(self):
+        return (f"PartitionORAM(blocks={self.n_block_number}, partitions={self.partitions}, "
+                f"accesses_per_round={self.accesses_per_round}, shard_capacity={self.shard_capacity})")
+
+
+def run_partitions(n_block_number, z_bucket_size, partitions, access_number, accesses_per_round, batch_size,
+                   tree_engine="flat", seed=0):
+    rng = RandomSource(seed)
+    partition_oram = PartitionORAM(n_block_number, z_bucket_size, partitions, accesses_per_round, tree_engine,
+                                   rng=rng)
+    block_ids = rng.leaves(62, access_number) % n_block_number
+    start = time.perf_counter()
+    for first in range(0, access_number, batch_size):
+        batch = block_ids[first:first + batch_size].tolist()
+        partition_oram.access_many(batch, [True] * len(batch), batch)
+    elapsed = time.perf_counter() - start
+    combined = partition_oram.combined_stash
+    stash_size_maps = partition_oram.close()
+    merged = np.zeros(1, dtype=np.int64)
+    for stash_size_map in stash_size_maps:
+        merged = add_stash_sizes(merged, np.repeat(np.arange(len(stash_size_map)), stash_size_map))
+    shard_max = [int(np.flatnonzero(stash_size_map)[-1]) for stash_size_map in stash_size_maps]
+    return {
+        "partitions": partitions,
+        "ops_per_sec": access_number / elapsed,
+        "dummy_fraction": partition_oram.dummy_accesses / (partition_oram.dummy_accesses + partition_oram.real_accesses),
+        "shard_mean_stash_size": float(np.arange(len(merged)) @ merged) / merged.sum(),
+        "shard_max_stash_size": max(shard_max),
+        "combined_mean_stash_size": combined.mean(),
+        "combined_max_stash_size": combined.max_stash_size,
+        "max_overflow_size": partition_oram.overflow_sizes.max_stash_size,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and stash size of the partitioned ORAM")
+    parser.add_argument("--blocks", type=int, default=pow(2, 16))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--partitions", type=int, nargs="+", default=None,
+                        help="numbers of shards, 1 to the number of cores by default")
+    parser.add_argument("--accesses", type=int, default=50_000)
+    parser.add_argument("--accesses-per-round", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=1024, help="logical accesses queued at once")
+    parser.add_argument("--engine", default="flat")
+    args = parser.parse_args()
+
+    partition_counts = args.partitions or sorted({1, *(pow(2, i) for i in range(os.cpu_count().bit_length())),
+                                                  os.cpu_count()})
+    print(f"N={args.blocks}, Z={args.bucket_size}, {args.accesses} accesses, {os.cpu_count()} cores")
+    print(f"{'shards':>6} {'ops/s':>10} {'speedup':>7} {'dummies':>7} {'shard mean':>10} {'shard max':>9} "
+          f"{'total mean':>10} {'total max':>9} {'overflow':>8}")
+    baseline = None
+    for partitions in partition_counts:
+        row = run_partitions(args.blocks, args.bucket_size, partitions, args.accesses, args.accesses_per_round,
+                             args.batch_size, args.engine)
+        baseline = baseline or row["ops_per_sec"]
+        print(f"{partitions:>6} {row['ops_per_sec']:>10.1f} {row['ops_per_sec'] / baseline:>6.2f}x "
+              f"{row['dummy_fraction']:>6.1%} {row['shard_mean_stash_size']:>10.2f} {row['shard_max_stash_size']:>9} "
+              f"{row['combined_mean_stash_size']:>10.2f} {row['combined_max_stash_size']:>9} {row['max_overflow_size']:>8}")
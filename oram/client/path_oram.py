@@ -1,244 +1,325 @@
-import random as rand
-import matplotlib.pyplot as plt
+import argparse
+import os
 import numpy as np
 from typing import List
 from tqdm import tqdm
 from collections.abc import Mapping
-from oram.client.position_map import PositionMap
+from oram.client.eviction_policy import EVICTION_POLICIES
+from oram.client.position_map import PackedPositionMap, PositionMap
+from oram.client.rng import RandomSource
+from oram.client.stash import Stash
 from oram.constants import Z_BUCKET_SIZE, N_BLOCKS_NUMBER
 from oram.server.block import Block
 from oram.server.bucket import Bucket
-from oram.server.bucket_tree import BucketTree
+from oram.server.engines import PAYLOAD_ENGINES, TREE_ENGINES
+from oram.simulation.analysis import format_summary, summarize
+from oram.simulation.histogram import StashHistogram
+from oram.simulation.workloads import WORKLOADS, iter_accesses, make_workload, skip_accesses
+
+POSITION_MAPS = {
+    "dict": PositionMap,
+    "packed": PackedPositionMap,
+}
+
+EVICTIONS = {
+    "greedy": Stash.evict_greedy,
+    "random": Stash.evict_random_sample,
+}
+
+# the same evictions over the union of the paths of a batch, for access_many
+BATCH_EVICTIONS = {
+    "greedy": Stash.evict_many,
+    "random": Stash.evict_many_random_sample,
+}
 
 
 class PathORAM():
 
-    def __init__(self):
-        self.n_block_number = N_BLOCKS_NUMBER
-        self.z_bucket_size = Z_BUCKET_SIZE
-        self.position_map = PositionMap(N_BLOCKS_NUMBER)
-        self.bucket_tree = BucketTree(N_BLOCKS_NUMBER)
+    def __init__(self, n_block_number=N_BLOCKS_NUMBER, z_bucket_size=Z_BUCKET_SIZE,
+                 tree_engine="object", eviction="greedy", collector=None, position_map="dict",
+                 eviction_policy=None, rng=None, payload_size=None):
+        if isinstance(tree_engine, str) and tree_engine not in TREE_ENGINES:
+            raise ValueError(f"Unknown tree engine {tree_engine}, expected one of {list(TREE_ENGINES)}")
+        if payload_size is not None and tree_engine not in PAYLOAD_ENGINES:
+            raise ValueError(f"A payload size needs one of the tree engines {list(PAYLOAD_ENGINES)}")
+        if eviction not in EVICTIONS:
+            raise ValueError(f"Unknown eviction {eviction}, expected one of {list(EVICTIONS)}")
+        self.n_block_number = n_block_number
+        self.z_bucket_size = z_bucket_size
+        # the name of the tree engine, None when an engine instance is given
+        self.tree_engine = tree_engine if isinstance(tree_engine, str) else None
+        self.eviction = eviction
+        # with a payload_size, the engine keeps the bytes payloads in fixed slots of that many bytes
+        self.payload_size = payload_size
+        # every random draw of the instance: leaves, dummy paths and eviction samples
+        self.rng = rng if rng is not None else RandomSource()
+        # either the name of a position map or an instance, e.g. a RecursivePositionMap
+        if isinstance(position_map, str):
+            if position_map not in POSITION_MAPS:
+                raise ValueError(f"Unknown position map {position_map}, expected one of {list(POSITION_MAPS)}")
+            position_map = POSITION_MAPS[position_map](n_block_number, rng=self.rng)
+        self.position_map = position_map
+        # either the name of a tree engine or an instance, e.g. a MappedBucketTree with its own file
+        if isinstance(tree_engine, str):
+            engine_kwargs = {"payload_size": payload_size} if payload_size is not None else {}
+            tree_engine = TREE_ENGINES[tree_engine](n_block_number, z_bucket_size, **engine_kwargs)
+        self.bucket_tree = tree_engine
         self.l_tree_height = self.bucket_tree.height
-        self.stash : Mapping[int, Block] = {}
+        self.stash : Stash = Stash(self.l_tree_height, rng=self.rng)
         self.stash_blocks_paths_to_root : Mapping[int, List[Bucket]] = {}
-
-    def access(self, block_id, isWrite=False, new_data=None):
-        block_leaf_id : int = self.__remap_block(block_id)
-        self.__read_path_for_block_leaf(block_leaf_id)
+        self.__evict = EVICTIONS[eviction]
+        self.__evict_many = BATCH_EVICTIONS[eviction]
+        # when to evict beyond the path of each access: a policy name, with its default parameters, or an instance
+        if isinstance(eviction_policy, str):
+            if eviction_policy not in EVICTION_POLICIES:
+                raise ValueError(f"Unknown eviction policy {eviction_policy}, expected one of {list(EVICTION_POLICIES)}")
+            eviction_policy = EVICTION_POLICIES[eviction_policy]()
+        self.eviction_policy = eviction_policy
+        # fed with the stash size after every access, e.g. a StashHistogram
+        self.collector = collector
+        # an AccessInstrumentation recording the phases of every access, None to run uninstrumented
+        self.instrumentation = None
+
+    def access(self, block_id, isWrite=False, new_data=None, update=None):
+        # an AccessInstrumentation, when set, is handed a timestamp at the end of every phase
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.begin_access()
+        block_leaf_id, new_block_leaf_id = self.__remap_block(block_id)
+        if instrumentation is not None:
+            instrumentation.mark()
+        # the path is read from the leaf up to level 1, the root bucket is never used
+        path_blocks = self.bucket_tree.read_path(block_leaf_id, top_level=1)
+        if instrumentation is not None:
+            instrumentation.mark()
+        for block in path_blocks:
+            self.stash.add_block(block)
         read_block = self.stash.get(block_id)
+        if read_block is not None:
+            read_block.leaf_id = new_block_leaf_id
+        # read-modify-write in a single access: the new data is computed from the read data
+        if update is not None:
+            isWrite = True
+            new_data = update(read_block.data if read_block is not None else None)
         if isWrite:
-            self.__update_block(block_id, new_data)
-        self.__write_path(block_leaf_id)
+            self.__update_block(block_id, new_data, new_block_leaf_id)
+        stash_before_eviction = len(self.stash)
+        if instrumentation is not None:
+            instrumentation.mark()
+        buckets : List[List[Block]] = self.__evict(self.stash, block_leaf_id, self.z_bucket_size, top_level=1)
+        if instrumentation is not None:
+            instrumentation.mark()
+        self.bucket_tree.write_path(block_leaf_id, buckets, top_level=1)
+        if instrumentation is not None:
+            instrumentation.mark()
+        if self.eviction_policy is not None:
+            self.eviction_policy.after_access(self)
+        if self.collector is not None:
+            self.collector.record(len(self.stash))
+        if instrumentation is not None:
+            instrumentation.end_access(self.stash, block_leaf_id, len(path_blocks), stash_before_eviction, buckets,
+                                       self.z_bucket_size)
         return read_block
 
+    def access_many(self, block_ids, ops=None, new_data=None):
+        # a batch of accesses, ops[i] True to write new_data[i] to block_ids[i]. The union of the paths
+        # is read once, every update is applied in the stash in order, then the stash is evicted level
+        # by level over all the paths, so a bucket shared by several paths is read and written once.
+        # Returns the block read by each access, like access
+        ops = ops if ops is not None else [False] * len(block_ids)
+        new_data = new_data if new_data is not None else [None] * len(block_ids)
+        # the instrumentation records one entry for the whole batch
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.begin_access(len(block_ids))
+        leaves = {}
+        read_leaf_ids : List[int] = []
+        for block_id in block_ids:
+            if block_id in leaves:
+                # a block repeated in the batch reads a random path, so every access reads a path
+                read_leaf_ids.append(self.rng.leaf(self.l_tree_height))
+            else:
+                leaves[block_id] = self.__remap_block(block_id)
+                read_leaf_ids.append(leaves[block_id][0])
+        if instrumentation is not None:
+            instrumentation.mark()
+
+        segments = self.__path_segments(read_leaf_ids)
+        # an engine with read_paths and write_paths, e.g. a RemoteBucketTree, transfers all the
+        # segments of the batch in one request each way
+        if hasattr(self.bucket_tree, "read_paths"):
+            paths_blocks = self.bucket_tree.read_paths(segments)
+        else:
+            paths_blocks = [self.bucket_tree.read_path(leaf_id, top_level=top_level) for leaf_id, top_level in segments]
+        blocks_read = 0
+        for blocks in paths_blocks:
+            for block in blocks:
+                self.stash.add_block(block)
+            blocks_read += len(blocks)
+        if instrumentation is not None:
+            instrumentation.mark()
+
+        read_blocks = []
+        for block_id, isWrite, data in zip(block_ids, ops, new_data):
+            new_block_leaf_id = leaves[block_id][1]
+            read_block = self.stash.get(block_id)
+            if read_block is not None:
+                read_block.leaf_id = new_block_leaf_id
+            if isWrite:
+                self.__update_block(block_id, data, new_block_leaf_id)
+            read_blocks.append(read_block)
+        stash_before_eviction = len(self.stash)
+        if instrumentation is not None:
+            instrumentation.mark()
+
+        buckets = self.__evict_many(self.stash, set(read_leaf_ids), self.z_bucket_size, top_level=1)
+        if instrumentation is not None:
+            instrumentation.mark()
+        paths_buckets = [[
+            buckets.get((level, leaf_id >> (self.l_tree_height - level)), [])
+            for level in range(self.l_tree_height, top_level - 1, -1)
+        ] for leaf_id, top_level in segments]
+        if hasattr(self.bucket_tree, "write_paths"):
+            self.bucket_tree.write_paths(segments, paths_buckets)
+        else:
+            for (leaf_id, top_level), path_buckets in zip(segments, paths_buckets):
+                self.bucket_tree.write_path(leaf_id, path_buckets, top_level=top_level)
+        if instrumentation is not None:
+            instrumentation.mark()
+
+        for _ in block_ids:
+            if self.eviction_policy is not None:
+                self.eviction_policy.after_access(self)
+            if self.collector is not None:
+                self.collector.record(len(self.stash))
+        if instrumentation is not None:
+            instrumentation.end_batch(self.stash, read_leaf_ids, blocks_read, stash_before_eviction, buckets,
+                                      sum(self.l_tree_height - top_level + 1 for _, top_level in segments),
+                                      self.z_bucket_size)
+        return read_blocks
+
+    def __path_segments(self, leaf_ids):
+        # (leaf id, top level) of the part of each path below the buckets of the paths before it,
+        # paths entirely covered by the ones before are left out
+        seen = set()
+        segments = []
+        for leaf_id in leaf_ids:
+            level = self.l_tree_height
+            while level >= 1 and (level, leaf_id >> (self.l_tree_height - level)) not in seen:
+                seen.add((level, leaf_id >> (self.l_tree_height - level)))
+                level -= 1
+            if level < self.l_tree_height:
+                segments.append((leaf_id, level + 1))
+        return segments
+
+    def replay(self, chunks):
+        # runs a workload of oram.simulation.workloads, a write stores the block id as the data
+        for block_id, is_write in iter_accesses(chunks):
+            self.access(block_id, isWrite=is_write, new_data=block_id)
+
+    def evict_path(self, block_leaf_id):
+        # read a path into the stash and write it back, evicting the stash along it
+        self.__read_path_for_block_leaf(block_leaf_id)
+        self.__write_path(block_leaf_id)
+
+    def dummy_access(self):
+        # a uniformly random path, which the server cannot tell from an access
+        self.evict_path(self.rng.leaf(self.l_tree_height))
+
     def __remap_block(self, block_id):
-        block_leaf_id : int = self.position_map.get_leaf_index(block_id)
-        self.position_map.update_position(block_id)
-        return block_leaf_id
+        return self.position_map.remap(block_id)
 
     def __read_path_for_block_leaf(self, block_leaf_id):
-        # get leaf from the block leaf id
-        bucket : Bucket = self.bucket_tree.leaf_map.get(block_leaf_id)
-        # climb tree to the root using for cycle
-        for j in range(self.l_tree_height):
-            for block in bucket.get_blocks():
-                if not block.is_dummy:
-                    # add the block to the stash
-                    self.stash[block.block_id] = block
-            bucket.do_empty()
-            if bucket.parent is None:
-                break
-            bucket = bucket.parent
-
-    def __update_block(self, block_id, new_data):
+        # the path is read from the leaf up to level 1, the root bucket is never used
+        for block in self.bucket_tree.read_path(block_leaf_id, top_level=1):
+            # add the block to the stash
+            self.stash.add_block(block)
+
+    def __update_block(self, block_id, new_data, leaf_id):
         # create a new block with the new data
-        new_block = Block(is_dummy=False, data=new_data, block_id=block_id)
+        new_block = Block(is_dummy=False, data=new_data, block_id=block_id, leaf_id=leaf_id)
         # update the block in the stash
-        self.stash[block_id] = new_block
+        self.stash.add_block(new_block)
 
     def __write_path(self, block_leaf_id):
-        # get leaf node from the block leaf id
-        bucket : Bucket = self.bucket_tree.leaf_map.get(block_leaf_id)
-        temp_stash: Mapping[int, Block] = {}
-        second_temp_stash: Mapping[int, Block] = {}
-        # climb the tree to the root
-        for j in range(self.l_tree_height, 0, -1):
-
-            # put in temp_stash the blocks that can be written at the level from the stash
-            for block_id, block in self.stash.items():
-                temp_block_leaf_id = self.position_map.get_leaf_index(block_id)
-                if self.__check_path_intersection(bucket, temp_block_leaf_id, j):
-                    temp_stash[block_id] = block
-
-            min_size = min(self.z_bucket_size, len(temp_stash))
-            # randomly sample the blocks ids if more than the bucket capacity
-            sampled_blocks : List[int] = rand.sample(list(temp_stash.keys()), min_size)
-
-            for block_id in sampled_blocks:
-                second_temp_stash[block_id] = temp_stash[block_id]
-
-            # write the blocks to the bucket
-            self.__write_bucket(bucket, second_temp_stash)
-            # remove the blocks from the stash
-            temp_stash = {}
-            second_temp_stash = {}
-            bucket = bucket.parent
-
-
-    def __check_path_intersection(self, bucket, temp_block_leaf_id, level):
-        temp_bucket : Bucket = self.bucket_tree.get_bucket_from_leaf_and_level(temp_block_leaf_id, level)
-        return bucket == temp_bucket
-
-    def __write_bucket(self, bucket : Bucket, temp_stash):
-        # add the blocks from the temp stash to the bucket
-        for block in temp_stash.values():
-            try:
-                bucket.add_block(block)
-            except ValueError:
-                break
-            # Remove the block from the stash
-            self.stash.pop(block.block_id)
+        # take the blocks of each bucket from the leaf up to level 1 out of the stash
+        buckets : List[List[Block]] = self.__evict(self.stash, block_leaf_id, self.z_bucket_size, top_level=1)
+        # write the blocks to the buckets
+        self.bucket_tree.write_path(block_leaf_id, buckets, top_level=1)
 
 
 if __name__ == "__main__":
-    path_oram = PathORAM()
+    parser = argparse.ArgumentParser(description="Path ORAM stash size simulation")
+    parser.add_argument("--workload", default="sequential", choices=list(WORKLOADS),
+                        help="access pattern of the simulation phase")
+    parser.add_argument("--write-ratio", type=float, default=0.0)
+    parser.add_argument("--skew", type=float, default=0.99, help="Zipf skew")
+    parser.add_argument("--hot-fraction", type=float, default=0.1)
+    parser.add_argument("--hot-probability", type=float, default=0.9)
+    parser.add_argument("--trace", default=None, help="trace file of the trace workload")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the workload")
+    args = parser.parse_args()
 
     warmup_access_number = 50_000
     simulation_access_number = 50_000
     total_accesses = warmup_access_number + simulation_access_number
-
-    stash_size_map : List[int] = [0] * (N_BLOCKS_NUMBER + 1)
-
-    # Warm-up phase
-    print("Starting warm-up phase...")
-    for i in tqdm(range(warmup_access_number), desc="Warming up", unit="iteration"):
-        block_id = i % N_BLOCKS_NUMBER
-        output_block = path_oram.access(block_id, isWrite=True, new_data=block_id)
-
-    max_stash_size : int = 0
-    s : List[int] = [0] * (N_BLOCKS_NUMBER + 1)
-
-    # Simulation phase (Data Collection)
-    print("Starting simulation phase...")
-    for i in tqdm(range(simulation_access_number), desc="Simulating", unit="iteration"):
-        block_id = i % N_BLOCKS_NUMBER
-        output_block = path_oram.access(block_id, isWrite=False, new_data=block_id)
-        #print(output_block)
-        current_stash_size = len(path_oram.stash)
-        max_stash_size = max(max_stash_size, current_stash_size)
-        # counts the number of accesses with a given stash size
-        stash_size_map[current_stash_size] = stash_size_map[current_stash_size] + 1
-
-    # Compute s_i (the cumulative counts of stash sizes ≥ i)
-    s = [0] * (max_stash_size + 1)
-    for i in range(max_stash_size + 1):
-        s[i] = sum(stash_size_map[i:])
-
-    # Write data to text file
-    output_filename = "oram_stash_data.txt"
-    with open(output_filename, "w") as f:
-        # First line: -1, total number of simulation accesses
-        f.write(f"-1,{simulation_access_number}\n")
-        # Subsequent lines: i, s_i
-        for i in range(max_stash_size + 1):
-            f.write(f"{i},{s[i]}\n")
-
-    print(f"Data collection complete. Results written to {output_filename}.")
-
-    # Compute probabilities (excluding the stash size of 0)
-    prob = [(s_i / simulation_access_number) * 100 for s_i in s[1:]]
-
-    # Create the range for the X-axis (from 1 to max_stash_size)
-    x_values = np.arange(1, max_stash_size + 1)
-
-    # Create bar plot with specified probabilities
-    bars = plt.bar(x_values, prob, color='blue', edgecolor='black')
-
-    # Set x-axis ticks to be integers
-    plt.xticks(x_values)
-
-    if Z_BUCKET_SIZE >= 4:
-
-        # Add percentage labels on top of each bar
-        for bar, percentage in zip(bars, prob):
-            height = bar.get_height()
-            plt.text(
-                bar.get_x() + bar.get_width() / 2,
-                height + 0.5,  # Adjust the position slightly above the bar
-                f'{percentage:.2f}%',
-                ha='center',
-                va='bottom',
-                fontsize=8
-            )
-
-        # Add title and labels
-        plt.title(f'PORAM Simulation for Z={Z_BUCKET_SIZE}')
-        plt.xlabel('Required Stash Size')
-        plt.ylabel('P[Stash Size ≥ Required Stash Size] (%)')
-
-        # Adjust layout to prevent clipping of ylabel
-        plt.tight_layout()
-
-        # Save the histogram as an image
-        plt.savefig('histogram_image.png')
-
-        # Show the plot
-        plt.show()
-
-        # Optionally, print final stash statistics
-        print("Final Stash Size:", len(path_oram.stash))
-        print("Percentage of blocks in the stash:", len(path_oram.stash) / N_BLOCKS_NUMBER * 100)
-
+    workload_params = {
+        "zipf": {"skew": args.skew},
+        "hot_cold": {"hot_fraction": args.hot_fraction, "hot_probability": args.hot_probability},
+        "trace": {"filename": args.trace},
+    }.get(args.workload, {})
+    if args.workload != "trace":
+        workload_params["write_ratio"] = args.write_ratio
+
+    from oram.client.snapshot import load_snapshot, save_snapshot
+
+    # the histogram is checkpointed to output_filename while the simulation runs,
+    # together with a snapshot of the ORAM in state_filename to resume an interrupted run
+    suffix = "" if args.workload == "sequential" else f"_{args.workload}"
+    output_filename = f"oram_stash_data{suffix}.txt"
+    state_filename = f"oram_state{suffix}.snap"
+    # the warmed-up ORAM is kept so later runs with the same parameters skip the warm-up
+    warmup_filename = f"oram_warmup_N{N_BLOCKS_NUMBER}_Z{Z_BUCKET_SIZE}.snap"
+
+    if os.path.exists(state_filename):
+        path_oram = load_snapshot(state_filename)
+        print(f"Resuming simulation phase after {path_oram.collector.total} accesses...")
+    elif os.path.exists(warmup_filename):
+        # a new measurement run forked from the saved warm-up, with fresh randomness
+        path_oram = load_snapshot(warmup_filename, restore_random_state=False)
+        print(f"Loaded warm-up phase from {warmup_filename}")
+        path_oram.collector = StashHistogram(output_filename)
     else:
-        # Compute probabilities (excluding the stash size of 0)
-        prob = [(s_i / simulation_access_number) * 100 for s_i in s[1:]]
-
-        # Create the range for the X-axis (from 1 to max_stash_size)
-        x_values = np.arange(1, max_stash_size + 1)
-
-        # Check that x_values and prob have the same length
-        print("Length of x_values:", len(x_values))
-        print("Length of prob:", len(prob))
-
-        # Adjust x-axis ticks to reduce clutter
-        tick_step = 10  # Adjust this value based on your data
-        plt.xticks(np.arange(0, max_stash_size + 1, step=tick_step))
-
-        # Optionally, apply a moving average to smooth the data
-        window_size = 5  # Adjust window size as needed
-        if len(prob) >= window_size:
-            prob_smoothed = np.convolve(prob, np.ones(window_size) / window_size, mode='valid')
-            x_values_smoothed = x_values[:len(prob_smoothed)]
-        else:
-            prob_smoothed = prob
-            x_values_smoothed = x_values
-
-        # Create a larger figure for better readability
-        plt.figure(figsize=(12, 6))
-
-        # Create line plot with specified probabilities
-        plt.plot(x_values_smoothed, prob_smoothed, marker='o', color='blue', linestyle='-')
-
-        # Set x-axis limits to focus on the most relevant data range (optional)
-        # plt.xlim([xmin, xmax])  # Uncomment and set xmin and xmax as needed
-
-        # Add title and labels
-        plt.title(f'PORAM Simulation for Z={Z_BUCKET_SIZE}')
-        plt.xlabel('Required Stash Size')
-        plt.ylabel('P[Stash Size ≥ Required Stash Size] (%)')
-
-        # Add grid lines for better readability
-        plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-
-        # Adjust layout to prevent clipping of ylabel
-        plt.tight_layout()
-
-        # Save the plot as an image
-        plt.savefig('line_plot_image.png', dpi=300)  # Increase dpi for better quality
-
-        # Show the plot
-        plt.show()
-
-        # Optionally, print max stash statistics
-        print("Max Stash Size:", max_stash_size)
-        print("Percentage of blocks in the stash:", (max_stash_size / N_BLOCKS_NUMBER) * 100)
+        path_oram = PathORAM()
+
+        # Warm-up phase: every block is written by a sequential scan
+        print("Starting warm-up phase...")
+        warmup = make_workload("sequential", N_BLOCKS_NUMBER, warmup_access_number, write_ratio=1.0)
+        for block_id, is_write in tqdm(iter_accesses(warmup), total=warmup_access_number, desc="Warming up",
+                                       unit="iteration"):
+            output_block = path_oram.access(block_id, isWrite=is_write, new_data=block_id)
+
+        save_snapshot(path_oram, warmup_filename)
+        path_oram.collector = StashHistogram(output_filename)
+
+    collector : StashHistogram = path_oram.collector
+    collector.state_writer = lambda: save_snapshot(path_oram, state_filename)
+
+    # Simulation phase (Data Collection), the workload is replayed from where an interrupted run stopped
+    print(f"Starting simulation phase with the {args.workload} workload...")
+    workload = make_workload(args.workload, N_BLOCKS_NUMBER, simulation_access_number, args.seed, **workload_params)
+    for block_id, is_write in tqdm(iter_accesses(skip_accesses(workload, collector.total)),
+                                   initial=collector.total, total=simulation_access_number,
+                                   desc="Simulating", unit="iteration"):
+        output_block = path_oram.access(block_id, isWrite=is_write, new_data=block_id)
+
+    # the run is complete, only the histogram is kept
+    collector.state_writer = None
+    collector.checkpoint()
+    if os.path.exists(state_filename):
+        os.remove(state_filename)
+    print(f"Data collection complete. Results written to {output_filename}.")
+    rows = summarize({f"N={N_BLOCKS_NUMBER}, Z={Z_BUCKET_SIZE}": np.asarray(collector.stash_size_map, dtype=np.int64)})
+    print(format_summary(rows))
+    print(f"Final stash size: {len(path_oram.stash)}")
+    print(f"Plot the tail with: python -m oram.simulation.analysis {output_filename}")
@@ -1,38 +1,136 @@
-import random
+from array import array
 from math import ceil, log2
 from typing import Mapping
 
+import numpy as np
+
+from oram.client.rng import RandomSource
+
 
 class PositionMap:
-    def __init__(self, n_block_number):
+    def __init__(self, n_block_number, rng=None):
         self.height = ceil(log2(n_block_number))
         self.num_leaves = pow(2, self.height)
+        # the RandomSource of the ORAM, a fresh unseeded one when None
+        self.rng = rng if rng is not None else RandomSource()
         self.position : Mapping[int, int] = {} # block_id -> leaf_index
         self.__initialize_position_map(n_block_number)
 
     def __initialize_position_map(self, num_blocks):
-        # Assign each block a random leaf node index initially
-        for block_id in range(0, num_blocks):
-            leaf_index = random.randint(0, self.num_leaves - 1)
-            self.position[block_id] = leaf_index
+        # Assign each block a random leaf node index initially, all drawn at once
+        self.load_array(self.rng.leaves(self.height, num_blocks))
 
     def get_leaf_index(self, block_id):
         return self.position.get(block_id)
 
     def update_position(self, block_id):
         # Assign a new random leaf index to the block
-        new_leaf_index = random.randint(0, self.num_leaves - 1)
+        new_leaf_index = self.rng.leaf(self.height)
         self.position[block_id] = new_leaf_index
         return new_leaf_index
 
+    def remap(self, block_id):
+        # old and new leaf index of the block
+        return self.get_leaf_index(block_id), self.update_position(block_id)
+
+    def to_array(self):
+        return np.fromiter((self.position[block_id] for block_id in range(len(self.position))),
+                           dtype=np.int64, count=len(self.position))
+
+    def load_array(self, leaves):
+        self.position = dict(enumerate(np.asarray(leaves).tolist()))
+
     def print_position_map(self):
         for block_id, leaf_index in self.position.items():
             print(f"Block ID: {block_id}, Leaf Index: {leaf_index}")
 
+    def __len__(self):
+        return len(self.position)
+
     def __str__(self):
         # print all the block ids and their leaf index
         return f"PositionMap: {self.position}"
 
+
+class PackedPositionMap:
+    # Same interface as PositionMap, with the leaf indexes packed in ceil(log2 N) bits each
+    # into 64-bit words. The words live in an array.array, whose items read back as plain ints.
+
+    WORD_BITS = 64
+
+    def __init__(self, n_block_number, rng=None):
+        self.height = ceil(log2(n_block_number))
+        self.num_leaves = pow(2, self.height)
+        self.n_block_number = n_block_number
+        self.width = max(self.height, 1)
+        self.__mask = (1 << self.width) - 1
+        # new leaves come from the pre-drawn buffer of the RandomSource
+        self.rng = rng if rng is not None else RandomSource()
+        self.load_array(self.rng.leaves(self.height, n_block_number))
+
+    def get_leaf_index(self, block_id):
+        offset = block_id * self.width
+        word, shift = offset >> 6, offset & 63
+        leaf_index = self.__words[word] >> shift
+        if shift + self.width > self.WORD_BITS:
+            leaf_index |= self.__words[word + 1] << (self.WORD_BITS - shift)
+        return leaf_index & self.__mask
+
+    def update_position(self, block_id):
+        return self.remap(block_id)[1]
+
+    def remap(self, block_id):
+        # old and new leaf index of the block, reading and writing its bits in place
+        new_leaf_index = self.rng.leaf(self.height)
+        words, mask, width = self.__words, self.__mask, self.width
+        offset = block_id * width
+        word, shift = offset >> 6, offset & 63
+        value = words[word]
+        leaf_index = value >> shift
+        words[word] = (value & ~(mask << shift) | (new_leaf_index << shift)) & 0xFFFFFFFFFFFFFFFF
+        if shift + width > self.WORD_BITS:
+            high_shift = self.WORD_BITS - shift
+            value = words[word + 1]
+            leaf_index |= value << high_shift
+            words[word + 1] = value & ~(mask >> high_shift) | (new_leaf_index >> high_shift)
+        return leaf_index & mask, new_leaf_index
+
+    def __bit_positions(self):
+        offsets = np.arange(self.n_block_number, dtype=np.uint64) * np.uint64(self.width)
+        return (offsets >> np.uint64(6)).astype(np.int64), offsets & np.uint64(63)
+
+    def to_array(self):
+        words = np.frombuffer(self.__words, dtype=np.uint64)
+        word, shift = self.__bit_positions()
+        leaves = words[word] >> shift
+        # entries that continue in the next word, shift is never 0 for them
+        straddling = shift + np.uint64(self.width) > np.uint64(self.WORD_BITS)
+        leaves[straddling] |= words[word[straddling] + 1] << (np.uint64(self.WORD_BITS) - shift[straddling])
+        return (leaves & np.uint64(self.__mask)).astype(np.int64)
+
+    def load_array(self, leaves):
+        leaves = np.asarray(leaves).astype(np.uint64)
+        word, shift = self.__bit_positions()
+        # one spare word so the last entry can always straddle
+        words = np.zeros((self.n_block_number * self.width) // self.WORD_BITS + 2, dtype=np.uint64)
+        if self.n_block_number:
+            # entries never overlap, so OR-ing the low parts of each word packs them
+            low = leaves << shift
+            starts = np.flatnonzero(np.r_[True, word[1:] != word[:-1]])
+            words[word[starts]] |= np.bitwise_or.reduceat(low, starts)
+            straddling = shift + np.uint64(self.width) > np.uint64(self.WORD_BITS)
+            words[word[straddling] + 1] |= leaves[straddling] >> (np.uint64(self.WORD_BITS) - shift[straddling])
+        self.__words = array("Q", words.tobytes())
+
+    def memory_bytes(self):
+        return self.__words.buffer_info()[1] * self.__words.itemsize
+
+    def __len__(self):
+        return self.n_block_number
+
+    def __str__(self):
+        return f"PackedPositionMap(blocks={self.n_block_number}, bits={self.width}, bytes={self.memory_bytes()})"
+
 if __name__ == "__main__":
     position_map = PositionMap(8)
     block_id = 1
@@ -42,4 +140,12 @@ if __name__ == "__main__":
     new_leaf_index = position_map.update_position(block_id)
     print(f"=====================================")
     print(position_map)
-    position_map.print_position_map()
\ No newline at end of file
+    position_map.print_position_map()
+
+    packed_position_map = PackedPositionMap(1000)
+    leaves = packed_position_map.to_array()
+    for block_id in range(0, 1000, 7):
+        leaves[block_id] = packed_position_map.update_position(block_id)
+    if any(packed_position_map.get_leaf_index(block_id) != leaf for block_id, leaf in enumerate(leaves.tolist())):
+        raise AssertionError("Packed position map does not match")
+    print(packed_position_map)
\ No newline at end of file
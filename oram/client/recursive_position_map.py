@@ -0,0 +1,158 @@
+import argparse
+from math import ceil, log2
+from typing import List
+
+from tqdm import tqdm
+
+from oram.client.path_oram import PathORAM
+from oram.client.position_map import PositionMap
+from oram.client.rng import RandomSource
+from oram.constants import Z_BUCKET_SIZE, N_BLOCKS_NUMBER
+
+
+class RecursivePositionMap:
+    # Position map of n_block_number blocks stored in a smaller PathORAM: each of its blocks
+    # packs the leaf indexes of packing_factor consecutive blocks. That ORAM has its own
+    # position map, recursive again until it has at most base_size blocks. Every level of the
+    # recursion draws from its own child of rng.
+
+    def __init__(self, n_block_number, packing_factor=8, base_size=64,
+                 z_bucket_size=Z_BUCKET_SIZE, tree_engine="object", rng=None):
+        if packing_factor < 2:
+            raise ValueError("Packing factor must be at least 2")
+        self.height = ceil(log2(n_block_number))
+        self.num_leaves = pow(2, self.height)
+        self.n_block_number = n_block_number
+        self.packing_factor = packing_factor
+        self.rng, oram_rng = (rng if rng is not None else RandomSource()).spawn(2)
+        n_position_blocks = ceil(n_block_number / packing_factor)
+        if n_position_blocks <= base_size:
+            inner_position_map = PositionMap(n_position_blocks, rng=oram_rng)
+        else:
+            inner_position_map = RecursivePositionMap(n_position_blocks, packing_factor, base_size,
+                                                      z_bucket_size, tree_engine, rng=oram_rng)
+        self.oram = PathORAM(n_position_blocks, z_bucket_size, tree_engine=tree_engine,
+                             position_map=inner_position_map, rng=oram_rng)
+
+    def remap(self, block_id):
+        position_block_id, offset = divmod(block_id, self.packing_factor)
+        new_leaf_index = self.rng.leaf(self.height)
+        old_leaf_index : List[int] = []
+
+        def update(leaves):
+            if leaves is None:
+                # first access to the position block: its blocks get their initial random leaves
+                leaves = self.rng.leaves(self.height, self.packing_factor).tolist()
+            leaves = list(leaves)
+            old_leaf_index.append(leaves[offset])
+            leaves[offset] = new_leaf_index
+            return leaves
+
+        self.oram.access(position_block_id, update=update)
+        return old_leaf_index[0], new_leaf_index
+
+    def get_leaf_index(self, block_id):
+        position_block_id, offset = divmod(block_id, self.packing_factor)
+        leaves : List[int] = []
+
+        def update(data):
+            if data is None:
+                data = self.rng.leaves(self.height, self.packing_factor).tolist()
+            leaves.extend(data)
+            return data
+
+        self.oram.access(position_block_id, update=update)
+        return leaves[offset]
+
+    def update_position(self, block_id):
+        return self.remap(block_id)[1]
+
+    def to_array(self):
+        raise ValueError("Snapshots of recursive position maps are not supported")
+
+    def load_array(self, leaves):
+        raise ValueError("Snapshots of recursive position maps are not supported")
+
+    def orams(self):
+        # the position ORAMs from the largest to the smallest, and the base position map
+        orams : List[PathORAM] = []
+        position_map = self
+        while isinstance(position_map, RecursivePositionMap):
+            orams.append(position_map.oram)
+            position_map = position_map.oram.position_map
+        return orams, position_map
+
+
+def recursive_path_oram(n_block_number=N_BLOCKS_NUMBER, z_bucket_size=Z_BUCKET_SIZE, packing_factor=8,
+                        base_size=64, tree_engine="object", rng=None, **kwargs):
+    rng = rng if rng is not None else RandomSource()
+    position_map = RecursivePositionMap(n_block_number, packing_factor, base_size, z_bucket_size, tree_engine,
+                                        rng=rng.spawn(1)[0])
+    return PathORAM(n_block_number, z_bucket_size, tree_engine=tree_engine, position_map=position_map, rng=rng,
+                    **kwargs)
+
+
+def recursion_report(path_oram, max_stash_sizes=None):
+    # one row per recursion depth: depth 0 is the data ORAM, the last row is the base position map.
+    # Blocks moved per access count the real and dummy blocks of the path read and written back.
+    orams = [path_oram]
+    base_position_map = path_oram.position_map
+    if isinstance(base_position_map, RecursivePositionMap):
+        position_orams, base_position_map = base_position_map.orams()
+        orams.extend(position_orams)
+
+    rows = []
+    for depth, oram in enumerate(orams):
+        path_buckets = oram.l_tree_height
+        rows.append({
+            "depth": depth,
+            "blocks": oram.n_block_number,
+            # a position block packs leaf indexes of the ORAM one depth above, by that ORAM's position map factor
+            "block_bits": None if depth == 0 else
+            orams[depth - 1].position_map.packing_factor * orams[depth - 1].l_tree_height,
+            "server_blocks": (pow(2, oram.l_tree_height + 1) - 1) * oram.z_bucket_size,
+            "blocks_moved_per_access": 2 * path_buckets * oram.z_bucket_size,
+            "client_stash_blocks": len(oram.stash) if max_stash_sizes is None else max_stash_sizes[depth],
+            "client_map_entries": 0,
+        })
+    rows.append({
+        "depth": len(orams),
+        "blocks": len(base_position_map),
+        "block_bits": None,
+        "server_blocks": 0,
+        "blocks_moved_per_access": 0,
+        "client_stash_blocks": 0,
+        "client_map_entries": len(base_position_map),
+    })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost of recursive Path ORAM for several packing factors")
+    parser.add_argument("--blocks", type=int, default=N_BLOCKS_NUMBER)
+    parser.add_argument("--bucket-size", type=int, default=Z_BUCKET_SIZE)
+    parser.add_argument("--packing-factors", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--base-size", type=int, default=64)
+    parser.add_argument("--accesses", type=int, default=2 * N_BLOCKS_NUMBER)
+    args = parser.parse_args()
+
+    for packing_factor in args.packing_factors:
+        path_oram = recursive_path_oram(args.blocks, args.bucket_size, packing_factor, args.base_size)
+        orams = [path_oram] + path_oram.position_map.orams()[0]
+        max_stash_sizes = [0] * len(orams)
+        for i in tqdm(range(args.accesses), desc=f"Packing factor {packing_factor}", unit="iteration"):
+            path_oram.access(i % args.blocks, isWrite=True, new_data=i)
+            for depth, oram in enumerate(orams):
+                max_stash_sizes[depth] = max(max_stash_sizes[depth], len(oram.stash))
+
+        rows = recursion_report(path_oram, max_stash_sizes)
+        print(f"Packing factor {packing_factor}, leaf index of {path_oram.position_map.height} bits")
+        print(f"{'depth':>5} {'blocks':>8} {'block bits':>10} {'server blocks':>13} "
+              f"{'moved/access':>12} {'max stash':>9} {'map entries':>11}")
+        for row in rows:
+            block_bits = "data" if row["depth"] == 0 else (row["block_bits"] or "-")
+            print(f"{row['depth']:>5} {row['blocks']:>8} {block_bits:>10} {row['server_blocks']:>13} "
+                  f"{row['blocks_moved_per_access']:>12} {row['client_stash_blocks']:>9} {row['client_map_entries']:>11}")
+        print(f"Total blocks moved per access: {sum(row['blocks_moved_per_access'] for row in rows)}")
+        print(f"Client memory: {sum(max_stash_sizes)} stash blocks and {rows[-1]['client_map_entries']} "
+              f"map entries, instead of {args.blocks} map entries")
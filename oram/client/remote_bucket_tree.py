@@ -0,0 +1,177 @@
+import queue
+import socket
+from collections import deque
+from contextlib import contextmanager
+from typing import List
+
+from oram.server.block import Block
+from oram.server.remote_server import (
+    COUNT, FRAME, OP_EXPORT, OP_IMPORT, OP_INFO, OP_READ_PATH, OP_READ_PATHS, OP_WRITE_PATH,
+    OP_WRITE_PATHS, PATH_REQUEST, STATUS_OK, TREE_INFO, decode_arrays, decode_blocks, encode_arrays, encode_buckets,
+)
+
+
+class RemoteError(Exception):
+    pass
+
+
+class Connection:
+
+    def __init__(self, address):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        if family != socket.AF_UNIX:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.socket.makefile("rb")
+        # request ids sent on this connection whose response has not been read yet, oldest first
+        self.pending = deque()
+        self.next_request_id = 0
+
+    def send(self, op, chunks):
+        body_length = sum(len(chunk) for chunk in chunks)
+        request_id = self.next_request_id
+        self.next_request_id = (self.next_request_id + 1) % pow(2, 32)
+        message = b"".join([FRAME.pack(op, request_id, body_length), *chunks])
+        self.socket.sendall(message)
+        self.pending.append(request_id)
+        return request_id, len(message)
+
+    def receive(self):
+        header = self.reader.read(FRAME.size)
+        if len(header) < FRAME.size:
+            raise RemoteError("Connection closed by the server")
+        status, request_id, body_length = FRAME.unpack(header)
+        # a writable buffer, the exported arrays are views of it
+        body = bytearray(body_length)
+        if self.reader.readinto(body) < body_length:
+            raise RemoteError("Connection closed by the server")
+        expected_request_id = self.pending.popleft()
+        if request_id != expected_request_id:
+            raise RemoteError(f"Response to request {request_id}, expected {expected_request_id}")
+        if status != STATUS_OK:
+            raise RemoteError(body.decode())
+        return request_id, body, FRAME.size + body_length
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+class RemoteBucketTree():
+    # Bucket tree engine forwarding every path to a server process (oram.server.remote_server).
+    # Block payloads must be bytes, or None, e.g. the ciphertexts of an EncryptedBucketTree.
+    # With pipelining, write_path returns without waiting for the server: its response is read
+    # together with the one of the next read_path, so an access costs one round trip instead of two.
+
+    def __init__(self, address, pool_size=1, pipelined=True):
+        self.address = address
+        self.pipelined = pipelined
+        self.__pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.__pool.put(Connection(address))
+
+        self.round_trips = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+        self.height, self.z_max_size = TREE_INFO.unpack(self.__call(OP_INFO, []))
+        self.num_leaves = pow(2, self.height)
+        self.num_buckets = 2 * self.num_leaves - 1
+
+    @contextmanager
+    def __connection(self):
+        # last in, first out: a single client keeps getting the connection holding its pending writes,
+        # so the requests of one thread stay ordered
+        connection = self.__pool.get()
+        try:
+            yield connection
+        finally:
+            self.__pool.put(connection)
+
+    def __send(self, connection, op, chunks):
+        request_id, sent = connection.send(op, chunks)
+        self.requests += 1
+        self.bytes_sent += sent
+        return request_id
+
+    def __wait(self, connection, request_id):
+        # one round trip: the responses of the pipelined requests sent before arrive first
+        self.round_trips += 1
+        while True:
+            received_id, body, received = connection.receive()
+            self.bytes_received += received
+            if received_id == request_id:
+                return body
+
+    def __call(self, op, chunks, wait=True):
+        with self.__connection() as connection:
+            request_id = self.__send(connection, op, chunks)
+            if wait:
+                return self.__wait(connection, request_id)
+
+    def read_path(self, leaf_id, top_level=0):
+        body = self.__call(OP_READ_PATH, [PATH_REQUEST.pack(leaf_id, top_level)])
+        return decode_blocks(body, 0)[0]
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        chunks = encode_buckets(buckets, [PATH_REQUEST.pack(leaf_id, top_level)])
+        self.__call(OP_WRITE_PATH, chunks, wait=not self.pipelined)
+
+    def read_paths(self, segments):
+        # the real blocks of several paths in a single round trip, one list per (leaf id, top level)
+        chunks = [COUNT.pack(len(segments))]
+        chunks.extend(PATH_REQUEST.pack(leaf_id, top_level) for leaf_id, top_level in segments)
+        body = self.__call(OP_READ_PATHS, chunks)
+        paths : List[List[Block]] = []
+        offset = 0
+        for _ in segments:
+            blocks, offset = decode_blocks(body, offset)
+            paths.append(blocks)
+        return paths
+
+    def write_paths(self, segments, paths_buckets):
+        # paths are written in the given order, a bucket shared by two paths keeps the last write
+        chunks = [COUNT.pack(len(segments))]
+        for (leaf_id, top_level), buckets in zip(segments, paths_buckets):
+            chunks.append(PATH_REQUEST.pack(leaf_id, top_level))
+            encode_buckets(buckets, chunks)
+        self.__call(OP_WRITE_PATHS, chunks, wait=not self.pipelined)
+
+    def flush(self):
+        # wait for the responses of every pipelined write, raising the error of a failed one
+        connections = [self.__pool.get() for _ in range(self.__pool.qsize())]
+        try:
+            for connection in connections:
+                if connection.pending:
+                    self.__wait(connection, connection.pending[-1])
+        finally:
+            for connection in reversed(connections):
+                self.__pool.put(connection)
+
+    def is_on_path(self, block_leaf_id, path_leaf_id, level):
+        shift_amount = self.height - level
+        return (block_leaf_id >> shift_amount) == (path_leaf_id >> shift_amount)
+
+    def export_arrays(self):
+        return decode_arrays(self.__call(OP_EXPORT, []))
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        self.__call(OP_IMPORT, encode_arrays(block_ids, leaf_ids, payloads, []))
+
+    def network_stats(self):
+        return {
+            "round_trips": self.round_trips,
+            "requests": self.requests,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+    def close(self):
+        self.flush()
+        while not self.__pool.empty():
+            self.__pool.get().close()
+
+    def __str__(self):
+        return f"RemoteBucketTree(address={self.address}, height={self.height}, z={self.z_max_size})"
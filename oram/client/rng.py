@@ -0,0 +1,170 @@
+import argparse
+import os
+import random as rand
+import time
+from math import ceil, log2
+from typing import List
+
+import numpy as np
+
+WORD_BITS = 64
+
+
+class RandomSource:
+    # Random numbers of one ORAM instance. Draws come from a buffer of 64-bit words filled
+    # buffer_size at a time, from a PCG64 generator seeded by a numpy SeedSequence, or from
+    # os.urandom in secure mode. spawn splits the seed into independent child sources, e.g. one
+    # per worker of a parallel run. A leaf of a tree of height h is the top h bits of a word, and
+    # a number below a bound is (word * bound) >> 64, whose bias is below bound / 2^64.
+
+    def __init__(self, seed=None, secure=False, buffer_size=4096):
+        if buffer_size < 1:
+            raise ValueError("Buffer size must be at least 1")
+        self.secure = secure
+        self.buffer_size = buffer_size
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.generator = None if secure else np.random.Generator(np.random.PCG64(self.seed_sequence))
+        self.__words : List[int] = []
+
+    def spawn(self, count):
+        return [RandomSource(seed_sequence, self.secure, self.buffer_size)
+                for seed_sequence in self.seed_sequence.spawn(count)]
+
+    def words(self, count):
+        # count random 64-bit words as a uint64 array, outside the buffer
+        if self.secure:
+            return np.frombuffer(os.urandom(8 * count), dtype=np.uint64)
+        return self.generator.integers(0, 1 << WORD_BITS, size=count, dtype=np.uint64, endpoint=False)
+
+    def __next_word(self):
+        if not self.__words:
+            self.__words = self.words(self.buffer_size).tolist()
+        return self.__words.pop()
+
+    def leaf(self, height):
+        # a uniform leaf id of a tree of the given height
+        return self.__next_word() >> (WORD_BITS - height) if height else 0
+
+    def leaves(self, height, count):
+        # count uniform leaf ids as an int64 array, drawn in one go
+        if not height:
+            return np.zeros(count, dtype=np.int64)
+        return (self.words(count) >> np.uint64(WORD_BITS - height)).astype(np.int64)
+
+    def randbelow(self, bound):
+        return (self.__next_word() * bound) >> WORD_BITS
+
+    def randint(self, a, b):
+        return a + self.randbelow(b - a + 1)
+
+    def sample(self, population, k):
+        # k distinct elements of population by Floyd's algorithm, one draw per element
+        n = len(population)
+        if not 0 <= k <= n:
+            raise ValueError("Sample larger than population or is negative")
+        words = self.__words
+        if len(words) < k:
+            words.extend(self.words(max(self.buffer_size, k)).tolist())
+        selected = set()
+        for j in range(n - k, n):
+            index = (words.pop() * (j + 1)) >> WORD_BITS
+            selected.add(j if index in selected else index)
+        return [population[index] for index in selected]
+
+    def getstate(self):
+        bit_generator_state = None if self.secure else self.generator.bit_generator.state
+        return bit_generator_state, list(self.__words)
+
+    def setstate(self, state):
+        bit_generator_state, words = state
+        if bit_generator_state is not None:
+            self.generator.bit_generator.state = bit_generator_state
+        self.__words = list(words)
+
+    def __str__(self):
+        return f"RandomSource({'secure' if self.secure else 'pcg64'}, buffer={self.buffer_size})"
+
+
+class GlobalRandomSource:
+    # the interface of RandomSource on the global random module, one Python call per draw as the
+    # ORAM drew its randomness before RandomSource; runs are reproducible only through random.seed
+
+    secure = False
+
+    def spawn(self, count):
+        return [self for _ in range(count)]
+
+    def leaf(self, height):
+        return rand.randint(0, pow(2, height) - 1)
+
+    def leaves(self, height, count):
+        return np.array([rand.randint(0, pow(2, height) - 1) for _ in range(count)], dtype=np.int64)
+
+    def randbelow(self, bound):
+        return rand.randrange(bound)
+
+    def randint(self, a, b):
+        return rand.randint(a, b)
+
+    def sample(self, population, k):
+        return rand.sample(population, k)
+
+    def getstate(self):
+        return rand.getstate()
+
+    def setstate(self, state):
+        rand.setstate(state)
+
+    def __str__(self):
+        return "GlobalRandomSource()"
+
+
+def make_random_source(kind, seed=None):
+    # "global", "pcg64" or "secure"
+    if kind == "global":
+        return GlobalRandomSource()
+    if kind not in ("pcg64", "secure"):
+        raise ValueError(f"Unknown random source {kind}, expected global, pcg64 or secure")
+    return RandomSource(seed, secure=kind == "secure")
+
+
+if __name__ == "__main__":
+    from oram.client.path_oram import PathORAM
+
+    parser = argparse.ArgumentParser(description="Throughput of the random sources")
+    parser.add_argument("--blocks", type=int, default=pow(2, 14))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--engine", default="flat")
+    parser.add_argument("--draws", type=int, default=1_000_000)
+    parser.add_argument("--accesses", type=int, default=50_000)
+    args = parser.parse_args()
+
+    height = ceil(log2(args.blocks))
+    print(f"{'source':>8} {'leaf/s':>12} {'sample/s':>12} {'init leaves/s':>14} {'greedy ops/s':>12} {'random ops/s':>12}")
+    for kind in ("global", "pcg64", "secure"):
+        rng = make_random_source(kind, seed=0)
+        start = time.perf_counter()
+        for _ in range(args.draws):
+            rng.leaf(height)
+        leaf_rate = args.draws / (time.perf_counter() - start)
+        # the draws of the random eviction: Z of a few candidates per level
+        population = range(3 * args.bucket_size)
+        start = time.perf_counter()
+        for _ in range(args.draws // 10):
+            rng.sample(population, args.bucket_size)
+        sample_rate = args.draws // 10 / (time.perf_counter() - start)
+        start = time.perf_counter()
+        rng.leaves(height, args.draws)
+        bulk_rate = args.draws / (time.perf_counter() - start)
+
+        access_rates = []
+        for eviction in ("greedy", "random"):
+            rand.seed(0)
+            path_oram = PathORAM(args.blocks, args.bucket_size, tree_engine=args.engine, eviction=eviction,
+                                 rng=make_random_source(kind, seed=0))
+            start = time.perf_counter()
+            for i in range(args.accesses):
+                path_oram.access(i % args.blocks, isWrite=True, new_data=i)
+            access_rates.append(args.accesses / (time.perf_counter() - start))
+        print(f"{kind:>8} {leaf_rate:>12.0f} {sample_rate:>12.0f} {bulk_rate:>14.0f} "
+              f"{access_rates[0]:>12.1f} {access_rates[1]:>12.1f}")
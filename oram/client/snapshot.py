@@ -0,0 +1,162 @@
+import json
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from oram.client.path_oram import TREE_ENGINES, PathORAM
+from oram.server.block import Block
+
+# file layout: magic, version and header length, a JSON header, then every array as raw
+# little-endian data aligned to ARRAY_ALIGNMENT bytes so it can be memory mapped in place,
+# then one pickled section with the Python objects (payloads, random source, collector, eviction policy)
+SNAPSHOT_MAGIC = b"PORAMSNP"
+SNAPSHOT_VERSION = 1
+ARRAY_ALIGNMENT = 64
+PREAMBLE = struct.Struct("<8sII")
+
+
+def aligned_offset(offset):
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+
+def engine_name(path_oram : PathORAM):
+    # the registry name the tree engine is rebuilt from: an engine instance is accepted when it is
+    # of a registered class, and rebuilt with that class's default parameters
+    if path_oram.tree_engine is not None:
+        return path_oram.tree_engine
+    for name, engine in TREE_ENGINES.items():
+        if type(path_oram.bucket_tree) is engine:
+            return name
+    raise ValueError(f"Cannot snapshot an ORAM on a {type(path_oram.bucket_tree).__name__} instance, "
+                     f"expected an engine of {list(TREE_ENGINES)}")
+
+
+def save_snapshot(path_oram : PathORAM, filename):
+    tree_engine = engine_name(path_oram)
+    block_ids, leaf_ids, payloads = path_oram.bucket_tree.export_arrays()
+    stash_blocks = list(path_oram.stash.get_blocks())
+    arrays = {
+        "position": path_oram.position_map.to_array(),
+        "tree_block_ids": np.ascontiguousarray(block_ids, dtype="<i8"),
+        "tree_leaf_ids": np.ascontiguousarray(leaf_ids, dtype="<i8"),
+        "stash_block_ids": np.array([block.block_id for block in stash_blocks], dtype="<i8"),
+        "stash_leaf_ids": np.array([block.leaf_id for block in stash_blocks], dtype="<i8"),
+    }
+    # payloads of the real blocks only, in the order of np.nonzero over the tree slots
+    objects = pickle.dumps({
+        "tree_payloads": payloads[block_ids != -1].tolist(),
+        "stash_payloads": [block.data for block in stash_blocks],
+        "rng": path_oram.rng,
+        "collector": path_oram.collector,
+        "eviction_policy": path_oram.eviction_policy,
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    header = {
+        "n_block_number": path_oram.n_block_number,
+        "z_bucket_size": path_oram.z_bucket_size,
+        "tree_engine": tree_engine,
+        "payload_size": path_oram.payload_size,
+        "eviction": path_oram.eviction,
+        "arrays": {},
+    }
+    # the header holds the offsets of the sections, which depend on the header length:
+    # reserve room for the offsets first, then lay the sections out after it
+    header_length = len(json.dumps(header)) + 128 * (len(arrays) + 1)
+    offset = aligned_offset(PREAMBLE.size + header_length)
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = aligned_offset(offset + array.nbytes)
+    header["objects"] = {"offset": offset, "length": len(objects)}
+    encoded_header = json.dumps(header).encode().ljust(header_length)
+
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, header_length))
+        f.write(encoded_header)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.seek(header["objects"]["offset"])
+        f.write(objects)
+    os.replace(temp_filename, filename)
+
+
+def read_snapshot(filename):
+    # header, memory mapped arrays and unpickled objects of a snapshot file
+    with open(filename, "rb") as f:
+        magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{filename} is not an ORAM snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        header = json.loads(f.read(header_length))
+        f.seek(header["objects"]["offset"])
+        objects = pickle.loads(f.read(header["objects"]["length"]))
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        if np.prod(spec["shape"]) == 0:
+            arrays[name] = np.zeros(spec["shape"], dtype=spec["dtype"])
+        else:
+            # copy-on-write: the run can modify the state without touching the file
+            arrays[name] = np.memmap(filename, dtype=spec["dtype"], mode="c",
+                                     offset=spec["offset"], shape=tuple(spec["shape"]))
+    return header, arrays, objects
+
+
+def load_snapshot(filename, tree_engine=None, position_map="dict", restore_random_state=True):
+    # a new PathORAM in the saved state, optionally on another tree engine (a name or an instance) or position map
+    header, arrays, objects = read_snapshot(filename)
+    # building the ORAM draws the initial position map, the saved source is rewound after it
+    rng = objects.get("rng") if restore_random_state else None
+    rng_state = rng.getstate() if rng is not None else None
+    path_oram = PathORAM(
+        header["n_block_number"],
+        header["z_bucket_size"],
+        tree_engine=tree_engine or header["tree_engine"],
+        eviction=header["eviction"],
+        # the payload slots of the saved engine, when the ORAM is rebuilt on it
+        payload_size=header.get("payload_size") if tree_engine is None else None,
+        collector=objects["collector"],
+        position_map=position_map,
+        eviction_policy=objects.get("eviction_policy"),
+        rng=rng
+    )
+    path_oram.position_map.load_array(arrays["position"])
+
+    block_ids = arrays["tree_block_ids"]
+    payloads = np.empty(block_ids.shape, dtype=object)
+    # element by element, numpy would otherwise unpack payloads that are lists
+    for row, slot, data in zip(*np.nonzero(block_ids != -1), objects["tree_payloads"]):
+        payloads[row, slot] = data
+    path_oram.bucket_tree.import_arrays(block_ids, arrays["tree_leaf_ids"], payloads)
+
+    for block_id, leaf_id, data in zip(arrays["stash_block_ids"].tolist(),
+                                       arrays["stash_leaf_ids"].tolist(),
+                                       objects["stash_payloads"]):
+        path_oram.stash.add_block(Block(is_dummy=False, data=data, block_id=block_id, leaf_id=leaf_id))
+
+    if rng is not None:
+        rng.setstate(rng_state)
+    return path_oram
+
+
+if __name__ == "__main__":
+    import time
+
+    path_oram = PathORAM(pow(2, 10), 4)
+    for i in range(4 * path_oram.n_block_number):
+        path_oram.access(i % path_oram.n_block_number, isWrite=True, new_data=i)
+
+    save_snapshot(path_oram, "oram_snapshot.bin")
+    print(f"Snapshot size: {os.path.getsize('oram_snapshot.bin')} bytes")
+
+    expected = [path_oram.access(i).data for i in range(100)]
+    for tree_engine in ("object", "flat"):
+        start = time.perf_counter()
+        restored = load_snapshot("oram_snapshot.bin", tree_engine=tree_engine)
+        print(f"Restored on the {tree_engine} engine in {time.perf_counter() - start:.3f}s")
+        if [restored.access(i).data for i in range(100)] != expected:
+            raise AssertionError("Restored ORAM does not match the saved one")
+    os.remove("oram_snapshot.bin")
@@ -1,12 +1,161 @@
+from typing import Dict, List, Tuple
+
+from oram.client.rng import RandomSource
 from oram.server.block import Block
 
 
 class Stash():
 
-    def __init__(self):
-        self.__blocks = []
+    def __init__(self, height, rng=None):
+        self.height = height
+        # RandomSource of the random eviction, shared with the ORAM owning the stash
+        self.rng = rng if rng is not None else RandomSource()
+        self.__blocks : Dict[int, Block] = {}
 
     def add_block(self, block):
         if not isinstance(block, Block):
             raise ValueError("Block must be of type Block")
-        self.__blocks.append(block)
+        self.__blocks[block.block_id] = block
+
+    def get(self, block_id):
+        return self.__blocks.get(block_id)
+
+    def pop(self, block_id):
+        return self.__blocks.pop(block_id)
+
+    def get_blocks(self):
+        return self.__blocks.values()
+
+    def __len__(self):
+        return len(self.__blocks)
+
+    def __contains__(self, block_id):
+        return block_id in self.__blocks
+
+    def __iter__(self):
+        return iter(self.__blocks)
+
+    def common_depth(self, block_leaf_id, path_leaf_id):
+        # depth of the deepest bucket shared by the two paths: leaf ids agree on their
+        # (height - depth) most significant bits, so the XOR of the two leaves has depth bits cleared
+        return self.height - (block_leaf_id ^ path_leaf_id).bit_length()
+
+    def index_by_depth(self, path_leaf_id):
+        # by_depth[d] holds the blocks that can go at most d levels down the path
+        by_depth : List[List[Block]] = [[] for _ in range(self.height + 1)]
+        for block in self.__blocks.values():
+            by_depth[self.common_depth(block.leaf_id, path_leaf_id)].append(block)
+        return by_depth
+
+    def evict_greedy(self, path_leaf_id, z_bucket_size, top_level=0):
+        # fill the buckets from the leaf upwards, always taking the deepest candidates first
+        by_depth = self.index_by_depth(path_leaf_id)
+        buckets : List[List[Block]] = []
+        candidates : List[List[Block]] = []
+        deepest = 0
+        for level in range(self.height, top_level - 1, -1):
+            candidates.append(by_depth[level])
+            bucket : List[Block] = []
+            while len(bucket) < z_bucket_size and deepest < len(candidates):
+                if candidates[deepest]:
+                    bucket.append(candidates[deepest].pop())
+                else:
+                    deepest += 1
+            buckets.append(self.__remove_blocks(bucket))
+        return buckets
+
+    def evict_random_sample(self, path_leaf_id, z_bucket_size, top_level=0):
+        # fill the buckets from the leaf upwards with a random sample of the candidates
+        by_depth = self.index_by_depth(path_leaf_id)
+        buckets : List[List[Block]] = []
+        candidates : List[Block] = []
+        for level in range(self.height, top_level - 1, -1):
+            candidates.extend(by_depth[level])
+            min_size = min(z_bucket_size, len(candidates))
+            bucket : List[Block] = []
+            for index in sorted(self.rng.sample(range(len(candidates)), min_size), reverse=True):
+                candidates[index], candidates[-1] = candidates[-1], candidates[index]
+                bucket.append(candidates.pop())
+            buckets.append(self.__remove_blocks(bucket))
+        return buckets
+
+    def evict_many(self, path_leaf_ids, z_bucket_size, top_level=0):
+        # level by level from the leaves up, fill every bucket on the union of the paths once.
+        # A bucket is keyed by its level and by the leaf id bits above that level, which all the
+        # leaves below it share; buckets left empty are not in the result
+        buckets : Dict[Tuple[int, int], List[Block]] = {}
+        remaining = list(self.__blocks.values())
+        for level in range(self.height, top_level - 1, -1):
+            shift = self.height - level
+            prefixes = {leaf_id >> shift for leaf_id in path_leaf_ids}
+            left : List[Block] = []
+            for block in remaining:
+                prefix = block.leaf_id >> shift
+                if prefix in prefixes:
+                    bucket = buckets.setdefault((level, prefix), [])
+                    if len(bucket) < z_bucket_size:
+                        bucket.append(block)
+                        continue
+                left.append(block)
+            remaining = left
+        for bucket in buckets.values():
+            self.__remove_blocks(bucket)
+        return buckets
+
+    def evict_many_random_sample(self, path_leaf_ids, z_bucket_size, top_level=0):
+        # evict_many with every bucket filled by a random sample of its candidates
+        buckets : Dict[Tuple[int, int], List[Block]] = {}
+        remaining = list(self.__blocks.values())
+        for level in range(self.height, top_level - 1, -1):
+            shift = self.height - level
+            prefixes = {leaf_id >> shift for leaf_id in path_leaf_ids}
+            candidates : Dict[int, List[Block]] = {}
+            left : List[Block] = []
+            for block in remaining:
+                prefix = block.leaf_id >> shift
+                if prefix in prefixes:
+                    candidates.setdefault(prefix, []).append(block)
+                else:
+                    left.append(block)
+            for prefix, blocks in candidates.items():
+                chosen = set(self.rng.sample(range(len(blocks)), min(z_bucket_size, len(blocks))))
+                buckets[(level, prefix)] = [blocks[index] for index in chosen]
+                left.extend(block for index, block in enumerate(blocks) if index not in chosen)
+            remaining = left
+        for bucket in buckets.values():
+            self.__remove_blocks(bucket)
+        return buckets
+
+    def __remove_blocks(self, blocks):
+        for block in blocks:
+            del self.__blocks[block.block_id]
+        return blocks
+
+    def __str__(self):
+        return f"Stash(blocks={len(self.__blocks)})"
+
+
+if __name__ == "__main__":
+    # regression check against the random sample eviction of the original implementation.
+    # The number of blocks written to each bucket only depends on the leaves of the blocks,
+    # so with the same position map draws both evictions must leave identical stash sizes.
+    from collections import Counter
+    from oram.client.path_oram import PathORAM
+
+    accesses = 40_000
+    stash_sizes = {}
+    for eviction in ("random", "greedy"):
+        path_oram = PathORAM(eviction=eviction, rng=RandomSource(1))
+        # keep the sampling draws out of the source used by the position map
+        path_oram.stash.rng = RandomSource(2)
+        stash_sizes[eviction] = []
+        for i in range(accesses):
+            path_oram.access(i % path_oram.n_block_number, isWrite=True, new_data=i)
+            stash_sizes[eviction].append(len(path_oram.stash))
+
+    histogram = Counter(stash_sizes["greedy"])
+    print(f"Max stash size: {max(histogram)}")
+    print(f"Mean stash size: {sum(size * count for size, count in histogram.items()) / accesses:.2f}")
+    if stash_sizes["random"] != stash_sizes["greedy"]:
+        raise AssertionError("Greedy eviction changed the stash size distribution")
+    print("Greedy and random sample eviction give the same stash sizes")
@@ -0,0 +1,152 @@
+import argparse
+import random as rand
+from typing import Dict, List
+
+import numpy as np
+
+from oram.server.block import Block
+
+
+def levels_for_budget(height, z_max_size, memory_budget, slot_bytes):
+    # the most top levels whose 2^k - 1 buckets of z_max_size slots fit in memory_budget bytes, at most
+    # height + 1 when the whole tree fits
+    cached_levels = 0
+    while cached_levels <= height and (pow(2, cached_levels + 1) - 1) * z_max_size * slot_bytes <= memory_budget:
+        cached_levels += 1
+    return cached_levels
+
+
+class TreeTopCache():
+    # Tree engine keeping the buckets of the top cached_levels levels (0 .. cached_levels - 1) in
+    # client memory and sending only the lower levels to the server engine. Every path shares its
+    # top buckets, so they never need to leave the client. cached_levels is picked from a memory
+    # budget when not given, counting slot_bytes per slot.
+
+    def __init__(self, bucket_tree, z_max_size, memory_budget=None, cached_levels=None, slot_bytes=64):
+        if cached_levels is None:
+            if memory_budget is None:
+                raise ValueError("Either a memory budget or a number of cached levels is needed")
+            cached_levels = levels_for_budget(bucket_tree.height, z_max_size, memory_budget, slot_bytes)
+        # height + 1 levels is the whole tree, the server engine is then never used
+        if not 0 <= cached_levels <= bucket_tree.height + 1:
+            raise ValueError(f"Cached levels must be between 0 and {bucket_tree.height + 1}, the levels of the tree")
+        self.bucket_tree = bucket_tree
+        self.height = bucket_tree.height
+        self.z_max_size = z_max_size
+        self.cached_levels = cached_levels
+        self.slot_bytes = slot_bytes
+        self.num_leaves = pow(2, self.height)
+        # heap index -> real blocks, for the cached buckets holding any
+        self.__cache : Dict[int, List[Block]] = {}
+
+        self.server_buckets = 0
+        self.cached_buckets = 0
+
+    def __cached_path(self, leaf_id, top_level):
+        # heap indexes of the cached buckets of the path, from the lowest cached level up to top_level
+        position = self.num_leaves - 1 - leaf_id
+        return [(1 << level) - 1 + (position >> (self.height - level))
+                for level in range(self.cached_levels - 1, top_level - 1, -1)]
+
+    def read_path(self, leaf_id, top_level=0):
+        blocks : List[Block] = []
+        server_top_level = max(top_level, self.cached_levels)
+        if server_top_level <= self.height:
+            blocks.extend(self.bucket_tree.read_path(leaf_id, server_top_level))
+            self.server_buckets += self.height - server_top_level + 1
+        for bucket_index in self.__cached_path(leaf_id, top_level):
+            blocks.extend(self.__cache.pop(bucket_index, ()))
+            self.cached_buckets += 1
+        return blocks
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        if len(buckets) != self.height - top_level + 1:
+            raise ValueError(f"Expected {self.height - top_level + 1} buckets, got {len(buckets)}")
+        server_top_level = max(top_level, self.cached_levels)
+        server_bucket_number = max(self.height - server_top_level + 1, 0)
+        if server_bucket_number:
+            self.bucket_tree.write_path(leaf_id, buckets[:server_bucket_number], server_top_level)
+            self.server_buckets += server_bucket_number
+        for bucket_index, blocks in zip(self.__cached_path(leaf_id, top_level), buckets[server_bucket_number:]):
+            if len(blocks) > self.z_max_size:
+                raise ValueError("Bucket is full")
+            if blocks:
+                self.__cache[bucket_index] = list(blocks)
+            else:
+                self.__cache.pop(bucket_index, None)
+            self.cached_buckets += 1
+
+    def is_on_path(self, block_leaf_id, path_leaf_id, level):
+        shift_amount = self.height - level
+        return (block_leaf_id >> shift_amount) == (path_leaf_id >> shift_amount)
+
+    def export_arrays(self):
+        # the server tree with the cached buckets filled in, buckets in heap order
+        block_ids, leaf_ids, payloads = self.bucket_tree.export_arrays()
+        block_ids, leaf_ids, payloads = block_ids.copy(), leaf_ids.copy(), payloads.copy()
+        for bucket_index, blocks in self.__cache.items():
+            for slot, block in enumerate(blocks):
+                block_ids[bucket_index, slot] = block.block_id
+                leaf_ids[bucket_index, slot] = block.leaf_id
+                payloads[bucket_index, slot] = block.data
+        return block_ids, leaf_ids, payloads
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        cached_buckets = pow(2, self.cached_levels) - 1
+        self.__cache = {}
+        for bucket_index, slot in zip(*np.nonzero(block_ids[:cached_buckets] != -1)):
+            self.__cache.setdefault(int(bucket_index), []).append(Block(
+                is_dummy=False,
+                data=payloads[bucket_index, slot],
+                block_id=int(block_ids[bucket_index, slot]),
+                leaf_id=int(leaf_ids[bucket_index, slot])
+            ))
+        server_block_ids = np.array(block_ids, copy=True)
+        server_block_ids[:cached_buckets] = -1
+        self.bucket_tree.import_arrays(server_block_ids, leaf_ids, payloads)
+
+    def cached_blocks(self):
+        return sum(len(blocks) for blocks in self.__cache.values())
+
+    def memory_bytes(self):
+        # client memory reserved for the cached buckets at slot_bytes per slot
+        return (pow(2, self.cached_levels) - 1) * self.z_max_size * self.slot_bytes
+
+    def __str__(self):
+        return (f"TreeTopCache(cached_levels={self.cached_levels}, memory={self.memory_bytes()} bytes, "
+                f"server={self.bucket_tree})")
+
+
+if __name__ == "__main__":
+    from oram.client.path_oram import TREE_ENGINES, PathORAM
+    from oram.client.rng import RandomSource
+    from oram.simulation.histogram import StashHistogram
+
+    parser = argparse.ArgumentParser(description="Server bandwidth and client memory of the tree-top cache")
+    parser.add_argument("--blocks", type=int, default=pow(2, 14))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--engine", default="flat")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 1_024, 16_384, 262_144, 4_194_304],
+                        help="client memory budgets in bytes")
+    parser.add_argument("--slot-bytes", type=int, default=64)
+    parser.add_argument("--accesses", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'budget':>9} {'k':>3} {'memory':>9} {'server buckets':>14} {'saved':>6} {'mean stash':>10} "
+          f"{'max stash':>9} {'cached blocks':>13}")
+    for memory_budget in args.budgets:
+        rand.seed(0)
+        tree = TreeTopCache(TREE_ENGINES[args.engine](args.blocks, args.bucket_size), args.bucket_size,
+                            memory_budget=memory_budget, slot_bytes=args.slot_bytes)
+        path_oram = PathORAM(args.blocks, args.bucket_size, tree_engine=tree, rng=RandomSource(0))
+        for i in range(args.blocks):
+            path_oram.access(i, isWrite=True, new_data=i)
+        tree.server_buckets = 0
+        path_oram.collector = StashHistogram()
+        for i in range(args.accesses):
+            path_oram.access(rand.randrange(args.blocks))
+        # without the cache an access reads and writes the L buckets below the root
+        server_buckets = tree.server_buckets / args.accesses
+        print(f"{memory_budget:>9} {tree.cached_levels:>3} {tree.memory_bytes():>9} {server_buckets:>14.2f} "
+              f"{1 - server_buckets / (2 * tree.height):>6.1%} {path_oram.collector.mean():>10.2f} "
+              f"{path_oram.collector.max_stash_size:>9} {tree.cached_blocks():>13}")
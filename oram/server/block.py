@@ -1,60 +1,95 @@
-from array import ArrayType
-
-from oram.constants import N_BLOCKS_NUMBER
+from array import array
 
 
 class Block:
-    used_ids : ArrayType = [False] * N_BLOCKS_NUMBER
+    # a slotted record: no per-instance __dict__, four references per block
+    __slots__ = ("is_dummy", "data", "block_id", "leaf_id")
 
     def __init__(self, is_dummy=True, data=None, block_id=None, leaf_id=None):
         if is_dummy:
             self.is_dummy = True
-            self.data = []
+            self.data = None
             self.block_id : int = -1
             self.leaf_id : int = -1
         else:
             self.data = data
             self.is_dummy = False
-            # if Block.used_ids[block_id]:
-            #     raise ValueError(f"Block id {block_id} is already in use")
             self.block_id : int = block_id
             self.leaf_id : int = leaf_id
-            Block.used_ids[block_id] = True
-
-    def __delete__(self, instance):
-        Block.used_ids[self.block_id] = False
 
     def __str__(self):
         return f"Block id {self.block_id}: {self.data}"
 
 
+class _DummyBlock(Block):
+    # the one dummy block shared by every empty slot, read-only so no slot can change the others
+    __slots__ = ()
+
+    def __init__(self):
+        for name, value in (("is_dummy", True), ("data", None), ("block_id", -1), ("leaf_id", -1)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("The shared dummy block cannot be modified")
+
+    def __reduce__(self):
+        return "DUMMY_BLOCK"
+
+
+DUMMY_BLOCK = _DummyBlock()
+
+# stored length of the payload of a block without data, for the engines keeping payloads as raw bytes
+NO_PAYLOAD = 0xFFFFFFFF
+
+
+def payload_bytes(data):
+    # length and bytes of a payload stored or sent as raw bytes, NO_PAYLOAD for a block without data.
+    # Nothing else is accepted: raw bytes are never unpickled when read back
+    if data is None:
+        return NO_PAYLOAD, b""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        raise TypeError(f"Payloads must be bytes, got {type(data).__name__}")
+    return len(data), data
+
+
+class PayloadBuffer:
+    # capacity fixed-size payload slots of payload_size bytes in one preallocated bytearray,
+    # written and read through a memoryview, with the length of each payload kept alongside,
+    # NO_PAYLOAD for a block without data
+
+    def __init__(self, capacity, payload_size):
+        if payload_size <= 0:
+            raise ValueError("Payload size must be greater than 0")
+        self.capacity = capacity
+        self.payload_size = payload_size
+        self.buffer = bytearray(capacity * payload_size)
+        self.view = memoryview(self.buffer)
+        self.lengths = array("I", bytes(4 * capacity))
+
+    def write(self, slot, data):
+        length, payload = payload_bytes(data)
+        if length != NO_PAYLOAD and length > self.payload_size:
+            raise ValueError(f"Payload of {length} bytes is larger than the slot size of {self.payload_size}")
+        start = slot * self.payload_size
+        self.view[start:start + len(payload)] = payload
+        self.lengths[slot] = length
+
+    def read(self, slot):
+        if self.lengths[slot] == NO_PAYLOAD:
+            return None
+        start = slot * self.payload_size
+        return bytes(self.view[start:start + self.lengths[slot]])
+
+    def memory_bytes(self):
+        return len(self.buffer) + self.lengths.itemsize * len(self.lengths)
+
+
 if __name__ == "__main__":
-    # array of int data
-    data = [1, 2, 3, 4, 5]
-    block1 = Block(
-        is_dummy=True,
-        data=data
-    )
-
-    block2 = Block(
-        is_dummy=True,
-        data=data
-    )
-    print(block1)
-    print(block2)
-
-    # array of int data
-    data = [1, 2, 3, 4, 5]
-    block1 = Block(
-        is_dummy=False,
-        data=data,
-        block_id=1
-    )
-
-    block2 = Block(
-        is_dummy=False,
-        data=data,
-        block_id=2
-    )
-    print(block1)
-    print(block2)
+    block = Block(is_dummy=False, data=[1, 2, 3, 4, 5], block_id=1, leaf_id=0)
+    print(block)
+    print(DUMMY_BLOCK)
+
+    payloads = PayloadBuffer(4, 8)
+    payloads.write(2, b"payload")
+    payloads.write(3, None)
+    print(payloads.read(2), payloads.read(3), payloads.memory_bytes())
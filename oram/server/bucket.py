@@ -1,9 +1,11 @@
 from tkinter import Listbox
 from typing import List
 
-from oram.server.block import Block
+from oram.server.block import DUMMY_BLOCK, Block
 
 class Bucket():
+    # slotted like Block: a tree holds 2N - 1 buckets
+    __slots__ = ("__is_init", "is_init", "parent", "right", "left", "__max_size", "_id", "__blocks")
 
     def __init__(self, max_size=0, parent=None, right=None, left=None, blocks=None):
         self.__is_init : bool = False
@@ -63,8 +65,8 @@ class Bucket():
         return f"Bucket(max_size={self.__max_size}, blocks={len(self.__blocks)}, id={self._id})"
 
     def do_empty(self):
-        # put dummies
-        self.__blocks = [Block(is_dummy=True, leaf_id=-1, block_id=-1, data=[]) for _ in range(self.__max_size)]
+        # put dummies, all the shared sentinel
+        self.__blocks = [DUMMY_BLOCK] * self.__max_size
 
     def is_leaf(self):
         return self.left is None and self.right is None
@@ -3,19 +3,28 @@ from collections import deque
 from math import ceil, log2
 from typing import List, Mapping
 
-from oram.server.block import Block
+import numpy as np
+
+from oram.server.block import Block, PayloadBuffer
 from oram.server.bucket import Bucket
 from oram.constants import Z_BUCKET_SIZE
 
 
 class BucketTree():
 
-    def __init__(self, n_block_number):
+    def __init__(self, n_block_number, z_max_size=Z_BUCKET_SIZE, payload_size=None):
         if n_block_number <= 0:
             raise ValueError("Bucket size must be greater than 0")
         self.height = ceil(log2(n_block_number))
+        self.z_max_size = z_max_size
         self.leaf_map: Mapping[int, Bucket] = {}
-        self.root = self.create_tree(self.height)
+        self.root = self.create_tree(self.height, z_max_size)
+        # with a payload_size, the bytes payloads of the stored blocks live in one buffer with a
+        # slot per bucket slot, slot z * bucket id + i for the i-th real block of a bucket, and
+        # the blocks in the tree only keep their ids
+        self.payloads = None
+        if payload_size is not None:
+            self.payloads = PayloadBuffer((pow(2, self.height + 1) - 1) * z_max_size, payload_size)
 
     def path_to_root(self, node):
         path : List[Bucket] = []
@@ -35,6 +44,45 @@ class BucketTree():
             node = node.parent
         return node
 
+    def read_path(self, leaf_id, top_level=0):
+        # collect the real blocks from the leaf up to top_level and leave only dummies behind
+        blocks : List[Block] = []
+        bucket : Bucket = self.leaf_map.get(leaf_id)
+        for _ in range(self.height - top_level + 1):
+            slot = bucket._id * self.z_max_size
+            for block in bucket.get_blocks():
+                if not block.is_dummy:
+                    if self.payloads is not None:
+                        block.data = self.payloads.read(slot)
+                        slot += 1
+                    blocks.append(block)
+            bucket.do_empty()
+            bucket = bucket.parent
+        return blocks
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        # buckets[i] holds the blocks for the bucket i levels above the leaf
+        if len(buckets) != self.height - top_level + 1:
+            raise ValueError(f"Expected {self.height - top_level + 1} buckets, got {len(buckets)}")
+        bucket : Bucket = self.leaf_map.get(leaf_id)
+        for blocks in buckets:
+            if self.payloads is not None:
+                blocks = self.__store_payloads(bucket, blocks)
+            for block in blocks:
+                bucket.add_block(block)
+            bucket = bucket.parent
+
+    def __store_payloads(self, bucket, blocks):
+        # copies the payloads to the slots after the real blocks the bucket already holds, and
+        # returns the blocks to store: new ones without data, the caller may still hold the old ones
+        slot = bucket._id * self.z_max_size + sum(not block.is_dummy for block in bucket.get_blocks())
+        if slot + len(blocks) > (bucket._id + 1) * self.z_max_size:
+            raise ValueError("Bucket is full")
+        for block in blocks:
+            self.payloads.write(slot, block.data)
+            slot += 1
+        return [Block(is_dummy=False, block_id=block.block_id, leaf_id=block.leaf_id) for block in blocks]
+
 
     def create_tree(self, height, z_max_size=Z_BUCKET_SIZE, parent=None):
         self.root = self.create_tree_wrapped(self.height, z_max_size, parent)
@@ -45,9 +93,7 @@ class BucketTree():
         if height < 0:
             return None
         node = Bucket(max_size=z_max_size)
-        for i in range(z_max_size):
-            new_dummy_block = Block(is_dummy=True)
-            node.add_block(new_dummy_block)
+        node.do_empty()
 
         node.left = self.create_tree_wrapped(
             height=height - 1,
@@ -95,6 +141,48 @@ class BucketTree():
             return right
         return None
 
+    def buckets_in_heap_order(self):
+        # BFS order of the complete tree: root first, children of the i-th bucket at 2i + 1 and 2i + 2
+        buckets : List[Bucket] = [self.root]
+        for bucket in buckets:
+            if bucket.left is not None:
+                buckets.append(bucket.left)
+                buckets.append(bucket.right)
+        return buckets
+
+    def export_arrays(self):
+        # same layout as FlatBucketTree: -1 ids for the dummy slots
+        buckets = self.buckets_in_heap_order()
+        z_max_size = self.root.get_max_size()
+        block_ids = np.full((len(buckets), z_max_size), -1, dtype=np.int64)
+        leaf_ids = np.full((len(buckets), z_max_size), -1, dtype=np.int64)
+        payloads = np.empty((len(buckets), z_max_size), dtype=object)
+        for i, bucket in enumerate(buckets):
+            real_blocks = [block for block in bucket.get_blocks() if not block.is_dummy]
+            for slot, block in enumerate(real_blocks):
+                block_ids[i, slot] = block.block_id
+                leaf_ids[i, slot] = block.leaf_id
+                payloads[i, slot] = (block.data if self.payloads is None
+                                     else self.payloads.read(bucket._id * self.z_max_size + slot))
+        return block_ids, leaf_ids, payloads
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        buckets = self.buckets_in_heap_order()
+        if len(block_ids) != len(buckets):
+            raise ValueError(f"Expected {len(buckets)} buckets, got {len(block_ids)}")
+        for i, bucket in enumerate(buckets):
+            bucket.do_empty()
+            blocks = [Block(
+                is_dummy=False,
+                data=payloads[i, slot],
+                block_id=int(block_ids[i, slot]),
+                leaf_id=int(leaf_ids[i, slot])
+            ) for slot in np.flatnonzero(block_ids[i] != -1).tolist()]
+            if self.payloads is not None:
+                blocks = self.__store_payloads(bucket, blocks)
+            for block in blocks:
+                bucket.add_block(block)
+
     def __assign_ids_inverted_bfs(self):
         if not self.root:
             return
@@ -0,0 +1,15 @@
+from oram.server.bucket_tree import BucketTree
+from oram.server.flat_bucket_tree import FlatBucketTree
+from oram.server.lazy_bucket_tree import LazyBucketTree
+from oram.server.mapped_bucket_tree import MappedBucketTree
+
+# the bucket tree engines by name, built with (n_block_number, z_bucket_size)
+TREE_ENGINES = {
+    "object": BucketTree,
+    "flat": FlatBucketTree,
+    "mapped": MappedBucketTree,
+    "lazy": LazyBucketTree,
+}
+
+# the engines also built with a payload_size, the size in bytes of the slot holding the bytes payload of a block
+PAYLOAD_ENGINES = ("object", "mapped")
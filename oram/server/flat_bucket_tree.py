@@ -0,0 +1,100 @@
+from math import ceil, log2
+from typing import List
+
+import numpy as np
+
+from oram.server.block import Block
+from oram.constants import Z_BUCKET_SIZE
+
+DUMMY_BLOCK_ID = -1
+
+
+def heap_path_indices(leaf_id, height, top_level=0):
+    # leaf ids are numbered right to left, like the inverted BFS ids of BucketTree
+    position = np.asarray((1 << height) - 1 - np.asarray(leaf_id), dtype=np.int64)
+    levels = np.arange(height, top_level - 1, -1, dtype=np.int64)
+    # heap index of the bucket at each level, from the leaf up to top_level
+    return (1 << levels) - 1 + (position[..., None] >> (height - levels))
+
+
+class FlatBucketTree():
+
+    def __init__(self, n_block_number, z_max_size=Z_BUCKET_SIZE):
+        if n_block_number <= 0:
+            raise ValueError("Number of blocks must be greater than 0")
+        if z_max_size <= 0:
+            raise ValueError("Bucket size must be greater than 0")
+        self.height = ceil(log2(n_block_number))
+        self.z_max_size = z_max_size
+        self.num_leaves = pow(2, self.height)
+        self.num_buckets = 2 * self.num_leaves - 1
+        # buckets in heap order: root at 0, children of i at 2i + 1 and 2i + 2
+        self.block_ids = np.full((self.num_buckets, z_max_size), DUMMY_BLOCK_ID, dtype=np.int64)
+        self.leaf_ids = np.full((self.num_buckets, z_max_size), DUMMY_BLOCK_ID, dtype=np.int64)
+        self.payloads = np.empty((self.num_buckets, z_max_size), dtype=object)
+
+    def read_path(self, leaf_id, top_level=0):
+        path = heap_path_indices(leaf_id, self.height, top_level)
+        path_ids = self.block_ids[path]
+        rows, slots = np.nonzero(path_ids != DUMMY_BLOCK_ID)
+        blocks : List[Block] = []
+        for row, slot in zip(rows.tolist(), slots.tolist()):
+            blocks.append(Block(
+                is_dummy=False,
+                data=self.payloads[path[row], slot],
+                block_id=int(path_ids[row, slot]),
+                leaf_id=int(self.leaf_ids[path[row], slot])
+            ))
+        # every bucket on the path is left holding only dummies
+        self.block_ids[path] = DUMMY_BLOCK_ID
+        self.leaf_ids[path] = DUMMY_BLOCK_ID
+        self.payloads[path] = None
+        return blocks
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        path = heap_path_indices(leaf_id, self.height, top_level)
+        if len(buckets) != len(path):
+            raise ValueError(f"Expected {len(path)} buckets, got {len(buckets)}")
+        for bucket_index, blocks in zip(path.tolist(), buckets):
+            if len(blocks) > self.z_max_size:
+                raise ValueError("Bucket is full")
+            self.block_ids[bucket_index] = DUMMY_BLOCK_ID
+            self.leaf_ids[bucket_index] = DUMMY_BLOCK_ID
+            self.payloads[bucket_index] = None
+            for slot, block in enumerate(blocks):
+                self.block_ids[bucket_index, slot] = block.block_id
+                self.leaf_ids[bucket_index, slot] = block.leaf_id
+                self.payloads[bucket_index, slot] = block.data
+
+    def is_on_path(self, block_leaf_id, path_leaf_id, level):
+        shift_amount = self.height - level
+        return (block_leaf_id >> shift_amount) == (path_leaf_id >> shift_amount)
+
+    def export_arrays(self):
+        # block ids, leaf ids and payloads of every slot, buckets in heap order
+        return self.block_ids, self.leaf_ids, self.payloads
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        # the arrays are used as they are, a copy-on-write memory map stays lazily loaded
+        if block_ids.shape != self.block_ids.shape:
+            raise ValueError(f"Expected arrays of shape {self.block_ids.shape}, got {block_ids.shape}")
+        self.block_ids = block_ids
+        self.leaf_ids = leaf_ids
+        self.payloads = payloads
+
+    def count_real_blocks(self):
+        return int(np.count_nonzero(self.block_ids != DUMMY_BLOCK_ID))
+
+    def __str__(self):
+        return f"FlatBucketTree(height={self.height}, buckets={self.num_buckets}, z={self.z_max_size})"
+
+
+if __name__ == "__main__":
+    flat_tree = FlatBucketTree(8)
+    print(flat_tree)
+    print(f"Path of leaf 0: {heap_path_indices(0, flat_tree.height).tolist()}")
+    flat_tree.write_path(0, [[Block(is_dummy=False, data=[1, 2], block_id=3, leaf_id=0)], [], [], []])
+    print(f"Real blocks: {flat_tree.count_real_blocks()}")
+    for block in flat_tree.read_path(0):
+        print(block)
+    print(f"Real blocks: {flat_tree.count_real_blocks()}")
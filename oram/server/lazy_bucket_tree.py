@@ -0,0 +1,117 @@
+import argparse
+import time
+import tracemalloc
+from math import ceil, log2
+from typing import Dict, List
+
+import numpy as np
+
+from oram.server.block import DUMMY_BLOCK, Block
+from oram.constants import Z_BUCKET_SIZE
+
+
+class LazyBucketTree():
+    # Bucket tree without any bucket built up front: buckets are found from their heap index and
+    # only the ones holding real blocks are stored, as lists of those blocks. A bucket that no path
+    # has filled reads as Z dummies, so startup costs nothing and memory follows the real blocks
+    # written, not N.
+
+    def __init__(self, n_block_number, z_max_size=Z_BUCKET_SIZE):
+        if n_block_number <= 0:
+            raise ValueError("Number of blocks must be greater than 0")
+        self.height = ceil(log2(n_block_number))
+        self.z_max_size = z_max_size
+        self.num_leaves = pow(2, self.height)
+        self.num_buckets = 2 * self.num_leaves - 1
+        # heap index -> real blocks of the bucket, for the non-empty buckets only
+        self.__buckets : Dict[int, List[Block]] = {}
+
+    def path_indices(self, leaf_id, top_level=0):
+        # heap indexes from the leaf up to top_level, leaf ids numbered right to left
+        position = self.num_leaves - 1 - leaf_id
+        return [(1 << level) - 1 + (position >> (self.height - level)) for level in range(self.height, top_level - 1, -1)]
+
+    def read_path(self, leaf_id, top_level=0):
+        blocks : List[Block] = []
+        for bucket_index in self.path_indices(leaf_id, top_level):
+            # the bucket is left holding only dummies
+            blocks.extend(self.__buckets.pop(bucket_index, ()))
+        return blocks
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        path = self.path_indices(leaf_id, top_level)
+        if len(buckets) != len(path):
+            raise ValueError(f"Expected {len(path)} buckets, got {len(buckets)}")
+        for bucket_index, blocks in zip(path, buckets):
+            if len(blocks) > self.z_max_size:
+                raise ValueError("Bucket is full")
+            if blocks:
+                self.__buckets[bucket_index] = list(blocks)
+            else:
+                self.__buckets.pop(bucket_index, None)
+
+    def get_bucket_blocks(self, bucket_index):
+        # the Z slots of a bucket, padded with dummies
+        blocks = self.__buckets.get(bucket_index, [])
+        return blocks + [DUMMY_BLOCK] * (self.z_max_size - len(blocks))
+
+    def is_on_path(self, block_leaf_id, path_leaf_id, level):
+        shift_amount = self.height - level
+        return (block_leaf_id >> shift_amount) == (path_leaf_id >> shift_amount)
+
+    def export_arrays(self):
+        # same layout as FlatBucketTree: buckets in heap order, -1 ids for the dummy slots
+        block_ids = np.full((self.num_buckets, self.z_max_size), -1, dtype=np.int64)
+        leaf_ids = np.full((self.num_buckets, self.z_max_size), -1, dtype=np.int64)
+        payloads = np.empty((self.num_buckets, self.z_max_size), dtype=object)
+        for bucket_index, blocks in self.__buckets.items():
+            for slot, block in enumerate(blocks):
+                block_ids[bucket_index, slot] = block.block_id
+                leaf_ids[bucket_index, slot] = block.leaf_id
+                payloads[bucket_index, slot] = block.data
+        return block_ids, leaf_ids, payloads
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        if block_ids.shape != (self.num_buckets, self.z_max_size):
+            raise ValueError(f"Expected arrays of shape {(self.num_buckets, self.z_max_size)}, got {block_ids.shape}")
+        self.__buckets = {}
+        for bucket_index, slot in zip(*np.nonzero(block_ids != -1)):
+            self.__buckets.setdefault(int(bucket_index), []).append(Block(
+                is_dummy=False,
+                data=payloads[bucket_index, slot],
+                block_id=int(block_ids[bucket_index, slot]),
+                leaf_id=int(leaf_ids[bucket_index, slot])
+            ))
+
+    def count_materialized_buckets(self):
+        return len(self.__buckets)
+
+    def __str__(self):
+        return (f"LazyBucketTree(height={self.height}, buckets={self.num_buckets}, z={self.z_max_size}, "
+                f"materialized={len(self.__buckets)})")
+
+
+if __name__ == "__main__":
+    from oram.client.path_oram import TREE_ENGINES, PathORAM
+
+    parser = argparse.ArgumentParser(description="Startup time and memory of the object and lazy tree engines")
+    parser.add_argument("--exponents", type=int, nargs="+", default=[10, 14, 16, 18, 20])
+    parser.add_argument("--bucket-size", type=int, default=Z_BUCKET_SIZE)
+    parser.add_argument("--accesses", type=int, default=1_000)
+    args = parser.parse_args()
+
+    for exponent in args.exponents:
+        for tree_engine in ("object", "lazy"):
+            tracemalloc.start()
+            start = time.perf_counter()
+            bucket_tree = TREE_ENGINES[tree_engine](pow(2, exponent), args.bucket_size)
+            startup = time.perf_counter() - start
+            tree_memory = tracemalloc.get_traced_memory()[0]
+            # the packed position map keeps the O(N) part of the client small and fast to fill
+            path_oram = PathORAM(pow(2, exponent), args.bucket_size, tree_engine=bucket_tree, position_map="packed")
+            for i in range(args.accesses):
+                path_oram.access(i, isWrite=True, new_data=i)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"N=2^{exponent:<2} {tree_engine:>6}: tree built in {startup:8.3f}s using {tree_memory / pow(2, 20):8.1f} MiB, "
+                  f"{memory / pow(2, 20):8.1f} MiB in total after {args.accesses} accesses")
@@ -0,0 +1,216 @@
+import argparse
+import mmap
+import os
+import tempfile
+from math import ceil, log2
+from typing import List
+
+import numpy as np
+
+from oram.server.block import NO_PAYLOAD, Block, payload_bytes
+from oram.constants import Z_BUCKET_SIZE
+
+LAYOUTS = ("heap", "subtree")
+
+
+def slot_dtype(payload_size):
+    # slot ids are stored plus one, so the zero-filled (sparse) new file holds only dummies
+    return np.dtype([
+        ("block_id", "<i8"),
+        ("leaf_id", "<i8"),
+        ("length", "<u4"),
+        ("payload", f"V{payload_size}"),
+    ])
+
+
+def subtree_height(bucket_bytes, page_size=mmap.PAGESIZE):
+    # tallest subtree whose 2^h - 1 buckets fit in one page
+    return max(1, int(log2(page_size // bucket_bytes + 1))) if bucket_bytes <= page_size else 1
+
+
+def physical_bucket_indices(height, layout, levels_per_subtree):
+    # record index in the file of every bucket, buckets given by their heap index
+    heap_index = np.arange(pow(2, height + 1) - 1, dtype=np.int64)
+    if layout == "heap":
+        return heap_index
+    level = np.frexp(heap_index + 1)[1].astype(np.int64) - 1
+    position = heap_index + 1 - (1 << level)
+    # the levels are cut in bands of levels_per_subtree levels, each band is a row of subtrees
+    # stored one after the other, every subtree in heap order: a path crosses one subtree per band
+    band = level // levels_per_subtree
+    depth_in_subtree = level - band * levels_per_subtree
+    band_height = np.minimum(levels_per_subtree, height + 1 - band * levels_per_subtree)
+    subtree_size = (1 << band_height) - 1
+    subtree_number = position >> depth_in_subtree
+    local_index = (1 << depth_in_subtree) - 1 + (position & ((1 << depth_in_subtree) - 1))
+    return (1 << (band * levels_per_subtree)) - 1 + subtree_number * subtree_size + local_index
+
+
+class MappedBucketTree():
+    # Bucket tree in a memory-mapped file, payload_size bytes per slot. Payloads must be bytes, or None,
+    # stored as they are, so a file reopened with reopen=True is never unpickled.
+
+    def __init__(self, n_block_number, z_max_size=Z_BUCKET_SIZE, filename=None, payload_size=64,
+                 layout="heap", reopen=False):
+        if n_block_number <= 0:
+            raise ValueError("Number of blocks must be greater than 0")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {layout}, expected one of {list(LAYOUTS)}")
+        self.height = ceil(log2(n_block_number))
+        self.z_max_size = z_max_size
+        self.num_leaves = pow(2, self.height)
+        self.num_buckets = 2 * self.num_leaves - 1
+        self.payload_size = payload_size
+        self.layout = layout
+        self.slot_dtype = slot_dtype(payload_size)
+        self.bucket_bytes = z_max_size * self.slot_dtype.itemsize
+        self.page_size = mmap.PAGESIZE
+        self.levels_per_subtree = subtree_height(self.bucket_bytes, self.page_size)
+        self.__physical = physical_bucket_indices(self.height, layout, self.levels_per_subtree)
+
+        temporary = filename is None
+        if temporary:
+            file_descriptor, filename = tempfile.mkstemp(suffix=".oram")
+            os.close(file_descriptor)
+        shape = (self.num_buckets, z_max_size)
+        mode = "r+" if reopen and os.path.exists(filename) else "w+"
+        self.__records = np.memmap(filename, dtype=self.slot_dtype, mode=mode, shape=shape)
+        # the id field alone, to clear a path without rewriting its payloads
+        self.__block_ids = self.__records["block_id"]
+        if temporary:
+            # the mapping keeps the pages alive, so the temporary file goes as soon as it is mapped
+            os.remove(filename)
+            filename = None
+        self.filename = filename
+
+        self.path_reads = 0
+        self.path_writes = 0
+        self.pages_read = 0
+        self.pages_written = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def read_path(self, leaf_id, top_level=0):
+        physical_path = self.__physical_path(leaf_id, top_level)
+        records = self.__records[physical_path]
+        self.path_reads += 1
+        self.pages_read += self.__pages(physical_path)
+        self.bytes_read += records.nbytes
+
+        blocks : List[Block] = []
+        for record in records[records["block_id"] != 0]:
+            blocks.append(Block(
+                is_dummy=False,
+                data=self.decode_payload(record),
+                block_id=int(record["block_id"]) - 1,
+                leaf_id=int(record["leaf_id"])
+            ))
+        # every bucket on the path is left holding only dummies, the stale payloads stay behind the zeroed ids
+        self.__block_ids[physical_path] = 0
+        return blocks
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        physical_path = self.__physical_path(leaf_id, top_level)
+        if len(buckets) != len(physical_path):
+            raise ValueError(f"Expected {len(physical_path)} buckets, got {len(buckets)}")
+        records = np.zeros((len(physical_path), self.z_max_size), dtype=self.slot_dtype)
+        for row, blocks in enumerate(buckets):
+            if len(blocks) > self.z_max_size:
+                raise ValueError("Bucket is full")
+            for slot, block in enumerate(blocks):
+                self.encode_slot(records[row, slot:slot + 1], block)
+        # one bulk write of the whole path
+        self.__records[physical_path] = records
+        self.path_writes += 1
+        self.pages_written += self.__pages(physical_path)
+        self.bytes_written += records.nbytes
+
+    def encode_slot(self, record, block):
+        # payloads are stored as raw bytes: reopening a file never unpickles what it holds
+        length, payload = payload_bytes(block.data)
+        if length != NO_PAYLOAD and length > self.payload_size:
+            raise ValueError(f"Payload of block {block.block_id} takes {length} bytes, "
+                             f"more than the slot size of {self.payload_size}")
+        record["block_id"] = block.block_id + 1
+        record["leaf_id"] = block.leaf_id
+        record["length"] = length
+        record["payload"] = np.void(bytes(payload).ljust(self.payload_size, b"\0"))
+
+    def decode_payload(self, record):
+        length = int(record["length"])
+        if length == NO_PAYLOAD:
+            return None
+        if length > self.payload_size:
+            raise ValueError(f"Corrupted slot: payload length {length} above the slot size of {self.payload_size}")
+        return record["payload"].tobytes()[:length]
+
+    def __physical_path(self, leaf_id, top_level):
+        # heap indexes of the path, from the leaf up to top_level, leaf ids numbered right to left
+        position = self.num_leaves - 1 - leaf_id
+        levels = range(self.height, top_level - 1, -1)
+        return self.__physical[[(1 << level) - 1 + (position >> (self.height - level)) for level in levels]]
+
+    def __pages(self, physical_path):
+        first_bytes = physical_path * self.bucket_bytes
+        first_pages = first_bytes // self.page_size
+        last_pages = (first_bytes + self.bucket_bytes - 1) // self.page_size
+        pages = set()
+        for first_page, last_page in zip(first_pages.tolist(), last_pages.tolist()):
+            pages.update(range(first_page, last_page + 1))
+        return len(pages)
+
+    def io_stats(self):
+        # average pages and bytes touched by one path read and one path write
+        return {
+            "pages_read_per_path": self.pages_read / max(self.path_reads, 1),
+            "bytes_read_per_path": self.bytes_read / max(self.path_reads, 1),
+            "pages_written_per_path": self.pages_written / max(self.path_writes, 1),
+            "bytes_written_per_path": self.bytes_written / max(self.path_writes, 1),
+        }
+
+    def export_arrays(self):
+        # same layout as FlatBucketTree: buckets in heap order, -1 ids for the dummy slots
+        records = self.__records[self.__physical]
+        block_ids = records["block_id"].astype(np.int64) - 1
+        leaf_ids = np.where(block_ids != -1, records["leaf_id"], -1)
+        payloads = np.empty(block_ids.shape, dtype=object)
+        for row, slot in zip(*np.nonzero(block_ids != -1)):
+            payloads[row, slot] = self.decode_payload(records[row, slot])
+        return block_ids, leaf_ids, payloads
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        if block_ids.shape != (self.num_buckets, self.z_max_size):
+            raise ValueError(f"Expected arrays of shape {(self.num_buckets, self.z_max_size)}, got {block_ids.shape}")
+        records = np.zeros(block_ids.shape, dtype=self.slot_dtype)
+        for row, slot in zip(*np.nonzero(block_ids != -1)):
+            block = Block(is_dummy=False, data=payloads[row, slot], block_id=int(block_ids[row, slot]),
+                          leaf_id=int(leaf_ids[row, slot]))
+            self.encode_slot(records[row, slot:slot + 1], block)
+        self.__records[self.__physical] = records
+
+    def flush(self):
+        self.__records.flush()
+
+    def __str__(self):
+        return (f"MappedBucketTree(height={self.height}, layout={self.layout}, file={self.filename}, "
+                f"bucket_bytes={self.bucket_bytes}, levels_per_subtree={self.levels_per_subtree})")
+
+
+if __name__ == "__main__":
+    from oram.client.path_oram import PathORAM
+
+    parser = argparse.ArgumentParser(description="Pages and bytes touched per access for each file layout")
+    parser.add_argument("--blocks", type=int, default=pow(2, 14))
+    parser.add_argument("--bucket-size", type=int, default=Z_BUCKET_SIZE)
+    parser.add_argument("--payload-size", type=int, default=32)
+    parser.add_argument("--accesses", type=int, default=20_000)
+    args = parser.parse_args()
+
+    for layout in LAYOUTS:
+        tree = MappedBucketTree(args.blocks, args.bucket_size, payload_size=args.payload_size, layout=layout)
+        path_oram = PathORAM(args.blocks, args.bucket_size, tree_engine=tree)
+        for i in range(args.accesses):
+            path_oram.access(i % args.blocks, isWrite=True, new_data=i.to_bytes(8, "little"))
+        print(tree)
+        for name, value in tree.io_stats().items():
+            print(f"    {name}: {value:.1f}")
@@ -0,0 +1,240 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import List
+
+import numpy as np
+
+from oram.constants import Z_BUCKET_SIZE, N_BLOCKS_NUMBER
+from oram.server.block import NO_PAYLOAD, Block, payload_bytes
+from oram.server.engines import TREE_ENGINES
+
+# wire format, little endian: every message is a frame header followed by a body of body_length bytes.
+# A request header holds the operation, a response header the status; the request id is echoed back,
+# so a client can send several requests before reading the responses (pipelining). Payloads travel as
+# raw bytes, nothing on the wire is unpickled: the server does not trust its clients, nor the clients the server
+FRAME = struct.Struct("<BII")
+PATH_REQUEST = struct.Struct("<qB")
+BLOCK_HEADER = struct.Struct("<qqI")
+COUNT = struct.Struct("<I")
+TREE_INFO = struct.Struct("<II")
+ARRAYS_HEADER = struct.Struct("<II")
+PAYLOAD_LENGTH = struct.Struct("<I")
+
+OP_INFO = 0
+OP_READ_PATH = 1
+OP_WRITE_PATH = 2
+OP_READ_PATHS = 3
+OP_WRITE_PATHS = 4
+OP_EXPORT = 5
+OP_IMPORT = 6
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+def read_payload(body, offset, length):
+    if length == NO_PAYLOAD:
+        return None, offset
+    if offset + length > len(body):
+        raise ValueError("Payload past the end of the message")
+    return bytes(body[offset:offset + length]), offset + length
+
+
+def encode_blocks(blocks, chunks):
+    # block count, then block id, leaf id, payload length and payload of each block
+    chunks.append(COUNT.pack(len(blocks)))
+    for block in blocks:
+        length, payload = payload_bytes(block.data)
+        chunks.append(BLOCK_HEADER.pack(block.block_id, block.leaf_id, length))
+        chunks.append(payload)
+    return chunks
+
+
+def decode_blocks(body, offset):
+    (count,), offset = COUNT.unpack_from(body, offset), offset + COUNT.size
+    blocks : List[Block] = []
+    for _ in range(count):
+        block_id, leaf_id, length = BLOCK_HEADER.unpack_from(body, offset)
+        data, offset = read_payload(body, offset + BLOCK_HEADER.size, length)
+        blocks.append(Block(is_dummy=False, data=data, block_id=block_id, leaf_id=leaf_id))
+    return blocks, offset
+
+
+def encode_buckets(buckets, chunks):
+    # bucket count, then the blocks of each bucket from the leaf up
+    chunks.append(COUNT.pack(len(buckets)))
+    for blocks in buckets:
+        encode_blocks(blocks, chunks)
+    return chunks
+
+
+def decode_buckets(body, offset):
+    (count,), offset = COUNT.unpack_from(body, offset), offset + COUNT.size
+    buckets : List[List[Block]] = []
+    for _ in range(count):
+        blocks, offset = decode_blocks(body, offset)
+        buckets.append(blocks)
+    return buckets, offset
+
+
+def encode_arrays(block_ids, leaf_ids, payloads, chunks):
+    # the heap order arrays of export_arrays: their shape, the block ids and leaf ids as raw
+    # little-endian int64, then the length and payload of every real slot in np.nonzero order
+    block_ids = np.ascontiguousarray(block_ids, dtype="<i8")
+    chunks.append(ARRAYS_HEADER.pack(*block_ids.shape))
+    chunks.append(block_ids.tobytes())
+    chunks.append(np.ascontiguousarray(leaf_ids, dtype="<i8").tobytes())
+    for data in payloads[block_ids != -1].tolist():
+        length, payload = payload_bytes(data)
+        chunks.append(PAYLOAD_LENGTH.pack(length))
+        chunks.append(payload)
+    return chunks
+
+
+def decode_arrays(body):
+    # block ids and leaf ids are views of body, writable when body is
+    rows, slots = ARRAYS_HEADER.unpack_from(body)
+    offset = ARRAYS_HEADER.size
+    block_ids = np.frombuffer(body, dtype="<i8", count=rows * slots, offset=offset).reshape(rows, slots)
+    offset += block_ids.nbytes
+    leaf_ids = np.frombuffer(body, dtype="<i8", count=rows * slots, offset=offset).reshape(rows, slots)
+    offset += leaf_ids.nbytes
+    payloads = np.empty((rows, slots), dtype=object)
+    # element by element, numpy would otherwise unpack the payloads
+    for row, slot in zip(*np.nonzero(block_ids != -1)):
+        (length,) = PAYLOAD_LENGTH.unpack_from(body, offset)
+        payloads[row, slot], offset = read_payload(body, offset + PAYLOAD_LENGTH.size, length)
+    return block_ids, leaf_ids, payloads
+
+
+class PathService:
+    # the operations of the wire format on one bucket tree, shared by every connection
+
+    def __init__(self, bucket_tree):
+        self.bucket_tree = bucket_tree
+        self.lock = threading.Lock()
+
+    def handle(self, op, body):
+        with self.lock:
+            if op == OP_INFO:
+                return TREE_INFO.pack(self.bucket_tree.height, self.bucket_tree.z_max_size)
+            if op == OP_READ_PATH:
+                leaf_id, top_level = PATH_REQUEST.unpack_from(body)
+                return b"".join(encode_blocks(self.bucket_tree.read_path(leaf_id, top_level), []))
+            if op == OP_WRITE_PATH:
+                leaf_id, top_level = PATH_REQUEST.unpack_from(body)
+                buckets, _ = decode_buckets(body, PATH_REQUEST.size)
+                self.bucket_tree.write_path(leaf_id, buckets, top_level)
+                return b""
+            if op == OP_READ_PATHS:
+                # a count, then the leaf id and top level of each path
+                (count,) = COUNT.unpack_from(body)
+                chunks = []
+                for i in range(count):
+                    leaf_id, top_level = PATH_REQUEST.unpack_from(body, COUNT.size + i * PATH_REQUEST.size)
+                    encode_blocks(self.bucket_tree.read_path(leaf_id, top_level), chunks)
+                return b"".join(chunks)
+            if op == OP_WRITE_PATHS:
+                (count,) = COUNT.unpack_from(body)
+                offset = COUNT.size
+                for _ in range(count):
+                    leaf_id, top_level = PATH_REQUEST.unpack_from(body, offset)
+                    buckets, offset = decode_buckets(body, offset + PATH_REQUEST.size)
+                    self.bucket_tree.write_path(leaf_id, buckets, top_level)
+                return b""
+            if op == OP_EXPORT:
+                return b"".join(encode_arrays(*self.bucket_tree.export_arrays(), []))
+            if op == OP_IMPORT:
+                self.bucket_tree.import_arrays(*decode_arrays(body))
+                return b""
+            raise ValueError(f"Unknown operation {op}")
+
+
+class PathRequestHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        if self.request.family != socket.AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        # requests of one connection are answered in the order they arrive
+        while True:
+            header = self.rfile.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            op, request_id, body_length = FRAME.unpack(header)
+            # a writable buffer, the imported arrays are views of it
+            body = bytearray(body_length)
+            if self.rfile.readinto(body) < body_length:
+                return
+            try:
+                response = self.server.service.handle(op, memoryview(body))
+                status = STATUS_OK
+            except Exception as error:
+                response = repr(error).encode()
+                status = STATUS_ERROR
+            self.wfile.write(FRAME.pack(status, request_id, len(response)) + response)
+
+
+class TCPPathServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class UnixPathServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(address, bucket_tree):
+    # a string address is a Unix socket path, a (host, port) tuple a TCP address
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.remove(address)
+        server = UnixPathServer(address, PathRequestHandler)
+    else:
+        server = TCPPathServer(address, PathRequestHandler)
+    server.service = PathService(bucket_tree)
+    return server
+
+
+def serve(address, n_block_number, z_bucket_size, tree_engine="flat", ready=None):
+    server = make_server(address, TREE_ENGINES[tree_engine](n_block_number, z_bucket_size))
+    if ready is not None:
+        # the bound address, with the port chosen by the system when port 0 was asked for
+        ready.send(server.server_address)
+        ready.close()
+    with server:
+        server.serve_forever()
+
+
+def start_server_process(n_block_number, z_bucket_size, address=("127.0.0.1", 0), tree_engine="flat"):
+    # a server in a separate process, returned with the address it listens on once it accepts connections
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=serve, args=(address, n_block_number, z_bucket_size, tree_engine, sender),
+                                      daemon=True)
+    process.start()
+    sender.close()
+    bound_address = receiver.recv()
+    receiver.close()
+    return process, bound_address if isinstance(bound_address, str) else tuple(bound_address)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Path ORAM bucket tree server")
+    parser.add_argument("--blocks", type=int, default=N_BLOCKS_NUMBER)
+    parser.add_argument("--bucket-size", type=int, default=Z_BUCKET_SIZE)
+    parser.add_argument("--engine", default="flat", choices=list(TREE_ENGINES))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7000)
+    parser.add_argument("--unix-socket", default=None, help="listen on this Unix socket instead of TCP")
+    args = parser.parse_args()
+
+    address = args.unix_socket or (args.host, args.port)
+    print(f"Serving a tree of {args.blocks} blocks, Z={args.bucket_size}, on {address}")
+    serve(address, args.blocks, args.bucket_size, args.engine)
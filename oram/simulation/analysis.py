@@ -0,0 +1,175 @@
+import argparse
+import csv
+import glob
+import os
+import re
+from math import ceil, log
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from oram.simulation.histogram import read_stash_histogram
+
+# security parameters λ of the stash bounds in the summary: the R with Pr[size(S) > R] <= 2^-λ
+SECURITY_PARAMETERS = (20, 40, 80)
+# configuration in the file names written by the sweep, e.g. stash_N4096_Z4_sequential_seed0.txt
+CONFIGURATION_PATTERN = re.compile(r"N(?P<n>\d+)_Z(?P<z>\d+)(?:_(?P<pattern>[a-z_]+?))?(?:_seed\d+)?\.txt$")
+
+
+class TailFit(NamedTuple):
+    # Pr[size(S) > R] ~ exp(intercept - rate * R), fitted over first_r .. last_r
+    intercept: float
+    rate: float
+    first_r: int
+    last_r: int
+
+    def probability(self, r):
+        return np.exp(self.intercept - self.rate * np.asarray(r, dtype=np.float64))
+
+    def bound(self, security_parameter):
+        # smallest R with a fitted Pr[size(S) > R] of at most 2^-security_parameter
+        return max(ceil((self.intercept + security_parameter * log(2)) / self.rate), 0)
+
+
+def histogram_files(paths):
+    # the histogram files named on the command line, directories (e.g. a sweep output) expanded to their .txt files
+    filenames : List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob.glob(os.path.join(path, "*.txt"))))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def file_label(filename):
+    # N, Z and access pattern when the file name has them, otherwise the file name; the seed is
+    # left out so the files of several seeds add up to one curve
+    match = CONFIGURATION_PATTERN.search(os.path.basename(filename))
+    if match is None:
+        return os.path.splitext(os.path.basename(filename))[0]
+    label = f"N={match['n']}, Z={match['z']}"
+    return f"{label}, {match['pattern']}" if match["pattern"] else label
+
+
+def load_histograms(filenames, labels=None):
+    # label -> number of accesses with each stash size, summed over the files with the same label
+    histograms : Dict[str, np.ndarray] = {}
+    for index, filename in enumerate(filenames):
+        label = labels[index] if labels is not None else file_label(filename)
+        counts = read_stash_histogram(filename)
+        previous = histograms.get(label, np.zeros(0, dtype=np.int64))
+        total = np.zeros(max(len(previous), len(counts)), dtype=np.int64)
+        total[:len(previous)] += previous
+        total[:len(counts)] += counts
+        histograms[label] = total
+    return histograms
+
+
+def tail_probabilities(counts):
+    # Pr[size(S) > R] for R = 0 .. max stash size, the last one 0
+    counts = np.asarray(counts, dtype=np.int64)
+    above = np.cumsum(counts[::-1])[::-1] - counts
+    return above / max(int(counts.sum()), 1)
+
+
+def fit_exponential_tail(counts, min_count=10, start_probability=0.5):
+    # least squares line through log Pr[size(S) > R], from the first R with a probability below
+    # start_probability to the last R exceeded by at least min_count accesses, where the
+    # estimate is still reliable. None when fewer than two points qualify
+    counts = np.asarray(counts, dtype=np.int64)
+    above = np.cumsum(counts[::-1])[::-1] - counts
+    total = max(int(counts.sum()), 1)
+    r = np.flatnonzero((above >= min_count) & (above <= start_probability * total))
+    if len(r) < 2:
+        return None
+    slope, intercept = np.polyfit(r, np.log(above[r] / total), 1)
+    if slope >= 0:
+        return None
+    return TailFit(float(intercept), float(-slope), int(r[0]), int(r[-1]))
+
+
+def summarize(histograms, min_count=10, security_parameters=SECURITY_PARAMETERS):
+    rows = []
+    for label, counts in histograms.items():
+        fit = fit_exponential_tail(counts, min_count)
+        total = int(counts.sum())
+        rows.append({
+            "label": label,
+            "accesses": total,
+            "mean_stash_size": float(np.arange(len(counts)) @ counts) / max(total, 1),
+            "max_stash_size": int(np.flatnonzero(counts)[-1]) if total else 0,
+            "rate": fit.rate if fit is not None else None,
+            "intercept": fit.intercept if fit is not None else None,
+            **{f"bound_{security_parameter}": fit.bound(security_parameter) if fit is not None else None
+               for security_parameter in security_parameters},
+        })
+    return rows
+
+
+def write_summary(rows, filename):
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_summary(rows):
+    bound_columns = [column for column in rows[0] if column.startswith("bound_")]
+    width = max(len(row["label"]) for row in rows)
+    lines = [f"{'configuration':<{width}} {'accesses':>10} {'mean':>7} {'max':>5} {'rate':>7} "
+             + " ".join(f"{'R(2^-' + column[6:] + ')':>9}" for column in bound_columns)]
+    for row in rows:
+        rate = f"{row['rate']:7.3f}" if row["rate"] is not None else f"{'-':>7}"
+        lines.append(f"{row['label']:<{width}} {row['accesses']:>10} {row['mean_stash_size']:>7.2f} "
+                     f"{row['max_stash_size']:>5} {rate} "
+                     + " ".join(f"{row[column] if row[column] is not None else '-':>9}" for column in bound_columns))
+    return "\n".join(lines)
+
+
+def plot_tails(histograms, filename, min_count=10, title=None):
+    # every configuration's Pr[size(S) > R] on a log scale, with its fitted exponential tail dashed.
+    # Rendered with the Agg backend, so no display is needed
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots(figsize=(10, 6))
+    for label, counts in histograms.items():
+        tail = tail_probabilities(counts)
+        r = np.flatnonzero(tail)
+        line, = axes.plot(r, tail[r], marker=".", label=label)
+        fit = fit_exponential_tail(counts, min_count)
+        if fit is not None:
+            fitted_r = np.arange(fit.first_r, fit.bound(SECURITY_PARAMETERS[0]) + 1)
+            axes.plot(fitted_r, fit.probability(fitted_r), linestyle="--", color=line.get_color(), linewidth=1)
+    axes.set_yscale("log")
+    axes.set_xlabel("Required stash size R")
+    axes.set_ylabel("Pr[size(S) > R]")
+    axes.set_title(title or "Path ORAM stash size tail")
+    axes.grid(True, which="both", linestyle="--", linewidth=0.5)
+    axes.legend()
+    figure.tight_layout()
+    figure.savefig(filename, dpi=150)
+    plt.close(figure)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tail probabilities, exponential fits and plots of stash histograms")
+    parser.add_argument("paths", nargs="+", help="histogram files, or directories of them such as a sweep output")
+    parser.add_argument("--labels", nargs="+", default=None, help="one label per file, instead of parsing the names")
+    parser.add_argument("--min-count", type=int, default=10, help="fewest accesses above R for R to be fitted")
+    parser.add_argument("--plot", default="stash_tails.png")
+    parser.add_argument("--summary", default="stash_summary.csv")
+    parser.add_argument("--title", default=None)
+    args = parser.parse_args()
+
+    filenames = histogram_files(args.paths)
+    if args.labels is not None and len(args.labels) != len(filenames):
+        parser.error(f"Got {len(args.labels)} labels for {len(filenames)} files")
+    histograms = load_histograms(filenames, args.labels)
+    rows = summarize(histograms, args.min_count)
+    print(format_summary(rows))
+    write_summary(rows, args.summary)
+    plot_tails(histograms, args.plot, args.min_count, args.title)
+    print(f"Summary written to {args.summary}, plot to {args.plot}")
@@ -0,0 +1,127 @@
+import argparse
+from math import ceil, log2
+
+import numpy as np
+from tqdm import tqdm
+
+from oram.constants import Z_BUCKET_SIZE, N_BLOCKS_NUMBER
+from oram.server.flat_bucket_tree import DUMMY_BLOCK_ID, heap_path_indices
+from oram.simulation.histogram import add_stash_sizes, write_stash_histogram
+
+
+class BatchPathORAM():
+    # K independent Path ORAM instances advanced in lockstep. Only block ids are simulated:
+    # the stash size does not depend on the payloads. Every instance has its own position map
+    # (a row of position), tree (a (2N-1, Z) slice of tree) and stash (a row of stash).
+
+    def __init__(self, k_instances, n_block_number=N_BLOCKS_NUMBER, z_bucket_size=Z_BUCKET_SIZE,
+                 seed=None, stash_capacity=64):
+        if k_instances <= 0:
+            raise ValueError("Number of instances must be greater than 0")
+        if n_block_number <= 0:
+            raise ValueError("Number of blocks must be greater than 0")
+        self.k_instances = k_instances
+        self.n_block_number = n_block_number
+        self.z_bucket_size = z_bucket_size
+        self.l_tree_height = ceil(log2(n_block_number))
+        self.num_leaves = pow(2, self.l_tree_height)
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(k_instances)
+        self.position = self.rng.integers(0, self.num_leaves, size=(k_instances, n_block_number), dtype=np.int64)
+        self.tree = np.full((k_instances, 2 * self.num_leaves - 1, z_bucket_size), DUMMY_BLOCK_ID, dtype=np.int32)
+        self.stash = np.full((k_instances, stash_capacity), DUMMY_BLOCK_ID, dtype=np.int32)
+        self.stash_size = np.zeros(k_instances, dtype=np.int64)
+
+    def access(self, block_ids, isWrite=False):
+        block_ids = np.broadcast_to(np.asarray(block_ids, dtype=np.int64), (self.k_instances,))
+        # remap block
+        block_leaf_ids = self.position[self.rows, block_ids]
+        self.position[self.rows, block_ids] = self.rng.integers(0, self.num_leaves, size=self.k_instances)
+        # read path, from the leaf up to level 1 as in PathORAM
+        path = heap_path_indices(block_leaf_ids, self.l_tree_height, top_level=1)
+        self.__append_to_stash(self.tree[self.rows[:, None], path].reshape(self.k_instances, -1))
+        self.tree[self.rows[:, None], path] = DUMMY_BLOCK_ID
+        # a written block that was never stored before enters the stash
+        if isWrite:
+            occupied = np.arange(self.stash.shape[1]) < self.stash_size[:, None]
+            missing = ~((self.stash == block_ids[:, None]) & occupied).any(axis=1)
+            self.__append_to_stash(np.where(missing, block_ids, DUMMY_BLOCK_ID)[:, None])
+        # write path
+        self.__evict(block_leaf_ids, path)
+        return self.stash_size.copy()
+
+    def __append_to_stash(self, new_ids):
+        valid = new_ids != DUMMY_BLOCK_ID
+        new_stash_size = self.stash_size + valid.sum(axis=1)
+        self.__ensure_capacity(int(new_stash_size.max()))
+        rows, columns = np.nonzero(valid)
+        offsets = self.stash_size[:, None] + np.cumsum(valid, axis=1) - 1
+        self.stash[rows, offsets[rows, columns]] = new_ids[rows, columns]
+        self.stash_size = new_stash_size
+
+    def __ensure_capacity(self, capacity):
+        if capacity <= self.stash.shape[1]:
+            return
+        grown = np.full((self.k_instances, max(capacity, 2 * self.stash.shape[1])), DUMMY_BLOCK_ID, dtype=np.int32)
+        grown[:, :self.stash.shape[1]] = self.stash
+        self.stash = grown
+
+    def __evict(self, block_leaf_ids, path):
+        # only the columns up to the largest stash hold blocks
+        width = max(int(self.stash_size.max()), 1)
+        stash = self.stash[:, :width]
+        occupied = np.arange(width) < self.stash_size[:, None]
+        leaves = self.position[self.rows[:, None], np.where(occupied, stash, 0)]
+        # depth of the deepest bucket shared with the path, frexp gives the bit length of the XOR
+        _, bit_length = np.frexp(leaves ^ block_leaf_ids[:, None])
+        depth = np.where(occupied, self.l_tree_height - bit_length, -1)
+        placed = np.zeros_like(occupied)
+        for i, level in enumerate(range(self.l_tree_height, 0, -1)):
+            eligible = (depth >= level) & ~placed
+            rank = np.cumsum(eligible, axis=1)
+            chosen = eligible & (rank <= self.z_bucket_size)
+            rows, columns = np.nonzero(chosen)
+            self.tree[rows, path[rows, i], rank[rows, columns] - 1] = stash[rows, columns]
+            placed |= chosen
+        # compact the blocks left in the stash to the front of each row
+        kept = occupied & ~placed
+        order = np.argsort(~kept, axis=1, kind="stable")
+        self.stash[:, :width] = np.where(np.sort(~kept, axis=1), DUMMY_BLOCK_ID, np.take_along_axis(stash, order, axis=1))
+        self.stash_size = kept.sum(axis=1)
+
+
+def run_batch_simulation(k_instances, warmup_access_number, simulation_access_number,
+                         n_block_number=N_BLOCKS_NUMBER, z_bucket_size=Z_BUCKET_SIZE, seed=None):
+    batch_oram = BatchPathORAM(k_instances, n_block_number, z_bucket_size, seed=seed)
+    stash_size_map = np.zeros(1, dtype=np.int64)
+
+    for i in tqdm(range(warmup_access_number), desc="Warming up", unit="step"):
+        batch_oram.access(i % n_block_number, isWrite=True)
+
+    for i in tqdm(range(simulation_access_number), desc="Simulating", unit="step"):
+        stash_sizes = batch_oram.access(i % n_block_number)
+        stash_size_map = add_stash_sizes(stash_size_map, stash_sizes)
+
+    return stash_size_map
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run K independent Path ORAM simulations in lockstep")
+    parser.add_argument("--instances", type=int, default=1024)
+    parser.add_argument("--warmup", type=int, default=3_000)
+    parser.add_argument("--accesses", type=int, default=6_000)
+    parser.add_argument("--blocks", type=int, default=N_BLOCKS_NUMBER)
+    parser.add_argument("--bucket-size", type=int, default=Z_BUCKET_SIZE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="oram_stash_data.txt")
+    args = parser.parse_args()
+
+    stash_size_map = run_batch_simulation(
+        args.instances, args.warmup, args.accesses, args.blocks, args.bucket_size, args.seed
+    )
+    write_stash_histogram(args.output, stash_size_map)
+
+    total = int(stash_size_map.sum())
+    print(f"Data collection complete. {total} accesses written to {args.output}.")
+    print(f"Max stash size: {len(stash_size_map) - 1}")
+    print(f"Mean stash size: {np.dot(np.arange(len(stash_size_map)), stash_size_map) / total:.2f}")
@@ -0,0 +1,123 @@
+import os
+from collections import deque
+from typing import Deque, List, Tuple
+
+import numpy as np
+
+
+def add_stash_sizes(stash_size_map, stash_sizes):
+    # counts the number of accesses with a given stash size, growing the map when needed
+    counts = np.bincount(np.asarray(stash_sizes, dtype=np.int64).ravel())
+    if len(counts) > len(stash_size_map):
+        stash_size_map = np.concatenate([stash_size_map, np.zeros(len(counts) - len(stash_size_map), dtype=np.int64)])
+    stash_size_map[:len(counts)] += counts
+    return stash_size_map
+
+
+def cumulative_counts(stash_size_map):
+    # s_i is the number of accesses with a stash size >= i
+    nonzero = np.flatnonzero(stash_size_map)
+    max_stash_size = nonzero[-1] if len(nonzero) else 0
+    return np.cumsum(np.asarray(stash_size_map[:max_stash_size + 1], dtype=np.int64)[::-1])[::-1]
+
+
+def write_stash_histogram(filename, stash_size_map):
+    s = cumulative_counts(stash_size_map)
+    # write next to the target and rename, so readers never see a partial file
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "w") as f:
+        # First line: -1, total number of simulation accesses
+        f.write(f"-1,{s[0]}\n")
+        # Subsequent lines: i, s_i
+        for i, s_i in enumerate(s.tolist()):
+            f.write(f"{i},{s_i}\n")
+    os.replace(temp_filename, filename)
+
+
+def read_stash_histogram(filename):
+    # inverse of write_stash_histogram: recover the number of accesses with each stash size
+    with open(filename) as f:
+        rows = [line.split(",") for line in f.read().split()]
+    s = np.array([int(s_i) for i, s_i in rows[1:]], dtype=np.int64)
+    return s - np.append(s[1:], 0)
+
+
+class StashHistogram():
+
+    def __init__(self, checkpoint_filename=None, checkpoint_interval=100_000, window_size=10_000, window_history=1024):
+        # grows only up to the largest stash size seen
+        self.stash_size_map : List[int] = [0]
+        self.total : int = 0
+        self.max_stash_size : int = 0
+        self.__stash_size_sum : int = 0
+        self.checkpoint_filename = checkpoint_filename
+        self.checkpoint_interval = checkpoint_interval
+        # (mean, max) of the last window_history windows of window_size accesses
+        self.window_size = window_size
+        self.windows : Deque[Tuple[float, int]] = deque(maxlen=window_history)
+        self.__window_sum : int = 0
+        self.__window_max : int = 0
+        # called after every checkpoint, e.g. to save the ORAM state next to the histogram
+        self.state_writer = None
+
+    def record(self, stash_size):
+        if stash_size >= len(self.stash_size_map):
+            self.stash_size_map.extend([0] * (stash_size + 1 - len(self.stash_size_map)))
+        self.stash_size_map[stash_size] += 1
+        self.total += 1
+        self.__stash_size_sum += stash_size
+        if stash_size > self.max_stash_size:
+            self.max_stash_size = stash_size
+
+        self.__window_sum += stash_size
+        if stash_size > self.__window_max:
+            self.__window_max = stash_size
+        if self.total % self.window_size == 0:
+            self.windows.append((self.__window_sum / self.window_size, self.__window_max))
+            self.__window_sum = 0
+            self.__window_max = 0
+
+        if self.checkpoint_filename is not None and self.total % self.checkpoint_interval == 0:
+            self.checkpoint()
+
+    def mean(self):
+        return self.__stash_size_sum / self.total if self.total else 0.0
+
+    def checkpoint(self):
+        write_stash_histogram(self.checkpoint_filename, np.asarray(self.stash_size_map, dtype=np.int64))
+        if self.state_writer is not None:
+            self.state_writer()
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        # resume the counts from a checkpoint in the -1,s / i,s_i format
+        histogram = cls(checkpoint_filename=filename, **kwargs)
+        for stash_size, count in enumerate(read_stash_histogram(filename).tolist()):
+            if count:
+                histogram.stash_size_map.extend([0] * (stash_size + 1 - len(histogram.stash_size_map)))
+                histogram.stash_size_map[stash_size] = count
+                histogram.total += count
+                histogram.__stash_size_sum += stash_size * count
+                histogram.max_stash_size = stash_size
+        return histogram
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["state_writer"] = None
+        return state
+
+    def __str__(self):
+        return f"StashHistogram(accesses={self.total}, max={self.max_stash_size}, mean={self.mean():.2f})"
+
+
+if __name__ == "__main__":
+    stash_size_map = np.zeros(1, dtype=np.int64)
+    stash_size_map = add_stash_sizes(stash_size_map, [0, 1, 1, 2, 4])
+    print(f"Stash size map: {stash_size_map.tolist()}")
+    print(f"Cumulative counts: {cumulative_counts(stash_size_map).tolist()}")
+
+    histogram = StashHistogram(window_size=2)
+    for stash_size in [0, 1, 1, 2, 4]:
+        histogram.record(stash_size)
+    print(histogram)
+    print(f"Windows (mean, max): {list(histogram.windows)}")
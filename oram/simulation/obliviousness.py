@@ -0,0 +1,250 @@
+import argparse
+import sys
+from itertools import islice
+from math import exp, lgamma, log
+from typing import List, NamedTuple
+
+import numpy as np
+
+from oram.simulation.workloads import WORKLOADS, iter_accesses, make_workload
+
+# expected count per cell below which cells are merged: coarser bins keep the chi-squared approximation valid
+MIN_EXPECTED_COUNT = 20
+
+
+class PhysicalTraceRecorder:
+    # Tree engine wrapper recording what the server sees: the leaf of every path read and the
+    # leaf and top level of every path written. Records go to fixed-size buffers; a full buffer is
+    # folded into the leaf, bucket write and consecutive leaf pair counts, and optionally appended
+    # to trace_file as raw little-endian int64 (leaf, top level) pairs, -1 top level for reads,
+    # so memory stays constant however long the run.
+
+    def __init__(self, bucket_tree, chunk_size=65_536, trace_file=None):
+        self.bucket_tree = bucket_tree
+        self.height = bucket_tree.height
+        self.z_max_size = bucket_tree.z_max_size
+        self.num_leaves = pow(2, self.height)
+        self.chunk_size = chunk_size
+        self.trace_file = trace_file
+        self.read_leaves = np.zeros(self.num_leaves, dtype=np.int64)
+        # bucket writes by heap index
+        self.bucket_writes = np.zeros(2 * self.num_leaves - 1, dtype=np.int64)
+        # pairs of consecutive leaves read, on the top pair_bits bits of each leaf
+        self.pair_bits = min(self.height, 6)
+        self.read_pairs = np.zeros((pow(2, self.pair_bits), pow(2, self.pair_bits)), dtype=np.int64)
+        self.__previous_leaf = None
+        self.__records = np.empty((chunk_size, 2), dtype=np.int64)
+        self.__count = 0
+        self.reads = 0
+        self.writes = 0
+
+    def __append(self, leaf_id, top_level):
+        self.__records[self.__count] = leaf_id, top_level
+        self.__count += 1
+        if self.__count == self.chunk_size:
+            self.flush()
+
+    def read_path(self, leaf_id, top_level=0):
+        self.__append(leaf_id, -1)
+        self.reads += 1
+        return self.bucket_tree.read_path(leaf_id, top_level)
+
+    def write_path(self, leaf_id, buckets, top_level=0):
+        self.__append(leaf_id, top_level)
+        self.writes += 1
+        return self.bucket_tree.write_path(leaf_id, buckets, top_level)
+
+    def flush(self):
+        records = self.__records[:self.__count]
+        self.__count = 0
+        if self.trace_file is not None:
+            self.trace_file.write(records.astype("<i8").tobytes())
+        is_read = records[:, 1] == -1
+        leaves = records[is_read, 0]
+        self.read_leaves += np.bincount(leaves, minlength=self.num_leaves)
+        bins = leaves >> (self.height - self.pair_bits)
+        if len(bins):
+            if self.__previous_leaf is not None:
+                bins = np.concatenate([[self.__previous_leaf], bins])
+            np.add.at(self.read_pairs, (bins[:-1], bins[1:]), 1)
+            self.__previous_leaf = bins[-1]
+        written, top_levels = records[~is_read, 0], records[~is_read, 1]
+        positions = self.num_leaves - 1 - written
+        for level in range(self.height + 1):
+            at_level = top_levels <= level
+            indices = (1 << level) - 1 + (positions[at_level] >> (self.height - level))
+            self.bucket_writes += np.bincount(indices, minlength=len(self.bucket_writes))
+
+    def level_writes(self, level):
+        # writes of each bucket of a level, from left to right
+        return self.bucket_writes[(1 << level) - 1:(1 << (level + 1)) - 1]
+
+    def is_on_path(self, block_leaf_id, path_leaf_id, level):
+        return self.bucket_tree.is_on_path(block_leaf_id, path_leaf_id, level)
+
+    def export_arrays(self):
+        return self.bucket_tree.export_arrays()
+
+    def import_arrays(self, block_ids, leaf_ids, payloads):
+        self.bucket_tree.import_arrays(block_ids, leaf_ids, payloads)
+
+
+def chi_squared_survival(statistic, dof):
+    # Pr[X >= statistic] for X chi-squared with dof degrees of freedom: the regularized upper incomplete
+    # gamma function Q(dof / 2, statistic / 2), by its series below a + 1 and its continued fraction above
+    a, x = dof / 2, statistic / 2
+    if x <= 0:
+        return 1.0
+    if x < a + 1:
+        term = total = 1 / a
+        for n in range(1, 10_000):
+            term *= x / (a + n)
+            total += term
+            if term < total * 1e-15:
+                break
+        return max(0.0, 1 - total * exp(-x + a * log(x) - lgamma(a)))
+    b = x + 1 - a
+    c, d = 1 / 1e-300, 1 / b
+    h = d
+    for n in range(1, 10_000):
+        an = -n * (n - a)
+        b += 2
+        d = an * d + b
+        d = 1e-300 if abs(d) < 1e-300 else d
+        c = b + an / c
+        c = 1e-300 if abs(c) < 1e-300 else c
+        d = 1 / d
+        h *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return exp(-x + a * log(x) - lgamma(a)) * h
+
+
+def coarsen(counts, total):
+    # merges neighbouring cells, by powers of two, until each cell expects MIN_EXPECTED_COUNT
+    counts = np.asarray(counts, dtype=np.int64)
+    while len(counts) > 2 and total / len(counts) < MIN_EXPECTED_COUNT:
+        counts = counts.reshape(-1, 2).sum(axis=1)
+    return counts
+
+
+class TestResult(NamedTuple):
+    name: str
+    statistic: float
+    dof: int
+    p_value: float
+
+
+def uniformity_test(name, counts):
+    # chi-squared goodness of fit of the counts against the uniform distribution
+    total = int(np.sum(counts))
+    counts = coarsen(np.ravel(counts), total)
+    expected = total / len(counts)
+    statistic = float(((counts - expected) ** 2).sum() / expected)
+    return TestResult(name, statistic, len(counts) - 1, chi_squared_survival(statistic, len(counts) - 1))
+
+
+def homogeneity_test(name, counts_a, counts_b):
+    # chi-squared test that two sets of counts come from the same distribution
+    counts = np.stack([coarsen(counts_a, min(np.sum(counts_a), np.sum(counts_b))),
+                       coarsen(counts_b, min(np.sum(counts_a), np.sum(counts_b)))]).astype(np.float64)
+    counts = counts[:, counts.sum(axis=0) > 0]
+    expected = counts.sum(axis=1, keepdims=True) * counts.sum(axis=0, keepdims=True) / counts.sum()
+    statistic = float(((counts - expected) ** 2 / expected).sum())
+    dof = counts.shape[1] - 1
+    return TestResult(name, statistic, dof, chi_squared_survival(statistic, dof))
+
+
+def recorder_tests(recorder, label):
+    # the leaves read, the consecutive leaf pairs and the bucket writes of every written level against uniform
+    results = [uniformity_test(f"{label} leaf uniformity", recorder.read_leaves),
+               uniformity_test(f"{label} leaf pair uniformity", recorder.read_pairs)]
+    for level in range(1, recorder.height + 1):
+        if recorder.level_writes(level).sum():
+            results.append(uniformity_test(f"{label} level {level} write uniformity", recorder.level_writes(level)))
+    return results
+
+
+def comparison_tests(recorder_a, recorder_b, label):
+    results = [homogeneity_test(f"{label} leaves", recorder_a.read_leaves, recorder_b.read_leaves)]
+    for level in range(1, recorder_a.height + 1):
+        if recorder_a.level_writes(level).sum() and recorder_b.level_writes(level).sum():
+            results.append(homogeneity_test(f"{label} level {level} writes", recorder_a.level_writes(level),
+                                            recorder_b.level_writes(level)))
+    return results
+
+
+def record_workload(n_block_number, z_bucket_size, workload, access_number, tree_engine="object", seed=0,
+                    batch_size=1, trace_filename=None, **oram_kwargs):
+    # runs a workload on a fresh PathORAM behind a recorder, the recorder flushed
+    from oram.client.path_oram import TREE_ENGINES, PathORAM
+    from oram.client.rng import RandomSource
+
+    trace_file = open(trace_filename, "wb") if trace_filename is not None else None
+    recorder = PhysicalTraceRecorder(TREE_ENGINES[tree_engine](n_block_number, z_bucket_size), trace_file=trace_file)
+    path_oram = PathORAM(n_block_number, z_bucket_size, tree_engine=recorder, rng=RandomSource(seed), **oram_kwargs)
+    # the workload is streamed chunk by chunk, memory stays constant however many accesses
+    accesses = iter_accesses(make_workload(workload, n_block_number, access_number, seed))
+    if batch_size == 1:
+        for block_id, is_write in accesses:
+            path_oram.access(block_id, isWrite=is_write, new_data=block_id)
+    else:
+        while True:
+            batch = list(islice(accesses, batch_size))
+            if not batch:
+                break
+            path_oram.access_many([block_id for block_id, _ in batch], [is_write for _, is_write in batch],
+                                  [block_id for block_id, _ in batch])
+    recorder.flush()
+    if trace_file is not None:
+        trace_file.close()
+    return recorder
+
+
+def check_obliviousness(n_block_number, z_bucket_size, workloads, access_number, tree_engine="object",
+                        reference_engine="object", seed=0, batch_size=1, **oram_kwargs):
+    # every test of the physical traces of two workloads on tree_engine, and of the first workload on
+    # reference_engine, with different seeds for the ORAM randomness
+    first, second = workloads
+    recorder_a = record_workload(n_block_number, z_bucket_size, first, access_number, tree_engine, seed,
+                                 batch_size, **oram_kwargs)
+    recorder_b = record_workload(n_block_number, z_bucket_size, second, access_number, tree_engine, seed + 1,
+                                 batch_size, **oram_kwargs)
+    results : List[TestResult] = []
+    results += recorder_tests(recorder_a, f"{tree_engine} {first}")
+    results += recorder_tests(recorder_b, f"{tree_engine} {second}")
+    results += comparison_tests(recorder_a, recorder_b, f"{first} vs {second}")
+    if reference_engine != tree_engine or batch_size != 1:
+        reference = record_workload(n_block_number, z_bucket_size, first, access_number, reference_engine, seed + 2)
+        results += comparison_tests(recorder_a, reference, f"{tree_engine} vs {reference_engine} reference")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statistical tests of the physical access trace of Path ORAM")
+    parser.add_argument("--blocks", type=int, default=pow(2, 10))
+    parser.add_argument("--bucket-size", type=int, default=4)
+    parser.add_argument("--workloads", nargs=2, default=["sequential", "zipf"],
+                        choices=[name for name in WORKLOADS if name != "trace"])
+    parser.add_argument("--accesses", type=int, default=100_000)
+    parser.add_argument("--engine", default="flat")
+    parser.add_argument("--reference-engine", default="object")
+    parser.add_argument("--eviction", default="greedy")
+    parser.add_argument("--eviction-policy", default=None)
+    parser.add_argument("--batch-size", type=int, default=1, help="run the accesses through access_many")
+    parser.add_argument("--alpha", type=float, default=0.001, help="family-wise significance level")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = check_obliviousness(args.blocks, args.bucket_size, args.workloads, args.accesses, args.engine,
+                                  args.reference_engine, args.seed, args.batch_size, eviction=args.eviction,
+                                  eviction_policy=args.eviction_policy)
+    # Bonferroni correction: the run fails with probability alpha when every trace is oblivious
+    threshold = args.alpha / len(results)
+    failed = [result for result in results if result.p_value < threshold]
+    width = max(len(result.name) for result in results)
+    for result in results:
+        print(f"{result.name:<{width}} chi2={result.statistic:10.1f} dof={result.dof:5} p={result.p_value:.4f}"
+              f"{'  FAIL' if result in failed else ''}")
+    print(f"{len(results) - len(failed)} of {len(results)} tests passed at p >= {threshold:.2e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,119 @@
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, NamedTuple
+
+import numpy as np
+from tqdm import tqdm
+
+from oram.client.path_oram import PathORAM
+from oram.client.rng import RandomSource
+from oram.simulation.histogram import add_stash_sizes, write_stash_histogram
+from oram.simulation.workloads import WORKLOADS, iter_accesses
+
+INDEX_FILENAME = "index.csv"
+
+
+# every workload that needs no parameter beyond its seed
+ACCESS_PATTERNS = {name: workload for name, workload in WORKLOADS.items() if name != "trace"}
+
+
+class SweepConfig(NamedTuple):
+    n_block_number: int
+    z_bucket_size: int
+    access_pattern: str
+    seed: int
+
+    def output_filename(self):
+        return f"stash_N{self.n_block_number}_Z{self.z_bucket_size}_{self.access_pattern}_seed{self.seed}.txt"
+
+
+def build_grid(n_block_numbers, z_bucket_sizes, access_patterns, seeds):
+    for access_pattern in access_patterns:
+        if access_pattern not in ACCESS_PATTERNS:
+            raise ValueError(f"Unknown access pattern {access_pattern}, expected one of {list(ACCESS_PATTERNS)}")
+    return [SweepConfig(*values) for values in itertools.product(n_block_numbers, z_bucket_sizes, access_patterns, seeds)]
+
+
+def run_configuration(config, warmup_access_number, simulation_access_number, output_dir, tree_engine="object"):
+    # every configuration draws all of its randomness from its own seed, whichever worker runs it
+    pattern_rng = np.random.default_rng(config.seed)
+    access_pattern = ACCESS_PATTERNS[config.access_pattern]
+    path_oram = PathORAM(config.n_block_number, config.z_bucket_size, tree_engine=tree_engine,
+                         rng=RandomSource(config.seed))
+
+    # the warm-up phase writes the blocks, the simulation phase only reads them
+    warmup = access_pattern(config.n_block_number, warmup_access_number, pattern_rng, write_ratio=1.0)
+    path_oram.replay(warmup)
+
+    stash_sizes : List[int] = []
+    stash_size_map = np.zeros(1, dtype=np.int64)
+    simulation = access_pattern(config.n_block_number, simulation_access_number, pattern_rng)
+    for block_id, _ in iter_accesses(simulation):
+        path_oram.access(block_id)
+        stash_sizes.append(len(path_oram.stash))
+        if len(stash_sizes) == 100_000:
+            stash_size_map = add_stash_sizes(stash_size_map, stash_sizes)
+            stash_sizes = []
+    stash_size_map = add_stash_sizes(stash_size_map, stash_sizes)
+
+    write_stash_histogram(os.path.join(output_dir, config.output_filename()), stash_size_map)
+    return config
+
+
+def read_summary(filename):
+    # total accesses and max stash size of a histogram file in the -1,s / i,s_i format
+    with open(filename) as f:
+        lines = [line.split(",") for line in f.read().split()]
+    return int(lines[0][1]), int(lines[-1][0])
+
+
+def write_index(grid, output_dir):
+    temp_filename = os.path.join(output_dir, f"{INDEX_FILENAME}.tmp")
+    with open(temp_filename, "w") as f:
+        f.write("n_block_number,z_bucket_size,access_pattern,seed,accesses,max_stash_size,filename\n")
+        for config in grid:
+            filename = os.path.join(output_dir, config.output_filename())
+            if not os.path.exists(filename):
+                continue
+            accesses, max_stash_size = read_summary(filename)
+            f.write(f"{','.join(map(str, config))},{accesses},{max_stash_size},{config.output_filename()}\n")
+    os.replace(temp_filename, os.path.join(output_dir, INDEX_FILENAME))
+
+
+def run_sweep(grid, warmup_access_number, simulation_access_number, output_dir,
+              workers=None, tree_engine="object"):
+    os.makedirs(output_dir, exist_ok=True)
+    # configurations with a histogram file already finished, so an interrupted sweep resumes
+    pending = [config for config in grid if not os.path.exists(os.path.join(output_dir, config.output_filename()))]
+    print(f"{len(grid) - len(pending)} of {len(grid)} configurations already done")
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [
+            executor.submit(run_configuration, config, warmup_access_number, simulation_access_number,
+                            output_dir, tree_engine)
+            for config in pending
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Sweeping", unit="config"):
+            future.result()
+            write_index(grid, output_dir)
+    write_index(grid, output_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Path ORAM simulations over a grid of configurations")
+    parser.add_argument("--blocks", type=int, nargs="+", default=[pow(2, 12)])
+    parser.add_argument("--bucket-sizes", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--patterns", nargs="+", default=["sequential"], choices=list(ACCESS_PATTERNS))
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--warmup", type=int, default=50_000)
+    parser.add_argument("--accesses", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", default="object")
+    parser.add_argument("--output-dir", default="sweep")
+    args = parser.parse_args()
+
+    grid = build_grid(args.blocks, args.bucket_sizes, args.patterns, args.seeds)
+    run_sweep(grid, args.warmup, args.accesses, args.output_dir, args.workers, args.engine)
+    print(f"Sweep complete. Index written to {os.path.join(args.output_dir, INDEX_FILENAME)}.")
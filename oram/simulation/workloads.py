@@ -0,0 +1,150 @@
+import argparse
+import os
+from typing import Iterator, Tuple
+
+import numpy as np
+
+# A workload is a generator of chunks: (block_ids, is_write) pairs of NumPy arrays of at most chunk_size
+# accesses, drawn lazily so a run of any length holds one chunk at a time. Every generator takes the
+# number of blocks, the number of accesses, a numpy.random.Generator and the fraction of writes.
+CHUNK_SIZE = pow(2, 16)
+
+# trace file: magic, then one little-endian uint32 per access holding block_id << 1 | is_write
+TRACE_MAGIC = b"ORAMTRC1"
+TRACE_DTYPE = np.dtype("<u4")
+
+Chunk = Tuple[np.ndarray, np.ndarray]
+
+
+def chunk_bounds(access_number, chunk_size):
+    for first in range(0, access_number, chunk_size):
+        yield first, min(first + chunk_size, access_number)
+
+
+def draw_writes(rng, size, write_ratio):
+    if write_ratio <= 0:
+        return np.zeros(size, dtype=bool)
+    if write_ratio >= 1:
+        return np.ones(size, dtype=bool)
+    return rng.random(size) < write_ratio
+
+
+def sequential_workload(n_block_number, access_number, rng, write_ratio=0.0, chunk_size=CHUNK_SIZE):
+    # the scan of the original driver: block_id = i % N
+    for first, last in chunk_bounds(access_number, chunk_size):
+        yield np.arange(first, last, dtype=np.int64) % n_block_number, draw_writes(rng, last - first, write_ratio)
+
+
+def uniform_workload(n_block_number, access_number, rng, write_ratio=0.0, chunk_size=CHUNK_SIZE):
+    for first, last in chunk_bounds(access_number, chunk_size):
+        yield rng.integers(0, n_block_number, last - first), draw_writes(rng, last - first, write_ratio)
+
+
+def zipf_workload(n_block_number, access_number, rng, write_ratio=0.0, chunk_size=CHUNK_SIZE, skew=0.99):
+    # bounded Zipf: the block of rank k is accessed with probability proportional to 1 / k^skew,
+    # the ranks are given to the blocks in a random order so the hot blocks are spread over the ids
+    cdf = np.cumsum(1.0 / np.power(np.arange(1, n_block_number + 1, dtype=np.float64), skew))
+    cdf /= cdf[-1]
+    blocks_by_rank = rng.permutation(n_block_number)
+    for first, last in chunk_bounds(access_number, chunk_size):
+        ranks = np.minimum(np.searchsorted(cdf, rng.random(last - first), side="right"), n_block_number - 1)
+        yield blocks_by_rank[ranks], draw_writes(rng, last - first, write_ratio)
+
+
+def hot_cold_workload(n_block_number, access_number, rng, write_ratio=0.0, chunk_size=CHUNK_SIZE,
+                      hot_fraction=0.1, hot_probability=0.9):
+    # hot_probability of the accesses go to the hot set, the first hot_fraction of the blocks
+    hot_blocks = max(1, int(n_block_number * hot_fraction))
+    for first, last in chunk_bounds(access_number, chunk_size):
+        size = last - first
+        hot = rng.random(size) < hot_probability
+        block_ids = np.where(hot, rng.integers(0, hot_blocks, size),
+                             rng.integers(min(hot_blocks, n_block_number - 1), n_block_number, size))
+        yield block_ids, draw_writes(rng, size, write_ratio)
+
+
+def trace_workload(n_block_number, access_number, rng, write_ratio=None, chunk_size=CHUNK_SIZE, filename=None):
+    # replays a trace file, from a memory map so only the current chunk is read; access_number None
+    # replays the whole trace. The reads and writes are the recorded ones, write_ratio is ignored
+    if filename is None:
+        raise ValueError("The trace workload needs a trace filename")
+    records = read_trace(filename)
+    if access_number is None:
+        access_number = len(records)
+    if access_number > len(records):
+        raise ValueError(f"Trace {filename} holds {len(records)} accesses, {access_number} requested")
+    for first, last in chunk_bounds(access_number, chunk_size):
+        chunk = np.asarray(records[first:last], dtype=np.int64)
+        block_ids = chunk >> 1
+        if block_ids.size and block_ids.max() >= n_block_number:
+            raise ValueError(f"Trace {filename} accesses block {block_ids.max()}, the ORAM has {n_block_number}")
+        yield block_ids, (chunk & 1).astype(bool)
+
+
+WORKLOADS = {
+    "sequential": sequential_workload,
+    "uniform": uniform_workload,
+    "zipf": zipf_workload,
+    "hot_cold": hot_cold_workload,
+    "trace": trace_workload,
+}
+
+
+def make_workload(name, n_block_number, access_number, seed=0, **params) -> Iterator[Chunk]:
+    if name not in WORKLOADS:
+        raise ValueError(f"Unknown workload {name}, expected one of {list(WORKLOADS)}")
+    return WORKLOADS[name](n_block_number, access_number, np.random.default_rng(seed), **params)
+
+
+def iter_accesses(chunks):
+    # (block_id, is_write) pairs of plain Python values
+    for block_ids, is_write in chunks:
+        yield from zip(block_ids.tolist(), is_write.tolist())
+
+
+def skip_accesses(chunks, count):
+    # the workload without its first count accesses, to resume an interrupted run
+    for block_ids, is_write in chunks:
+        if count >= len(block_ids):
+            count -= len(block_ids)
+            continue
+        yield block_ids[count:], is_write[count:]
+        count = 0
+
+
+def write_trace(filename, chunks):
+    # streams the chunks to a trace file, written atomically
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(TRACE_MAGIC)
+        for block_ids, is_write in chunks:
+            if block_ids.size and block_ids.max() >= pow(2, 31):
+                raise ValueError("Trace files hold block ids below 2^31")
+            f.write(((block_ids.astype(TRACE_DTYPE) << 1) | is_write.astype(TRACE_DTYPE)).tobytes())
+    os.replace(temp_filename, filename)
+
+
+def read_trace(filename):
+    with open(filename, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{filename} is not an ORAM trace")
+    if os.path.getsize(filename) == len(TRACE_MAGIC):
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    return np.memmap(filename, dtype=TRACE_DTYPE, mode="r", offset=len(TRACE_MAGIC))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a workload to a binary trace file")
+    parser.add_argument("workload", choices=[name for name in WORKLOADS if name != "trace"])
+    parser.add_argument("output")
+    parser.add_argument("--blocks", type=int, default=pow(2, 12))
+    parser.add_argument("--accesses", type=int, default=1_000_000)
+    parser.add_argument("--write-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=0.99, help="Zipf skew")
+    args = parser.parse_args()
+
+    params = {"skew": args.skew} if args.workload == "zipf" else {}
+    write_trace(args.output, make_workload(args.workload, args.blocks, args.accesses, args.seed,
+                                           write_ratio=args.write_ratio, **params))
+    print(f"{args.accesses} accesses written to {args.output} ({os.path.getsize(args.output)} bytes)")
@@ -0,0 +1,45 @@
+from oram.client.position_map import PositionMap
+from oram.simulation.obliviousness import check_obliviousness, chi_squared_survival, uniformity_test
+
+ALPHA = 0.001
+
+
+class StaticPositionMap(PositionMap):
+    # never remaps a block, so repeated accesses to a block read the same path
+
+    def remap(self, block_id):
+        return self.get_leaf_index(block_id), self.get_leaf_index(block_id)
+
+
+def failed_tests(results):
+    return [result.name for result in results if result.p_value < ALPHA / len(results)]
+
+
+def test_chi_squared_survival():
+    # chi-squared quantiles of the standard tables
+    assert abs(chi_squared_survival(3.841, 1) - 0.05) < 1e-3
+    assert abs(chi_squared_survival(23.209, 10) - 0.01) < 1e-4
+    assert abs(chi_squared_survival(124.342, 100) - 0.05) < 1e-3
+    assert chi_squared_survival(0, 5) == 1.0
+
+
+def test_uniformity_test_rejects_skewed_counts():
+    assert uniformity_test("uniform", [1_000] * 64).p_value > 0.5
+    assert uniformity_test("skewed", [2_000] + [1_000] * 63).p_value < 1e-6
+
+
+def test_path_oram_trace_is_oblivious():
+    results = check_obliviousness(pow(2, 8), 4, ("sequential", "zipf"), 20_000, tree_engine="flat", seed=0)
+    assert not failed_tests(results)
+
+
+def test_batched_trace_is_oblivious():
+    results = check_obliviousness(pow(2, 8), 4, ("sequential", "zipf"), 20_000, tree_engine="flat", seed=0,
+                                  batch_size=8)
+    assert not failed_tests(results)
+
+
+def test_static_positions_are_detected():
+    results = check_obliviousness(pow(2, 8), 4, ("sequential", "zipf"), 20_000, tree_engine="flat", seed=0,
+                                  position_map=StaticPositionMap(pow(2, 8)))
+    assert failed_tests(results)
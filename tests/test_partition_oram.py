@@ -0,0 +1,43 @@
+import pytest
+
+from oram.client.partition_oram import PartitionORAM, load_bound
+from oram.client.rng import RandomSource
+
+
+@pytest.fixture
+def partition_oram():
+    partition_oram = PartitionORAM(pow(2, 9), 4, 4, accesses_per_round=8, rng=RandomSource(1))
+    yield partition_oram
+    partition_oram.close()
+
+
+def test_load_bound():
+    assert load_bound(10, 1, 40) == 10
+    assert 16 < load_bound(64, 4, 40) < 64
+    assert load_bound(64, 4, 20) < load_bound(64, 4, 40)
+
+
+def test_reads_return_the_last_write(partition_oram):
+    rng = RandomSource(2)
+    expected = {}
+    for batch in range(100):
+        # a few hot blocks, so batches repeat blocks
+        block_ids = [rng.randbelow(512) if rng.randbelow(4) else rng.randbelow(8) for _ in range(1 + rng.randbelow(40))]
+        ops = [bool(rng.randbelow(2)) for _ in block_ids]
+        new_data = [(batch, i) for i in range(len(block_ids))]
+        for block_id, isWrite, data, result in zip(block_ids, ops, new_data,
+                                                   partition_oram.access_many(block_ids, ops, new_data)):
+            assert result == expected.get(block_id)
+            if isWrite:
+                expected[block_id] = data
+    assert [partition_oram.access(block_id) for block_id in range(512)] == [expected.get(i) for i in range(512)]
+
+
+def test_rounds_only_depend_on_the_batch_size(partition_oram):
+    rounds = set()
+    for batch in range(20):
+        for block_ids in ([7] * 64, list(range(64 * batch % 448, 64 * batch % 448 + 64))):
+            before = partition_oram.rounds
+            partition_oram.access_many(block_ids, [True] * 64, block_ids)
+            rounds.add(partition_oram.rounds - before)
+    assert rounds == {2 * partition_oram.rounds_for(64)}
@@ -0,0 +1,89 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from oram.client.path_oram import PathORAM
+from oram.client.remote_bucket_tree import RemoteBucketTree, RemoteError
+from oram.client.rng import RandomSource
+from oram.server.block import Block
+from oram.server.flat_bucket_tree import FlatBucketTree
+from oram.server.remote_server import (
+    decode_arrays, decode_blocks, encode_arrays, encode_blocks, start_server_process,
+)
+
+
+@pytest.fixture(scope="module")
+def address():
+    process, bound_address = start_server_process(pow(2, 6), 4)
+    yield bound_address
+    process.terminate()
+    process.join()
+
+
+def test_blocks_round_trip():
+    blocks = [Block(is_dummy=False, data=b"\x00payload", block_id=3, leaf_id=5),
+              Block(is_dummy=False, data=None, block_id=4, leaf_id=6),
+              Block(is_dummy=False, data=b"", block_id=7, leaf_id=0)]
+    decoded, offset = decode_blocks(b"".join(encode_blocks(blocks, [])), 0)
+    assert [(block.block_id, block.leaf_id, block.data) for block in decoded] == [
+        (3, 5, b"\x00payload"), (4, 6, None), (7, 0, b"")]
+
+
+def test_payloads_are_never_unpickled():
+    # a pickled object is sent and received as its bytes, and other objects are refused
+    payload = pickle.dumps(object())
+    decoded, _ = decode_blocks(b"".join(encode_blocks([Block(is_dummy=False, data=payload, block_id=1, leaf_id=1)],
+                                                      [])), 0)
+    assert decoded[0].data == payload
+    with pytest.raises(TypeError):
+        encode_blocks([Block(is_dummy=False, data=1, block_id=1, leaf_id=1)], [])
+
+
+def test_arrays_round_trip():
+    tree = FlatBucketTree(pow(2, 4), 4)
+    tree.write_path(3, [[Block(is_dummy=False, data=bytes([level]), block_id=level, leaf_id=3)]
+                        for level in range(tree.height + 1)])
+    block_ids, leaf_ids, payloads = tree.export_arrays()
+    decoded = decode_arrays(bytearray(b"".join(encode_arrays(block_ids, leaf_ids, payloads, []))))
+    assert np.array_equal(decoded[0], block_ids) and np.array_equal(decoded[1], leaf_ids)
+    assert decoded[0].flags.writeable
+    assert decoded[2][block_ids != -1].tolist() == payloads[block_ids != -1].tolist()
+
+
+def test_remote_tree_matches_local_tree(address):
+    remote_tree = RemoteBucketTree(address)
+    path_oram = PathORAM(pow(2, 6), 4, tree_engine=remote_tree, rng=RandomSource(0))
+    for i in range(500):
+        path_oram.access(i % 64, isWrite=True, new_data=i.to_bytes(2, "little"))
+    last_writes = {i % 64: i.to_bytes(2, "little") for i in range(500)}
+    assert [path_oram.access(i).data for i in range(64)] == [last_writes[i] for i in range(64)]
+
+    restored = PathORAM(pow(2, 6), 4, tree_engine="flat")
+    restored.bucket_tree.import_arrays(*remote_tree.export_arrays())
+    remote_tree.import_arrays(*restored.bucket_tree.export_arrays())
+    assert np.array_equal(remote_tree.export_arrays()[0], restored.bucket_tree.export_arrays()[0])
+    with pytest.raises(RemoteError):
+        remote_tree.write_path(0, [[]], top_level=0)
+        remote_tree.flush()
+    remote_tree.close()
+
+
+def test_access_many_uses_one_request_each_way():
+    # a server of its own, the module one holds the blocks of the other tests
+    process, address = start_server_process(pow(2, 6), 4)
+    remote_tree = RemoteBucketTree(address)
+    path_oram = PathORAM(pow(2, 6), 4, tree_engine=remote_tree, rng=RandomSource(1))
+    rng = RandomSource(2)
+    last_writes = {}
+    for i in range(0, 400, 8):
+        block_ids = [rng.randbelow(64) for _ in range(8)]
+        requests = remote_tree.network_stats()["requests"]
+        path_oram.access_many(block_ids, [True] * 8, [bytes([i + j & 0xFF]) for j in range(8)])
+        assert remote_tree.network_stats()["requests"] - requests == 2
+        last_writes.update((block_id, bytes([i + j & 0xFF])) for j, block_id in enumerate(block_ids))
+    read_blocks = path_oram.access_many(list(last_writes))
+    assert [block.data for block in read_blocks] == list(last_writes.values())
+    remote_tree.close()
+    process.terminate()
+    process.join()
@@ -0,0 +1,128 @@
+import pytest
+
+from oram.client.instrumentation import AccessInstrumentation
+from oram.client.path_oram import TREE_ENGINES, PathORAM
+from oram.server.engines import PAYLOAD_ENGINES
+from oram.client.rng import RandomSource
+from oram.client.stash import Stash
+from oram.server.block import Block
+
+HEIGHT = 6
+Z = 4
+
+
+def filled_stash(block_number, seed):
+    rng = RandomSource(seed)
+    stash = Stash(HEIGHT, rng=RandomSource(seed + 1))
+    for block_id in range(block_number):
+        stash.add_block(Block(is_dummy=False, data=block_id, block_id=block_id, leaf_id=rng.leaf(HEIGHT)))
+    return stash
+
+
+@pytest.mark.parametrize("eviction", [Stash.evict_greedy, Stash.evict_random_sample])
+@pytest.mark.parametrize("seed", range(5))
+def test_eviction_fills_the_path_from_the_leaf(eviction, seed):
+    stash = filled_stash(60, seed)
+    path_leaf_id = RandomSource(seed + 2).leaf(HEIGHT)
+    buckets = eviction(stash, path_leaf_id, Z, top_level=1)
+    assert len(buckets) == HEIGHT
+    evicted = [block.block_id for bucket in buckets for block in bucket]
+    assert len(evicted) == len(set(evicted))
+    assert len(evicted) + len(stash) == 60
+    for level, bucket in zip(range(HEIGHT, 0, -1), buckets):
+        assert len(bucket) <= Z
+        assert all(stash.common_depth(block.leaf_id, path_leaf_id) >= level for block in bucket)
+        if len(bucket) < Z:
+            # a bucket with room left no block in the stash that could go there
+            assert all(stash.common_depth(stash.get(block_id).leaf_id, path_leaf_id) < level for block_id in stash)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_evict_many_on_one_path_matches_greedy(seed):
+    path_leaf_id = RandomSource(seed + 2).leaf(HEIGHT)
+    greedy = Stash.evict_greedy(filled_stash(60, seed), path_leaf_id, Z, top_level=1)
+    many = filled_stash(60, seed).evict_many({path_leaf_id}, Z, top_level=1)
+    for level, bucket in zip(range(HEIGHT, 0, -1), greedy):
+        assert len(many.get((level, path_leaf_id >> (HEIGHT - level)), [])) == len(bucket)
+
+
+@pytest.mark.parametrize("eviction", [Stash.evict_many, Stash.evict_many_random_sample])
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_eviction_fills_the_paths(eviction, seed):
+    rng = RandomSource(seed + 2)
+    path_leaf_ids = {rng.leaf(HEIGHT) for _ in range(4)}
+    stash = filled_stash(80, seed)
+    buckets = eviction(stash, path_leaf_ids, Z, top_level=1)
+    evicted = [block.block_id for bucket in buckets.values() for block in bucket]
+    assert len(evicted) == len(set(evicted))
+    assert len(evicted) + len(stash) == 80
+    for (level, prefix), bucket in buckets.items():
+        assert len(bucket) <= Z
+        assert any(leaf_id >> (HEIGHT - level) == prefix for leaf_id in path_leaf_ids)
+        assert all(block.leaf_id >> (HEIGHT - level) == prefix for block in bucket)
+        if len(bucket) < Z:
+            assert all(stash.get(block_id).leaf_id >> (HEIGHT - level) != prefix for block_id in stash)
+
+
+def test_greedy_and_random_sample_give_the_same_stash_sizes():
+    # the number of blocks written to each bucket only depends on the leaves of the blocks,
+    # so with the same position map draws both evictions leave identical stash sizes
+    stash_sizes = {}
+    for eviction in ("random", "greedy"):
+        path_oram = PathORAM(pow(2, 8), Z, eviction=eviction, rng=RandomSource(1))
+        # keep the sampling draws out of the source used by the position map
+        path_oram.stash.rng = RandomSource(2)
+        stash_sizes[eviction] = []
+        for i in range(5_000):
+            path_oram.access(i % path_oram.n_block_number, isWrite=True, new_data=i)
+            stash_sizes[eviction].append(len(path_oram.stash))
+    assert stash_sizes["random"] == stash_sizes["greedy"]
+
+
+def test_access_many_evicts_and_records_as_configured():
+    stash_sizes = {}
+    for eviction in ("random", "greedy"):
+        path_oram = PathORAM(pow(2, 8), Z, eviction=eviction, rng=RandomSource(1))
+        path_oram.stash.rng = RandomSource(2)
+        path_oram.instrumentation = AccessInstrumentation(path_oram.l_tree_height)
+        stash_sizes[eviction] = []
+        for i in range(0, 4_000, 8):
+            block_ids = [j % path_oram.n_block_number for j in range(i, i + 8)]
+            path_oram.access_many(block_ids, [True] * 8, block_ids)
+            stash_sizes[eviction].append(len(path_oram.stash))
+        records = path_oram.instrumentation.buffer.ordered()
+        assert len(records) == 500 and path_oram.instrumentation.accesses == 4_000
+        assert (records["batch_size"] == 8).all() and (records["leaf_id"] == -1).all()
+        assert (records["stash_after_access"] == stash_sizes[eviction]).all()
+        assert (records["stash_after_level"][:, 1] == records["stash_after_access"]).all()
+    assert stash_sizes["random"] == stash_sizes["greedy"]
+
+
+@pytest.mark.parametrize("tree_engine, payload_size", [*((name, None) for name in TREE_ENGINES),
+                                                       *((name, 8) for name in PAYLOAD_ENGINES)])
+def test_reads_return_the_last_write(tree_engine, payload_size):
+    path_oram = PathORAM(pow(2, 7), Z, tree_engine=tree_engine, rng=RandomSource(3), payload_size=payload_size)
+    rng = RandomSource(4)
+    expected = {}
+    for i in range(2_000):
+        block_id = rng.randbelow(path_oram.n_block_number)
+        if rng.randbelow(2):
+            # bytes, which every engine stores
+            path_oram.access(block_id, isWrite=True, new_data=i.to_bytes(2, "little"))
+            expected[block_id] = i.to_bytes(2, "little")
+        else:
+            block = path_oram.access(block_id)
+            assert (block.data if block is not None else None) == expected.get(block_id)
+    # Z = 4 keeps the stash far below this bound at this size
+    assert len(path_oram.stash) < 40
+
+
+def test_payload_slots_keep_blocks_without_data():
+    path_oram = PathORAM(pow(2, 7), Z, rng=RandomSource(5), payload_size=4)
+    for block_id in range(path_oram.n_block_number):
+        path_oram.access(block_id, isWrite=True, new_data=None if block_id % 2 else block_id.to_bytes(4, "little"))
+    for block_id in range(path_oram.n_block_number):
+        block = path_oram.access(block_id)
+        assert block.data == (None if block_id % 2 else block_id.to_bytes(4, "little"))
+    with pytest.raises(ValueError):
+        PathORAM(pow(2, 7), Z, tree_engine="flat", payload_size=4)